@@ -0,0 +1,23 @@
+-- Pulse ERP - Ledger Period Checkpoints
+-- Migration: 003_ledger_checkpoints
+-- Description: Per-account closing balances per day so historical trial
+--              balances don't have to aggregate the full ledger
+
+-- ============================================
+-- LEDGER CHECKPOINTS
+-- ============================================
+-- One row per account per closed day. Totals are cumulative: they cover
+-- every ledger entry with created_at before period_date + 1 day (UTC).
+CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+    account VARCHAR(64) NOT NULL,
+    period_date DATE NOT NULL,
+    total_debit NUMERIC(16,2) NOT NULL DEFAULT 0 CHECK (total_debit >= 0),
+    total_credit NUMERIC(16,2) NOT NULL DEFAULT 0 CHECK (total_credit >= 0),
+    entry_count BIGINT NOT NULL DEFAULT 0 CHECK (entry_count >= 0),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (account, period_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ledger_checkpoints_period ON ledger_checkpoints(period_date DESC);
+
+COMMENT ON TABLE ledger_checkpoints IS 'Cumulative per-account ledger totals at each closed day';
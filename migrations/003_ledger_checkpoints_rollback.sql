@@ -0,0 +1,6 @@
+-- Pulse ERP - Rollback Ledger Period Checkpoints
+-- Migration: 003_ledger_checkpoints_rollback
+-- Description: Drops the ledger_checkpoints table created in 003_ledger_checkpoints.sql
+
+DROP INDEX IF EXISTS idx_ledger_checkpoints_period;
+DROP TABLE IF EXISTS ledger_checkpoints CASCADE;
@@ -0,0 +1,60 @@
+-- Pulse ERP - Sequential Invoice Numbers
+-- Migration: 004_invoice_numbers
+-- Description: Gap-free invoice numbering backed by per-worker number blocks
+
+-- ============================================
+-- INVOICE NUMBER COLUMN
+-- ============================================
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS invoice_number BIGINT;
+
+-- Number existing invoices in issue order
+WITH numbered AS (
+    SELECT id, ROW_NUMBER() OVER (ORDER BY issued_at, id) AS n
+    FROM invoices
+    WHERE invoice_number IS NULL
+)
+UPDATE invoices i
+SET invoice_number = numbered.n + COALESCE((SELECT MAX(invoice_number) FROM invoices), 0)
+FROM numbered
+WHERE i.id = numbered.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_invoice_number ON invoices(invoice_number);
+
+-- ============================================
+-- INVOICE NUMBER SEQUENCE (single row, touched once per block)
+-- ============================================
+CREATE TABLE IF NOT EXISTS invoice_number_sequence (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    next_number BIGINT NOT NULL DEFAULT 1 CHECK (next_number >= 1)
+);
+
+INSERT INTO invoice_number_sequence (id, next_number)
+VALUES (1, COALESCE((SELECT MAX(invoice_number) FROM invoices), 0) + 1)
+ON CONFLICT (id) DO NOTHING;
+
+-- ============================================
+-- INVOICE NUMBER BLOCKS (ranges leased to billing workers)
+-- ============================================
+CREATE TABLE IF NOT EXISTS invoice_number_blocks (
+    start_number BIGINT PRIMARY KEY,
+    end_number BIGINT NOT NULL,
+    worker_id VARCHAR(128) NOT NULL,
+    allocated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT valid_block_range CHECK (end_number >= start_number)
+);
+
+CREATE INDEX IF NOT EXISTS idx_invoice_number_blocks_worker ON invoice_number_blocks(worker_id);
+CREATE INDEX IF NOT EXISTS idx_invoice_number_blocks_heartbeat ON invoice_number_blocks(heartbeat_at);
+
+-- ============================================
+-- INVOICE NUMBER POOL (reclaimed numbers, reissued first)
+-- ============================================
+CREATE TABLE IF NOT EXISTS invoice_number_pool (
+    number BIGINT PRIMARY KEY,
+    released_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE invoice_number_sequence IS 'Next unallocated invoice number';
+COMMENT ON TABLE invoice_number_blocks IS 'Invoice number ranges leased to billing workers';
+COMMENT ON TABLE invoice_number_pool IS 'Unused invoice numbers reclaimed from released or stale blocks';
@@ -0,0 +1,10 @@
+-- Pulse ERP - Rollback Sequential Invoice Numbers
+-- Migration: 004_invoice_numbers_rollback
+-- Description: Drops invoice numbering tables and column created in 004_invoice_numbers.sql
+
+DROP TABLE IF EXISTS invoice_number_pool CASCADE;
+DROP TABLE IF EXISTS invoice_number_blocks CASCADE;
+DROP TABLE IF EXISTS invoice_number_sequence CASCADE;
+
+DROP INDEX IF EXISTS idx_invoices_invoice_number;
+ALTER TABLE invoices DROP COLUMN IF EXISTS invoice_number;
@@ -0,0 +1,22 @@
+-- Pulse ERP - Idempotent Auto-Invoicing
+-- Migration: 005_invoice_source_order
+-- Description: Unique source order key so each order is auto-invoiced at most once
+
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS source_order_id UUID;
+
+-- Treat the earliest existing invoice of each order as its auto-generated invoice
+UPDATE invoices i
+SET source_order_id = first_invoice.order_id
+FROM (
+    SELECT DISTINCT ON (order_id) id, order_id
+    FROM invoices
+    ORDER BY order_id, issued_at, id
+) AS first_invoice
+WHERE i.id = first_invoice.id
+  AND NOT EXISTS (
+      SELECT 1 FROM invoices existing WHERE existing.source_order_id = first_invoice.order_id
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_source_order ON invoices(source_order_id);
+
+COMMENT ON COLUMN invoices.source_order_id IS 'Order that auto-generated this invoice (NULL for manual invoices)';
@@ -0,0 +1,6 @@
+-- Pulse ERP - Rollback Idempotent Auto-Invoicing
+-- Migration: 005_invoice_source_order_rollback
+-- Description: Drops the source order key created in 005_invoice_source_order.sql
+
+DROP INDEX IF EXISTS idx_invoices_source_order;
+ALTER TABLE invoices DROP COLUMN IF EXISTS source_order_id;
@@ -0,0 +1,21 @@
+-- Pulse ERP - Incremental Overdue Sweeps
+-- Migration: 006_overdue_sweep_state
+-- Description: Persisted progress of the overdue invoice sweeper, so each run
+--              only scans newly past-due dates and newly created invoices
+
+-- ============================================
+-- OVERDUE SWEEP STATE (single row)
+-- ============================================
+-- Issued invoices due before due_before have been swept, as far as they
+-- existed when the run that set created_before started.
+CREATE TABLE IF NOT EXISTS overdue_sweep_state (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    due_before DATE NOT NULL,
+    created_before TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Back-fill pass: invoices created since the last sweep
+CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices(created_at);
+
+COMMENT ON TABLE overdue_sweep_state IS 'Due date and creation time the overdue sweeper has covered';
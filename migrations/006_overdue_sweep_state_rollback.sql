@@ -0,0 +1,6 @@
+-- Pulse ERP - Rollback Incremental Overdue Sweeps
+-- Migration: 006_overdue_sweep_state_rollback
+-- Description: Drops the sweep state created in 006_overdue_sweep_state.sql
+
+DROP INDEX IF EXISTS idx_invoices_created_at;
+DROP TABLE IF EXISTS overdue_sweep_state CASCADE;
@@ -23,6 +23,22 @@ class Settings(BaseSettings):
     # Billing settings
     default_payment_terms_days: int = 30
 
+    # Overdue invoice sweeper
+    overdue_sweep_interval_seconds: int = 300
+    overdue_sweep_batch_size: int = 500
+    # Invoices whose transaction was still open when a sweep started
+    overdue_sweep_backfill_grace_seconds: int = 600
+
+    # Ledger period checkpoints
+    ledger_checkpoint_interval_seconds: int = 3600
+    # Entries stamped before midnight whose transaction commits after it
+    ledger_checkpoint_grace_seconds: int = 3600
+
+    # Invoice numbering
+    invoice_number_block_size: int = 100
+    invoice_number_lease_seconds: int = 600
+    invoice_number_reconcile_interval_seconds: int = 60
+
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=False)
 
     @property
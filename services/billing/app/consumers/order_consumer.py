@@ -3,8 +3,12 @@ import asyncio
 import json
 import logging
 from datetime import datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy.dialects.postgresql import insert
 
 from app.database import async_session_maker
+from app.invoice_numbers import invoice_numbers
 from app.models import Invoice, LedgerEntry
 from app.nats_client import nats_client
 from app.config import settings
@@ -13,13 +17,17 @@ logger = logging.getLogger(__name__)
 
 
 class OrderEventConsumer:
-    """Consumer for order_created events to auto-generate invoices"""
+    """Consumer for order_created events to auto-generate invoices
+
+    Idempotency is enforced by the unique invoices.source_order_id key, so any
+    number of billing replicas can share the durable consumer and redelivered
+    messages cost a single INSERT ... ON CONFLICT DO NOTHING.
+    """
 
     def __init__(self):
         self.consumer_name = "billing-order-consumer"
         self.stream_name = "orders"
         self.subject = "orders.order_created"
-        self.processed_orders = set()  # Idempotency tracking
 
     async def start(self):
         """Start consuming order_created events"""
@@ -56,17 +64,17 @@ class OrderEventConsumer:
         """Handle a single order_created message"""
         try:
             payload = json.loads(msg.data.decode())
-            order_id = payload.get("order_id")
-            total_amount = payload.get("total_amount")
+            try:
+                order_id = UUID(str(payload["order_id"]))
+                total_amount = payload["total_amount"]
+            except (KeyError, TypeError, ValueError) as e:
+                # Redelivering a malformed event can never succeed; ack and drop it
+                logger.error(f"Dropping malformed order_created event {payload!r}: {e}")
+                return
 
             logger.info(f"Processing order_created for invoice: {order_id}")
 
-            # Check idempotency
-            if order_id in self.processed_orders:
-                logger.info(f"Order {order_id} already processed (idempotent)")
-                return
-
-            # Create invoice
+            invoice_number = await invoice_numbers.next_number()
             async with async_session_maker() as session:
                 try:
                     # Calculate due date
@@ -75,23 +83,35 @@ class OrderEventConsumer:
                         + timedelta(days=settings.default_payment_terms_days)
                     ).date()
 
-                    # Create invoice
-                    invoice = Invoice(
-                        order_id=order_id,
-                        amount=total_amount,
-                        status="issued",
-                        issued_at=datetime.utcnow(),
-                        due_date=due_date,
-                        metadata={"auto_generated": True},
+                    # Create invoice unless this order was already invoiced;
+                    # the unique source_order_id makes redeliveries a no-op
+                    result = await session.execute(
+                        insert(Invoice)
+                        .values(
+                            order_id=order_id,
+                            source_order_id=order_id,
+                            invoice_number=invoice_number,
+                            amount=total_amount,
+                            status="issued",
+                            issued_at=datetime.utcnow(),
+                            due_date=due_date,
+                            invoice_metadata={"auto_generated": True},
+                        )
+                        .on_conflict_do_nothing(index_elements=["source_order_id"])
+                        .returning(Invoice)
                     )
-                    session.add(invoice)
-                    await session.flush()
+                    invoice = result.scalar_one_or_none()
+
+                    if invoice is None:
+                        await session.rollback()
+                        invoice_numbers.release(invoice_number)
+                        logger.info(f"Order {order_id} already invoiced (idempotent)")
+                        return
 
                     # Create ledger entries (double-entry)
                     await self.create_ledger_entries(session, invoice, order_id)
 
                     await session.commit()
-                    self.processed_orders.add(order_id)
 
                     logger.info(
                         f"Auto-generated invoice {invoice.id} for order {order_id}"
@@ -102,6 +122,7 @@ class OrderEventConsumer:
 
                 except Exception as e:
                     await session.rollback()
+                    invoice_numbers.release(invoice_number, e)
                     logger.error(f"Failed to create invoice for order {order_id}: {e}")
                     raise
 
@@ -139,6 +160,7 @@ class OrderEventConsumer:
             event = {
                 "event_type": "invoice_created",
                 "invoice_id": str(invoice.id),
+                "invoice_number": invoice.invoice_number,
                 "order_id": str(invoice.order_id),
                 "amount": float(invoice.amount),
                 "due_date": invoice.due_date.isoformat(),
@@ -0,0 +1,240 @@
+"""Gap-free sequential invoice number allocation"""
+import asyncio
+import heapq
+import logging
+import os
+import socket
+from typing import Optional
+from uuid import uuid4
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.database import async_session_maker
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceNumberAllocator:
+    """Hands out invoice numbers from blocks pre-allocated to this worker
+
+    Claiming a block touches the shared sequence row once per
+    `invoice_number_block_size` invoices; numbers are then assigned locally
+    without any database lock. Blocks stay registered until every number in
+    them belongs to a committed invoice, and reconcile() moves the unused
+    numbers of released or stale blocks into invoice_number_pool, which is
+    drained before a new block is claimed so the issued sequence has no gaps.
+
+    A worker that misses heartbeats for longer than the lease loses its
+    blocks to another worker's reconcile(); the next heartbeat notices and
+    stops handing out their numbers.
+    """
+
+    def __init__(self):
+        self.block_size = settings.invoice_number_block_size
+        self.lease_seconds = settings.invoice_number_lease_seconds
+        self.reconcile_interval_seconds = settings.invoice_number_reconcile_interval_seconds
+        self.worker_id = (
+            f"{settings.service_name}:{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        )
+        self._available: list[int] = []
+        # Inclusive (start, end) ranges of the blocks leased to this worker
+        self._blocks: list[tuple[int, int]] = []
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        """Heartbeat leased blocks and reclaim abandoned numbers on an interval"""
+        logger.info(f"Started invoice number reconciler for {self.worker_id}")
+
+        while True:
+            await asyncio.sleep(self.reconcile_interval_seconds)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Invoice number reconciliation failed: {e}")
+
+    async def next_number(self) -> int:
+        """Take the lowest invoice number available to this worker"""
+        async with self._lock:
+            if not self._available:
+                await self._claim_numbers()
+            return heapq.heappop(self._available)
+
+    def release(self, number: int, error: Optional[BaseException] = None):
+        """Return a number whose invoice was never committed
+
+        The number is dropped instead if its block has been revoked, or if
+        the insert failed because another worker already committed it.
+        """
+        if is_duplicate_number(error):
+            logger.warning(f"Invoice number {number} is already taken; discarding it")
+            return
+        if any(start <= number <= end for start, end in self._blocks):
+            heapq.heappush(self._available, number)
+
+    def _revoke_blocks(self, leased: list[tuple[int, int]]):
+        """Keep only the numbers of blocks this worker still holds"""
+        revoked = [block for block in self._blocks if block not in leased]
+        if not revoked:
+            return
+        self._blocks = [block for block in self._blocks if block in leased]
+        self._available = [
+            number for number in self._available
+            if any(start <= number <= end for start, end in self._blocks)
+        ]
+        heapq.heapify(self._available)
+        logger.warning(
+            f"Lease expired on invoice number blocks {revoked}; dropped their unused numbers"
+        )
+
+    async def _claim_numbers(self):
+        """Lease reclaimed numbers, or a fresh block if the pool is empty"""
+        async with async_session_maker() as session:
+            try:
+                result = await session.execute(
+                    text("""
+                        DELETE FROM invoice_number_pool
+                        WHERE number IN (
+                            SELECT number FROM invoice_number_pool
+                            ORDER BY number
+                            LIMIT :limit
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING number
+                    """),
+                    {"limit": self.block_size},
+                )
+                numbers = sorted(result.scalars())
+
+                if not numbers:
+                    start = await session.scalar(
+                        text("""
+                            UPDATE invoice_number_sequence
+                            SET next_number = next_number + :size
+                            WHERE id = 1
+                            RETURNING next_number - :size
+                        """),
+                        {"size": self.block_size},
+                    )
+                    numbers = list(range(start, start + self.block_size))
+
+                blocks = _contiguous_ranges(numbers)
+                await session.execute(
+                    text("""
+                        INSERT INTO invoice_number_blocks (start_number, end_number, worker_id)
+                        VALUES (:start_number, :end_number, :worker_id)
+                    """),
+                    [
+                        {"start_number": start, "end_number": end, "worker_id": self.worker_id}
+                        for start, end in blocks
+                    ],
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+        self._blocks.extend(blocks)
+        for number in numbers:
+            heapq.heappush(self._available, number)
+        logger.info(
+            f"Leased invoice numbers {numbers[0]}-{numbers[-1]} ({len(numbers)}) to {self.worker_id}"
+        )
+
+    async def reconcile(self, shutdown: bool = False):
+        """Heartbeat this worker's blocks and reclaim numbers nobody will use
+
+        With shutdown=True this worker's own blocks are released as well, so
+        its unassigned numbers go back to the pool immediately.
+        """
+        # Held throughout so a block claimed meanwhile isn't mistaken for a revoked one
+        async with self._lock:
+            await self._reconcile(shutdown)
+
+    async def _reconcile(self, shutdown: bool):
+        leased = None
+        async with async_session_maker() as session:
+            try:
+                params = {"worker_id": self.worker_id, "lease": self.lease_seconds}
+
+                if not shutdown:
+                    # Blocks missing from the result were reclaimed by another worker
+                    heartbeat = await session.execute(
+                        text("""
+                            UPDATE invoice_number_blocks
+                            SET heartbeat_at = NOW()
+                            WHERE worker_id = :worker_id
+                            RETURNING start_number, end_number
+                        """),
+                        params,
+                    )
+                    leased = [(start, end) for start, end in heartbeat.all()]
+
+                    # Drop blocks whose numbers have all been committed
+                    used_up = await session.execute(
+                        text("""
+                            DELETE FROM invoice_number_blocks b
+                            WHERE b.worker_id = :worker_id
+                              AND (
+                                  SELECT COUNT(*) FROM invoices i
+                                  WHERE i.invoice_number BETWEEN b.start_number AND b.end_number
+                              ) = b.end_number - b.start_number + 1
+                            RETURNING start_number, end_number
+                        """),
+                        params,
+                    )
+                    used_up_blocks = [(start, end) for start, end in used_up.all()]
+                    leased = [block for block in leased if block not in used_up_blocks]
+
+                result = await session.execute(
+                    text(f"""
+                        WITH released AS (
+                            DELETE FROM invoice_number_blocks
+                            WHERE {"worker_id = :worker_id OR " if shutdown else ""}
+                                  heartbeat_at < NOW() - make_interval(secs => :lease)
+                            RETURNING start_number, end_number
+                        )
+                        INSERT INTO invoice_number_pool (number)
+                        SELECT n
+                        FROM released, generate_series(released.start_number, released.end_number) AS n
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM invoices i WHERE i.invoice_number = n
+                        )
+                        ON CONFLICT (number) DO NOTHING
+                    """),
+                    params,
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+        if shutdown:
+            self._available.clear()
+            self._blocks.clear()
+        else:
+            self._blocks = [block for block in self._blocks if block not in used_up_blocks]
+            self._revoke_blocks(leased)
+        if result.rowcount:
+            logger.info(f"Reclaimed {result.rowcount} unused invoice numbers")
+
+
+def is_duplicate_number(error: Optional[BaseException]) -> bool:
+    """Whether an insert failed on the unique invoice_number index"""
+    return isinstance(error, IntegrityError) and "invoice_number" in str(error.orig)
+
+
+def _contiguous_ranges(numbers: list[int]) -> list[tuple[int, int]]:
+    """Collapse sorted numbers into inclusive (start, end) runs"""
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1] = (ranges[-1][0], number)
+        else:
+            ranges.append((number, number))
+    return ranges
+
+
+# Singleton instance
+invoice_numbers = InvoiceNumberAllocator()
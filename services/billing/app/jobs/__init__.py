@@ -0,0 +1 @@
+"""Scheduled background jobs package"""
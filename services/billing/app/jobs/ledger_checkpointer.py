@@ -0,0 +1,123 @@
+"""Scheduled job that closes daily per-account ledger checkpoints"""
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.database import async_session_maker
+from app.models import LedgerCheckpoint, LedgerEntry
+
+logger = logging.getLogger(__name__)
+
+
+def period_start(day: date) -> datetime:
+    """UTC midnight at the start of a ledger period"""
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+class LedgerCheckpointer:
+    """Rolls each closed day of ledger entries into cumulative checkpoints"""
+
+    def __init__(self):
+        self.interval_seconds = settings.ledger_checkpoint_interval_seconds
+        self.grace = timedelta(seconds=settings.ledger_checkpoint_grace_seconds)
+
+    async def start(self):
+        """Close pending periods on a fixed interval"""
+        logger.info(
+            f"Started ledger checkpointer (every {self.interval_seconds}s)"
+        )
+
+        while True:
+            try:
+                await self.close_periods()
+            except Exception as e:
+                logger.error(f"Ledger checkpoint run failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def close_periods(self, now: Optional[datetime] = None) -> int:
+        """Checkpoint every day that ended more than the grace period ago
+
+        created_at is stamped when an entry is flushed, not when its transaction
+        commits, so a day is only closed once transactions still open at
+        midnight have had the grace period to land.
+        """
+        now = now or datetime.now(timezone.utc)
+        closed = 0
+
+        async with async_session_maker() as session:
+            last_closed = await session.scalar(
+                select(func.max(LedgerCheckpoint.period_date))
+            )
+            if last_closed is None:
+                first_entry = await session.scalar(
+                    select(func.min(LedgerEntry.created_at))
+                )
+                if first_entry is None:
+                    return 0
+                next_day = first_entry.astimezone(timezone.utc).date()
+            else:
+                next_day = last_closed + timedelta(days=1)
+
+            while period_start(next_day + timedelta(days=1)) + self.grace <= now:
+                try:
+                    await self.close_day(session, next_day)
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    raise
+                next_day += timedelta(days=1)
+                closed += 1
+
+        if closed:
+            logger.info(f"Closed {closed} ledger periods through {next_day - timedelta(days=1)}")
+        return closed
+
+    async def close_day(self, session, day: date):
+        """Write the checkpoint for one day from the previous checkpoint plus that day's entries"""
+        carried = select(
+            LedgerCheckpoint.account.label("account"),
+            LedgerCheckpoint.total_debit.label("debit"),
+            LedgerCheckpoint.total_credit.label("credit"),
+            LedgerCheckpoint.entry_count.label("entries"),
+        ).where(LedgerCheckpoint.period_date == day - timedelta(days=1))
+
+        movements = (
+            select(
+                LedgerEntry.account.label("account"),
+                func.sum(LedgerEntry.debit).label("debit"),
+                func.sum(LedgerEntry.credit).label("credit"),
+                func.count().label("entries"),
+            )
+            .where(
+                LedgerEntry.created_at >= period_start(day),
+                LedgerEntry.created_at < period_start(day + timedelta(days=1)),
+            )
+            .group_by(LedgerEntry.account)
+        )
+
+        combined = union_all(carried, movements).subquery()
+        closing = select(
+            combined.c.account,
+            literal(day).label("period_date"),
+            func.sum(combined.c.debit),
+            func.sum(combined.c.credit),
+            func.sum(combined.c.entries),
+        ).group_by(combined.c.account)
+
+        await session.execute(
+            insert(LedgerCheckpoint)
+            .from_select(
+                ["account", "period_date", "total_debit", "total_credit", "entry_count"],
+                closing,
+            )
+            .on_conflict_do_nothing(index_elements=["account", "period_date"])
+        )
+
+
+# Singleton instance
+ledger_checkpointer = LedgerCheckpointer()
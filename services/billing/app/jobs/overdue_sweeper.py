@@ -0,0 +1,168 @@
+"""Scheduled sweeper that transitions past-due invoices to overdue"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.database import async_session_maker
+from app.models import Invoice, OverdueSweepState
+from app.nats_client import nats_client
+from app.schemas import InvoiceOverdueEvent
+
+logger = logging.getLogger(__name__)
+
+
+class OverdueInvoiceSweeper:
+    """Flips issued invoices past their due date to overdue in batches
+
+    Progress is persisted in overdue_sweep_state, so a run (on any replica,
+    after any restart) only scans due dates that became past due since the
+    last run, plus invoices created since the last run whose due date was
+    already behind it, such as back-dated or late-arriving invoices.
+    """
+
+    def __init__(self):
+        self.interval_seconds = settings.overdue_sweep_interval_seconds
+        self.batch_size = settings.overdue_sweep_batch_size
+        self.backfill_grace = timedelta(seconds=settings.overdue_sweep_backfill_grace_seconds)
+
+    async def start(self):
+        """Run the sweeper on a fixed interval"""
+        logger.info(
+            f"Started overdue invoice sweeper (every {self.interval_seconds}s)"
+        )
+
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Overdue sweep failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def sweep(self, today: Optional[date] = None) -> int:
+        """Mark every issued invoice due before today as overdue"""
+        today = today or datetime.utcnow().date()
+
+        async with async_session_maker() as session:
+            started_at = await session.scalar(select(func.now()))
+            state = await session.get(OverdueSweepState, 1)
+
+        swept = 0
+        if state is None:
+            # First run: one full range scan
+            swept += await self.sweep_range([Invoice.due_date < today], Invoice.due_date)
+        else:
+            if state.due_before < today:
+                # Due dates that became past due since the last run (idx_invoices_due_date)
+                swept += await self.sweep_range(
+                    [Invoice.due_date >= state.due_before, Invoice.due_date < today],
+                    Invoice.due_date,
+                )
+            # Invoices created since the last run with a due date it had already
+            # passed (idx_invoices_created_at); the grace covers transactions that
+            # were still open when that run started
+            swept += await self.sweep_range(
+                [
+                    Invoice.due_date < state.due_before,
+                    Invoice.created_at >= state.created_before - self.backfill_grace,
+                ],
+                Invoice.created_at,
+            )
+
+        await self.save_state(today, started_at)
+
+        if swept:
+            logger.info(f"Marked {swept} invoices overdue (due before {today})")
+        return swept
+
+    async def save_state(self, due_before: date, created_before: datetime):
+        """Record a completed run; marks never move backwards"""
+        async with async_session_maker() as session:
+            try:
+                stmt = insert(OverdueSweepState).values(
+                    id=1, due_before=due_before, created_before=created_before
+                )
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=["id"],
+                        set_={
+                            "due_before": func.greatest(
+                                OverdueSweepState.due_before, stmt.excluded.due_before
+                            ),
+                            "created_before": func.greatest(
+                                OverdueSweepState.created_before, stmt.excluded.created_before
+                            ),
+                            "updated_at": func.now(),
+                        },
+                    )
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+    async def sweep_range(self, conditions: list, order_by) -> int:
+        """Flip issued invoices matching conditions in batches; returns the count"""
+        swept = 0
+        while True:
+            async with async_session_maker() as session:
+                try:
+                    rows = await self.flip_batch(session, conditions, order_by)
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    raise
+
+            for row in rows:
+                await self.publish_invoice_overdue(row)
+
+            swept += len(rows)
+            if len(rows) < self.batch_size:
+                return swept
+
+    async def flip_batch(self, session, conditions: list, order_by):
+        """Flip one chunk of past-due invoices and return the changed rows"""
+        # Range scan locking the chunk being flipped. Rows another replica is
+        # flipping are skipped rather than waited on, so a full batch isn't cut
+        # short when they drop out of the filter.
+        due_ids = (
+            select(Invoice.id)
+            .where(Invoice.status == "issued", *conditions)
+            .order_by(order_by)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+
+        result = await session.execute(
+            update(Invoice)
+            .where(Invoice.id.in_(due_ids))
+            .values(status="overdue")
+            .returning(
+                Invoice.id, Invoice.order_id, Invoice.amount, Invoice.due_date
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.all()
+
+    async def publish_invoice_overdue(self, row):
+        """Publish invoice_overdue event"""
+        try:
+            event = InvoiceOverdueEvent(
+                invoice_id=row.id,
+                order_id=row.order_id,
+                amount=float(row.amount),
+                due_date=row.due_date,
+                timestamp=datetime.utcnow(),
+            )
+            await nats_client.publish("invoice_overdue", event.model_dump(mode="json"))
+        except Exception as e:
+            logger.error(f"Failed to publish invoice_overdue event: {e}")
+
+
+# Singleton instance
+overdue_sweeper = OverdueInvoiceSweeper()
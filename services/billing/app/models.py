@@ -3,7 +3,7 @@ from datetime import datetime, date
 from typing import Optional
 from uuid import UUID, uuid4
 
-from sqlalchemy import CheckConstraint, Column, DateTime, Date, ForeignKey, Numeric, String, Text
+from sqlalchemy import BigInteger, CheckConstraint, Column, DateTime, Date, ForeignKey, Numeric, SmallInteger, String, Text
 from sqlalchemy.dialects.postgresql import UUID as PGUUID, JSONB
 from sqlalchemy.orm import relationship, Mapped, mapped_column, DeclarativeBase
 
@@ -21,6 +21,12 @@ class Invoice(Base):
         PGUUID(as_uuid=True), primary_key=True, default=uuid4
     )
     order_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
+    invoice_number: Mapped[Optional[int]] = mapped_column(
+        BigInteger, nullable=True, unique=True
+    )
+    source_order_id: Mapped[Optional[UUID]] = mapped_column(
+        PGUUID(as_uuid=True), nullable=True, unique=True
+    )
     amount: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False)
     status: Mapped[str] = mapped_column(String(32), nullable=False, default="issued")
     issued_at: Mapped[datetime] = mapped_column(
@@ -79,3 +85,38 @@ class LedgerEntry(Base):
             name="ledger_entry_check",
         ),
     )
+
+
+class LedgerCheckpoint(Base):
+    """Ledger checkpoint model - maps to ledger_checkpoints table
+
+    Totals are cumulative for every entry created before the end of period_date.
+    """
+
+    __tablename__ = "ledger_checkpoints"
+
+    account: Mapped[str] = mapped_column(String(64), primary_key=True)
+    period_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    total_debit: Mapped[float] = mapped_column(Numeric(16, 2), nullable=False, default=0)
+    total_credit: Mapped[float] = mapped_column(Numeric(16, 2), nullable=False, default=0)
+    entry_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=datetime.utcnow
+    )
+
+
+class OverdueSweepState(Base):
+    """Overdue sweeper progress - maps to overdue_sweep_state (single row)
+
+    Issued invoices due before due_before have been swept, as far as they
+    were created before created_before.
+    """
+
+    __tablename__ = "overdue_sweep_state"
+
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True, default=1)
+    due_before: Mapped[date] = mapped_column(Date, nullable=False)
+    created_before: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=datetime.utcnow
+    )
@@ -1,16 +1,28 @@
 """Billing API endpoints"""
 from datetime import datetime, timedelta, date
-from typing import List
-from uuid import UUID
+from decimal import Decimal
+from typing import List, Optional
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
-from app.models import Invoice, LedgerEntry
+from app.invoice_numbers import invoice_numbers
+from app.jobs.ledger_checkpointer import period_start
+from app.models import Invoice, LedgerCheckpoint, LedgerEntry
 from app.nats_client import nats_client
-from app.schemas import InvoiceCreate, InvoiceResponse, InvoiceCreatedEvent
+from app.schemas import (
+    InvoiceCreate,
+    InvoiceResponse,
+    InvoiceCreatedEvent,
+    JournalBatchCreate,
+    JournalBatchResponse,
+    JournalCreate,
+    TrialBalanceResponse,
+    TrialBalanceRow,
+)
 from app.config import settings
 
 router = APIRouter()
@@ -60,7 +72,7 @@ async def create_invoice(
     - **amount**: Invoice amount
     - **due_date**: Payment due date (optional, defaults to +30 days)
 
-    Creates invoice and double-entry ledger entries.
+    Assigns the next sequential invoice number and creates double-entry ledger entries.
     Emits 'invoice_created' event to NATS.
     """
     # Calculate due date if not provided
@@ -71,8 +83,10 @@ async def create_invoice(
         ).date()
 
     # Create invoice
+    invoice_number = await invoice_numbers.next_number()
     new_invoice = Invoice(
         order_id=invoice_data.order_id,
+        invoice_number=invoice_number,
         amount=invoice_data.amount,
         status="issued",
         issued_at=datetime.utcnow(),
@@ -80,20 +94,26 @@ async def create_invoice(
         metadata=invoice_data.metadata,
     )
 
-    db.add(new_invoice)
-    await db.flush()
+    try:
+        db.add(new_invoice)
+        await db.flush()
 
-    # Create ledger entries
-    await create_ledger_entries(
-        db, new_invoice, f"Invoice for order {invoice_data.order_id}"
-    )
+        # Create ledger entries
+        await create_ledger_entries(
+            db, new_invoice, f"Invoice for order {invoice_data.order_id}"
+        )
+
+        await db.commit()
+    except Exception as e:
+        invoice_numbers.release(invoice_number, e)
+        raise
 
-    await db.commit()
     await db.refresh(new_invoice)
 
     # Publish event to NATS
     event = InvoiceCreatedEvent(
         invoice_id=new_invoice.id,
+        invoice_number=new_invoice.invoice_number,
         order_id=new_invoice.order_id,
         amount=float(new_invoice.amount),
         due_date=new_invoice.due_date,
@@ -130,3 +150,160 @@ async def get_invoice(
         )
 
     return invoice
+
+
+@router.get(
+    "/trial-balance",
+    response_model=TrialBalanceResponse,
+    summary="Trial balance as of a date",
+)
+async def get_trial_balance(
+    as_of: Optional[date] = Query(
+        None, description="Balance as of the end of this day (defaults to today)"
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Per-account debit/credit totals as of the end of a day.
+
+    Starts from the nearest closed ledger checkpoint on or before `as_of`
+    and only range-scans ledger entries posted after it.
+    """
+    as_of = as_of or datetime.utcnow().date()
+
+    checkpoint_date = await db.scalar(
+        select(func.max(LedgerCheckpoint.period_date)).where(
+            LedgerCheckpoint.period_date <= as_of
+        )
+    )
+
+    # account -> [debit, credit, entry_count]
+    balances: dict[str, list] = {}
+
+    if checkpoint_date is not None:
+        result = await db.execute(
+            select(
+                LedgerCheckpoint.account,
+                LedgerCheckpoint.total_debit,
+                LedgerCheckpoint.total_credit,
+                LedgerCheckpoint.entry_count,
+            ).where(LedgerCheckpoint.period_date == checkpoint_date)
+        )
+        for account, debit, credit, entries in result:
+            balances[account] = [debit, credit, entries]
+
+    movements = select(
+        LedgerEntry.account,
+        func.sum(LedgerEntry.debit),
+        func.sum(LedgerEntry.credit),
+        func.count(),
+    ).where(LedgerEntry.created_at < period_start(as_of + timedelta(days=1)))
+    if checkpoint_date is not None:
+        movements = movements.where(
+            LedgerEntry.created_at >= period_start(checkpoint_date + timedelta(days=1))
+        )
+
+    result = await db.execute(movements.group_by(LedgerEntry.account))
+    for account, debit, credit, entries in result:
+        totals = balances.setdefault(account, [0, 0, 0])
+        totals[0] += debit
+        totals[1] += credit
+        totals[2] += entries
+
+    accounts = [
+        TrialBalanceRow(
+            account=account,
+            debit=float(debit),
+            credit=float(credit),
+            balance=float(debit - credit),
+            entry_count=entries,
+        )
+        for account, (debit, credit, entries) in sorted(balances.items())
+    ]
+    total_debit = sum(totals[0] for totals in balances.values())
+    total_credit = sum(totals[1] for totals in balances.values())
+
+    return TrialBalanceResponse(
+        as_of=as_of,
+        checkpoint_date=checkpoint_date,
+        accounts=accounts,
+        total_debit=float(total_debit),
+        total_credit=float(total_credit),
+        balanced=total_debit == total_credit,
+    )
+
+
+def find_unbalanced_journals(journals: List[JournalCreate]) -> List[dict]:
+    """Sum debits and credits per journal in one pass over all lines"""
+    debits = [Decimal("0")] * len(journals)
+    credits = [Decimal("0")] * len(journals)
+
+    for index, journal in enumerate(journals):
+        for line in journal.lines:
+            debits[index] += line.debit
+            credits[index] += line.credit
+
+    return [
+        {"index": index, "debit": float(debit), "credit": float(credit)}
+        for index, (debit, credit) in enumerate(zip(debits, credits))
+        if debit != credit
+    ]
+
+
+@router.post(
+    "/journal",
+    response_model=JournalBatchResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Post a batch of journals",
+)
+async def post_journals(
+    batch: JournalBatchCreate,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Post balanced journals (payroll runs, adjustments) to the ledger.
+
+    - **journals**: Up to 500 journals with 2 to 1000 lines each; every line
+      has either a debit or a credit
+
+    The batch is all or nothing: if any journal's debits and credits differ
+    the request is rejected with the offending journal indexes. Lines are
+    written with multi-row inserts in a single transaction; they fall in the
+    current open period, so the next ledger checkpoint picks them up.
+    """
+    unbalanced = find_unbalanced_journals(batch.journals)
+    if unbalanced:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": "Unbalanced journals", "journals": unbalanced},
+        )
+
+    posted_at = datetime.utcnow()
+    ref_ids = [journal.ref_id or uuid4() for journal in batch.journals]
+    rows = [
+        {
+            "id": uuid4(),
+            "account": line.account,
+            "debit": line.debit,
+            "credit": line.credit,
+            "ref_type": journal.ref_type,
+            "ref_id": ref_id,
+            "description": line.description or journal.description,
+            "created_at": posted_at,
+        }
+        for journal, ref_id in zip(batch.journals, ref_ids)
+        for line in journal.lines
+    ]
+
+    await db.execute(insert(LedgerEntry), rows)
+    await db.commit()
+
+    total = sum((line["debit"] for line in rows), Decimal("0"))
+
+    return JournalBatchResponse(
+        journals_posted=len(batch.journals),
+        lines_posted=len(rows),
+        total_debit=float(total),
+        total_credit=float(total),
+        ref_ids=ref_ids,
+    )
@@ -1,9 +1,10 @@
 """Pydantic schemas for request/response validation"""
 from datetime import datetime, date
-from typing import Optional
+from decimal import Decimal
+from typing import List, Literal, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 # Request schemas
@@ -16,12 +17,52 @@ class InvoiceCreate(BaseModel):
     metadata: Optional[dict] = Field(default_factory=dict, description="Optional metadata")
 
 
+class JournalLine(BaseModel):
+    """Schema for a single debit or credit line of a journal"""
+
+    account: str = Field(..., min_length=1, max_length=64, description="Ledger account")
+    debit: Decimal = Field(Decimal("0"), ge=0, max_digits=14, decimal_places=2)
+    credit: Decimal = Field(Decimal("0"), ge=0, max_digits=14, decimal_places=2)
+    description: Optional[str] = Field(None, description="Line description (optional)")
+
+    @model_validator(mode="after")
+    def validate_single_side(self):
+        if (self.debit > 0) == (self.credit > 0):
+            raise ValueError("Each line must have either a debit or a credit amount")
+        return self
+
+
+class JournalCreate(BaseModel):
+    """Schema for a balanced journal of ledger lines"""
+
+    ref_type: Literal["order", "invoice", "payment", "payroll", "adjustment"] = Field(
+        "adjustment", description="Ledger reference type"
+    )
+    ref_id: Optional[UUID] = Field(None, description="Reference ID (generated if omitted)")
+    description: Optional[str] = Field(None, description="Default description for lines")
+    lines: List[JournalLine] = Field(
+        ..., min_length=2, max_length=1000, description="Journal lines"
+    )
+
+
+class JournalBatchCreate(BaseModel):
+    """Schema for posting a batch of journals"""
+
+    journals: List[JournalCreate] = Field(
+        ...,
+        min_length=1,
+        max_length=500,
+        description="Journals to post (all or nothing, at most 500)",
+    )
+
+
 # Response schemas
 class InvoiceResponse(BaseModel):
     """Schema for invoice in response"""
 
     id: UUID
     order_id: UUID
+    invoice_number: Optional[int]
     amount: float
     status: str
     issued_at: datetime
@@ -49,11 +90,56 @@ class LedgerEntryResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class JournalBatchResponse(BaseModel):
+    """Schema for journal batch posting response"""
+
+    journals_posted: int
+    lines_posted: int
+    total_debit: float
+    total_credit: float
+    ref_ids: List[UUID]
+
+
+class TrialBalanceRow(BaseModel):
+    """Schema for a single account line of a trial balance"""
+
+    account: str
+    debit: float
+    credit: float
+    balance: float
+    entry_count: int
+
+
+class TrialBalanceResponse(BaseModel):
+    """Schema for trial balance response"""
+
+    as_of: date
+    checkpoint_date: Optional[date] = Field(
+        None, description="Closed period the balances were built from"
+    )
+    accounts: List[TrialBalanceRow]
+    total_debit: float
+    total_credit: float
+    balanced: bool
+
+
 class InvoiceCreatedEvent(BaseModel):
     """Schema for invoice_created NATS event"""
 
     event_type: str = "invoice_created"
     invoice_id: UUID
+    invoice_number: Optional[int] = None
+    order_id: UUID
+    amount: float
+    due_date: date
+    timestamp: datetime
+
+
+class InvoiceOverdueEvent(BaseModel):
+    """Schema for invoice_overdue NATS event"""
+
+    event_type: str = "invoice_overdue"
+    invoice_id: UUID
     order_id: UUID
     amount: float
     due_date: date
@@ -11,6 +11,9 @@ from app.database import engine, init_db
 from app.nats_client import nats_client
 from app.routers import billing
 from app.consumers.order_consumer import order_consumer
+from app.invoice_numbers import invoice_numbers
+from app.jobs.ledger_checkpointer import ledger_checkpointer
+from app.jobs.overdue_sweeper import overdue_sweeper
 
 
 @asynccontextmanager
@@ -23,14 +26,26 @@ async def lifespan(app: FastAPI):
     # Start NATS consumer in background
     consumer_task = asyncio.create_task(order_consumer.start())
 
+    # Start scheduled jobs in background
+    sweeper_task = asyncio.create_task(overdue_sweeper.start())
+    checkpointer_task = asyncio.create_task(ledger_checkpointer.start())
+    numbering_task = asyncio.create_task(invoice_numbers.start())
+
     yield
 
     # Shutdown
-    consumer_task.cancel()
+    for task in (consumer_task, sweeper_task, checkpointer_task, numbering_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # Hand unused invoice numbers back to the pool
     try:
-        await consumer_task
-    except asyncio.CancelledError:
-        pass
+        await invoice_numbers.reconcile(shutdown=True)
+    except Exception as e:
+        print(f"Failed to release invoice numbers: {e}")
 
     await nats_client.close()
     await engine.dispose()
@@ -0,0 +1,136 @@
+"""Tests for invoice number block allocation"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app.database import async_session_maker
+from app.invoice_numbers import InvoiceNumberAllocator, _contiguous_ranges
+
+
+@pytest.fixture
+async def session():
+    """Session for inspecting the allocator's committed state"""
+    async with async_session_maker() as session:
+        yield session
+        await session.rollback()
+
+
+async def worker_blocks(session, allocator):
+    result = await session.execute(
+        text("""
+            SELECT start_number, end_number FROM invoice_number_blocks
+            WHERE worker_id = :worker_id
+            ORDER BY start_number
+        """),
+        {"worker_id": allocator.worker_id},
+    )
+    return [(start, end) for start, end in result.all()]
+
+
+def test_contiguous_ranges_collapses_runs():
+    """Test consecutive numbers collapse into inclusive ranges"""
+    assert _contiguous_ranges([1, 2, 3, 7, 8, 10]) == [(1, 3), (7, 8), (10, 10)]
+
+
+def test_contiguous_ranges_single_run():
+    """Test a fresh block is a single range"""
+    assert _contiguous_ranges(list(range(101, 201))) == [(101, 200)]
+
+
+def test_contiguous_ranges_empty():
+    """Test no numbers give no ranges"""
+    assert _contiguous_ranges([]) == []
+
+
+def test_release_discards_duplicate_number():
+    """Test a number that failed on the unique index is not handed out again"""
+    allocator = InvoiceNumberAllocator()
+    allocator._blocks = [(1, 10)]
+
+    duplicate = IntegrityError(
+        "INSERT INTO invoices ...",
+        {},
+        Exception(
+            'duplicate key value violates unique constraint "idx_invoices_invoice_number"'
+        ),
+    )
+    allocator.release(5, duplicate)
+    assert allocator._available == []
+
+    allocator.release(6, RuntimeError("ledger insert failed"))
+    assert allocator._available == [6]
+
+
+def test_release_ignores_revoked_block():
+    """Test numbers of a block this worker no longer holds are dropped"""
+    allocator = InvoiceNumberAllocator()
+    allocator._blocks = [(1, 3), (7, 9)]
+    allocator._available = [2, 3, 8]
+
+    allocator._revoke_blocks([(7, 9)])
+    assert allocator._available == [8]
+
+    allocator.release(1)
+    assert allocator._available == [8]
+
+
+@pytest.mark.asyncio
+async def test_claim_release_reconcile_cycle(session):
+    """Test released numbers are reused locally, then pooled on shutdown"""
+    allocator = InvoiceNumberAllocator()
+
+    first = await allocator.next_number()
+    blocks = await worker_blocks(session, allocator)
+    assert any(start <= first <= end for start, end in blocks)
+
+    # A number whose invoice was never committed is handed out again
+    allocator.release(first)
+    assert await allocator.next_number() == first
+    allocator.release(first)
+
+    await allocator.reconcile(shutdown=True)
+    assert await worker_blocks(session, allocator) == []
+    assert allocator._available == []
+
+    pooled = await session.scalar(
+        text("SELECT COUNT(*) FROM invoice_number_pool WHERE number = :number"),
+        {"number": first},
+    )
+    assert pooled == 1
+
+    # The pool is drained lowest first before a fresh block is claimed
+    other = InvoiceNumberAllocator()
+    assert await other.next_number() <= first
+    await other.reconcile(shutdown=True)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_drops_revoked_blocks(session):
+    """Test a worker stops serving numbers once its expired block is pooled"""
+    allocator = InvoiceNumberAllocator()
+    first = await allocator.next_number()
+    assert allocator._available
+
+    # Let the lease lapse, then have another worker reclaim the block
+    await session.execute(
+        text("""
+            UPDATE invoice_number_blocks
+            SET heartbeat_at = NOW() - make_interval(secs => :lease + 60)
+            WHERE worker_id = :worker_id
+        """),
+        {"worker_id": allocator.worker_id, "lease": allocator.lease_seconds},
+    )
+    await session.commit()
+
+    other = InvoiceNumberAllocator()
+    await other.reconcile()
+
+    await allocator.reconcile()
+    assert allocator._available == []
+    assert allocator._blocks == []
+
+    allocator.release(first)
+    assert allocator._available == []
+
+    await allocator.reconcile(shutdown=True)
+    await other.reconcile(shutdown=True)
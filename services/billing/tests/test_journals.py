@@ -0,0 +1,132 @@
+"""Tests for POST /billing/journal"""
+from decimal import Decimal
+
+import pytest
+from httpx import AsyncClient
+
+from app.routers.billing import find_unbalanced_journals
+from app.schemas import JournalCreate
+from main import app
+
+
+def payroll_journal(debit="1000.00", credit="1000.00"):
+    return {
+        "ref_type": "payroll",
+        "description": "Payroll run",
+        "lines": [
+            {"account": "salaries_expense", "debit": debit},
+            {"account": "cash", "credit": credit},
+        ],
+    }
+
+
+def test_find_unbalanced_journals():
+    """Test only journals whose debits and credits differ are reported"""
+    journals = [
+        JournalCreate(**payroll_journal()),
+        JournalCreate(**payroll_journal(credit="999.99")),
+    ]
+
+    assert find_unbalanced_journals(journals) == [
+        {"index": 1, "debit": 1000.0, "credit": 999.99}
+    ]
+
+
+def test_find_unbalanced_journals_multi_line():
+    """Test lines on the same side are summed before comparing"""
+    journal = JournalCreate(
+        lines=[
+            {"account": "salaries_expense", "debit": Decimal("600.00")},
+            {"account": "benefits_expense", "debit": Decimal("400.00")},
+            {"account": "cash", "credit": Decimal("1000.00")},
+        ]
+    )
+
+    assert find_unbalanced_journals([journal]) == []
+
+
+@pytest.mark.asyncio
+async def test_post_journals_rejects_unbalanced_batch():
+    """Test an unbalanced journal rejects the whole batch with its index"""
+    batch = {"journals": [payroll_journal(), payroll_journal(credit="900.00")]}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/billing/journal", json=batch)
+
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert detail["message"] == "Unbalanced journals"
+    assert [journal["index"] for journal in detail["journals"]] == [1]
+
+
+@pytest.mark.asyncio
+async def test_post_journals_rejects_two_sided_line():
+    """Test a line with both a debit and a credit is rejected"""
+    journal = payroll_journal()
+    journal["lines"][0]["credit"] = "1000.00"
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/billing/journal", json={"journals": [journal]})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_post_journals_rejects_single_line_journal():
+    """Test a journal needs at least two lines"""
+    journal = payroll_journal()
+    journal["lines"] = journal["lines"][:1]
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/billing/journal", json={"journals": [journal]})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_post_journals_rejects_empty_batch():
+    """Test a batch needs at least one journal"""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/billing/journal", json={"journals": []})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_post_journals_rejects_oversized_batch():
+    """Test a batch over the journal limit is rejected before any balancing"""
+    batch = {"journals": [payroll_journal()] * 501}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/billing/journal", json=batch)
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_post_journals_rejects_oversized_journal():
+    """Test a journal over the line limit is rejected"""
+    journal = payroll_journal()
+    journal["lines"] = journal["lines"] * 501
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/billing/journal", json={"journals": [journal]})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_post_journals():
+    """Test a balanced batch is posted with one ref_id per journal"""
+    batch = {"journals": [payroll_journal(), payroll_journal("250.00", "250.00")]}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/billing/journal", json=batch)
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data["journals_posted"] == 2
+    assert data["lines_posted"] == 4
+    assert data["total_debit"] == 1250.0
+    assert data["total_credit"] == 1250.0
+    assert len(data["ref_ids"]) == 2
@@ -0,0 +1,120 @@
+"""Tests for ledger checkpoints and GET /billing/trial-balance"""
+from datetime import date, timedelta
+from uuid import uuid4
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete, func, select
+
+from app.database import async_session_maker
+from app.jobs.ledger_checkpointer import LedgerCheckpointer, period_start
+from app.models import LedgerCheckpoint, LedgerEntry
+from main import app
+
+DAY = date(2026, 3, 10)
+
+
+@pytest.fixture
+async def session():
+    """Session with checkpoints cleared so each test closes periods from scratch"""
+    async with async_session_maker() as session:
+        await session.execute(delete(LedgerCheckpoint))
+        await session.commit()
+        yield session
+        await session.rollback()
+        await session.execute(delete(LedgerCheckpoint))
+        await session.commit()
+
+
+@pytest.fixture
+def account():
+    """Account no other test posts to"""
+    return f"test_{uuid4().hex[:12]}"
+
+
+async def post_entry(session, account, created_at, debit=0, credit=0):
+    session.add(
+        LedgerEntry(
+            account=account,
+            debit=debit,
+            credit=credit,
+            ref_type="adjustment",
+            ref_id=uuid4(),
+            created_at=created_at,
+        )
+    )
+    await session.commit()
+
+
+async def checkpoint(session, account, day):
+    return await session.scalar(
+        select(LedgerCheckpoint).where(
+            LedgerCheckpoint.account == account,
+            LedgerCheckpoint.period_date == day,
+        )
+    )
+
+
+async def full_sum(session, account, as_of):
+    result = await session.execute(
+        select(
+            func.sum(LedgerEntry.debit), func.sum(LedgerEntry.credit), func.count()
+        ).where(
+            LedgerEntry.account == account,
+            LedgerEntry.created_at < period_start(as_of + timedelta(days=1)),
+        )
+    )
+    return result.one()
+
+
+@pytest.mark.asyncio
+async def test_close_periods_waits_for_grace(session, account):
+    """Test a day is not closed until late-committing entries have landed"""
+    checkpointer = LedgerCheckpointer()
+    midnight = period_start(DAY + timedelta(days=1))
+    await post_entry(session, account, midnight - timedelta(hours=1), debit=100)
+
+    await checkpointer.close_periods(now=midnight + checkpointer.grace / 2)
+    assert await checkpoint(session, account, DAY) is None
+
+    # Stamped before midnight, committed after it
+    await post_entry(session, account, midnight - timedelta(seconds=1), credit=40)
+
+    await checkpointer.close_periods(now=midnight + checkpointer.grace)
+    closed = await checkpoint(session, account, DAY)
+    assert closed.total_debit == 100
+    assert closed.total_credit == 40
+    assert closed.entry_count == 2
+
+
+@pytest.mark.asyncio
+async def test_trial_balance_matches_full_sum(session, account):
+    """Test checkpoint plus tail equals a full SUM over ledger_entries"""
+    checkpointer = LedgerCheckpointer()
+    for offset, debit, credit in [(-2, 250, 0), (-1, 0, 75), (0, 30, 0)]:
+        await post_entry(
+            session,
+            account,
+            period_start(DAY + timedelta(days=offset)) + timedelta(hours=12),
+            debit=debit,
+            credit=credit,
+        )
+
+    # Closes through DAY - 1; DAY is served from the tail
+    await checkpointer.close_periods(now=period_start(DAY) + checkpointer.grace)
+    assert await checkpoint(session, account, DAY - timedelta(days=1)) is not None
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        for as_of in [DAY - timedelta(days=2), DAY - timedelta(days=1), DAY]:
+            response = await client.get(
+                "/billing/trial-balance", params={"as_of": as_of.isoformat()}
+            )
+            assert response.status_code == 200
+
+            row = next(
+                row for row in response.json()["accounts"] if row["account"] == account
+            )
+            debit, credit, entries = await full_sum(session, account, as_of)
+            assert row["debit"] == float(debit)
+            assert row["credit"] == float(credit)
+            assert row["entry_count"] == entries
@@ -0,0 +1,71 @@
+"""Tests for the order_created consumer"""
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select
+
+from app.consumers.order_consumer import OrderEventConsumer
+from app.database import async_session_maker
+from app.invoice_numbers import invoice_numbers
+from app.models import Invoice
+
+
+def order_created(**payload):
+    return SimpleNamespace(data=json.dumps(payload).encode())
+
+
+@pytest.fixture(autouse=True)
+def publish():
+    with patch(
+        "app.consumers.order_consumer.nats_client.publish", new_callable=AsyncMock
+    ) as publish:
+        yield publish
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"total_amount": 100.0},
+        {"order_id": None, "total_amount": 100.0},
+        {"order_id": "not-a-uuid", "total_amount": 100.0},
+        {"order_id": str(uuid4())},
+    ],
+)
+@pytest.mark.asyncio
+async def test_malformed_event_is_dropped(payload):
+    """Test a malformed event is acked instead of failing on every redelivery"""
+    with patch.object(invoice_numbers, "next_number", new_callable=AsyncMock) as next_number:
+        await OrderEventConsumer().handle_message(order_created(**payload))
+
+    next_number.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_redelivered_order_is_invoiced_once(publish):
+    """Test a redelivery creates no second invoice and leaves no numbering gap"""
+    consumer = OrderEventConsumer()
+    order_id = uuid4()
+    msg = order_created(order_id=str(order_id), total_amount=120.0)
+
+    try:
+        await consumer.handle_message(msg)
+
+        # The number the redelivery draws must go back to the allocator
+        expected = await invoice_numbers.next_number()
+        invoice_numbers.release(expected)
+
+        await consumer.handle_message(msg)
+        assert await invoice_numbers.next_number() == expected
+        invoice_numbers.release(expected)
+
+        async with async_session_maker() as session:
+            invoices = await session.scalar(
+                select(func.count()).where(Invoice.source_order_id == order_id)
+            )
+        assert invoices == 1
+        assert publish.await_count == 1
+    finally:
+        await invoice_numbers.reconcile(shutdown=True)
@@ -0,0 +1,107 @@
+"""Tests for the overdue invoice sweeper"""
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete
+
+from app.database import async_session_maker
+from app.jobs.overdue_sweeper import OverdueInvoiceSweeper
+from app.models import Invoice, OverdueSweepState
+
+TODAY = date(2026, 3, 10)
+
+
+@pytest.fixture
+async def session():
+    """Session with the sweep marks cleared before and after each test"""
+    async with async_session_maker() as session:
+        await session.execute(delete(OverdueSweepState))
+        await session.commit()
+        yield session
+        await session.rollback()
+        await session.execute(delete(OverdueSweepState))
+        await session.commit()
+
+
+@pytest.fixture(autouse=True)
+def publish():
+    with patch(
+        "app.jobs.overdue_sweeper.nats_client.publish", new_callable=AsyncMock
+    ) as publish:
+        yield publish
+
+
+async def set_marks(session, due_before, created_before):
+    session.add(
+        OverdueSweepState(id=1, due_before=due_before, created_before=created_before)
+    )
+    await session.commit()
+
+
+async def add_invoice(session, due_date, created_at):
+    invoice = Invoice(
+        order_id=uuid4(),
+        amount=100,
+        status="issued",
+        due_date=due_date,
+        created_at=created_at,
+    )
+    session.add(invoice)
+    await session.commit()
+    return invoice.id
+
+
+async def status_of(session, invoice_id):
+    invoice = await session.get(Invoice, invoice_id, populate_existing=True)
+    return invoice.status
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+@pytest.mark.asyncio
+async def test_sweep_flips_newly_past_due_range(session, publish):
+    """Test due dates passed since the last run are flipped, later ones are not"""
+    await set_marks(session, TODAY - timedelta(days=3), utcnow())
+    due = await add_invoice(session, TODAY - timedelta(days=2), utcnow() - timedelta(days=40))
+    not_due = await add_invoice(session, TODAY, utcnow() - timedelta(days=40))
+
+    assert await OverdueInvoiceSweeper().sweep(TODAY) >= 1
+
+    assert await status_of(session, due) == "overdue"
+    assert await status_of(session, not_due) == "issued"
+    assert str(due) in [call.args[1]["invoice_id"] for call in publish.await_args_list]
+
+    state = await session.get(OverdueSweepState, 1, populate_existing=True)
+    assert state.due_before == TODAY
+
+
+@pytest.mark.asyncio
+async def test_sweep_picks_up_backdated_invoice(session):
+    """Test an invoice created after the last run with an old due date is flipped"""
+    await set_marks(session, TODAY, utcnow() - timedelta(hours=1))
+    backdated = await add_invoice(session, TODAY - timedelta(days=30), utcnow())
+
+    await OverdueInvoiceSweeper().sweep(TODAY)
+
+    assert await status_of(session, backdated) == "overdue"
+
+
+@pytest.mark.asyncio
+async def test_repeat_sweeps_skip_rows_behind_both_marks(session):
+    """Test an old issued row behind both marks is not rescanned"""
+    sweeper = OverdueInvoiceSweeper()
+    old = await add_invoice(
+        session,
+        TODAY - timedelta(days=30),
+        utcnow() - sweeper.backfill_grace - timedelta(days=1),
+    )
+    await set_marks(session, TODAY, utcnow())
+
+    await sweeper.sweep(TODAY)
+    await sweeper.sweep(TODAY)
+
+    assert await status_of(session, old) == "issued"
@@ -0,0 +1,61 @@
+"""In-memory incremental aggregates merged into DuckDB on each flush"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.sketches import HyperLogLog, TDigest
+
+
+@dataclass
+class SalesCounts:
+    """Order count and revenue accumulated for one bucket since the last flush"""
+
+    total_orders: int = 0
+    total_revenue: float = 0.0
+
+
+@dataclass
+class SalesBucket(SalesCounts):
+    """Sales accumulated for one hour since the last flush, with its customers
+    and order value distribution"""
+
+    customers: HyperLogLog = field(default_factory=HyperLogLog)
+    order_values: TDigest = field(default_factory=TDigest)
+
+
+class SalesAggregator:
+    """Accumulates order_created events per hour and minute bucket between flushes"""
+
+    def __init__(self):
+        self.buckets: Dict[datetime, SalesBucket] = {}
+        self.minutes: Dict[datetime, SalesCounts] = {}
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def add(self, event_timestamp: datetime, order_amount: float, customer_id: Optional[str] = None):
+        """Count one order in its hour and minute buckets"""
+        amount = float(order_amount or 0)
+
+        hour = event_timestamp.replace(minute=0, second=0, microsecond=0)
+        bucket = self.buckets.get(hour)
+        if bucket is None:
+            bucket = self.buckets[hour] = SalesBucket()
+        bucket.total_orders += 1
+        bucket.total_revenue += amount
+        bucket.order_values.add(amount)
+        if customer_id:
+            bucket.customers.add(str(customer_id))
+
+        minute = event_timestamp.replace(second=0, microsecond=0)
+        counts = self.minutes.get(minute)
+        if counts is None:
+            counts = self.minutes[minute] = SalesCounts()
+        counts.total_orders += 1
+        counts.total_revenue += amount
+
+    def drain(self) -> Tuple[Dict[datetime, SalesBucket], Dict[datetime, SalesCounts]]:
+        """Return accumulated (hour, minute) buckets and start over"""
+        buckets, self.buckets = self.buckets, {}
+        minutes, self.minutes = self.minutes, {}
+        return buckets, minutes
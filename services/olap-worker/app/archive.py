@@ -0,0 +1,123 @@
+"""Archival of closed days of raw events to hive-partitioned Parquet"""
+import asyncio
+import glob
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from app.duckdb_client import ARCHIVED_TABLES, duckdb_client, hot_events_sql
+
+
+class EventArchiver:
+    """Moves raw events older than the hot window into Parquet files
+
+    Files are laid out as <archive>/<table>/year=YYYY/month=M/day=D/, one file
+    per archived id range, so re-running after a crash rewrites the same file
+    and late events for an archived day land in a new file next to it. The
+    <table>_all views union each hot table with its archive; filters on the
+    year/month/day columns prune whole partitions.
+    """
+
+    def __init__(self, archive_path: Optional[str] = None, hot_days: Optional[int] = None,
+                 interval_seconds: Optional[int] = None, max_days_per_run: Optional[int] = None):
+        self.archive_path = archive_path or os.getenv("OLAP_ARCHIVE_PATH", "/data/archive")
+        self.hot_days = hot_days or int(os.getenv("OLAP_ARCHIVE_AFTER_DAYS", "7"))
+        self.interval_seconds = interval_seconds or int(os.getenv("OLAP_ARCHIVE_INTERVAL_SECONDS", "3600"))
+        # Bounds how long one run holds the writer thread
+        self.max_days_per_run = max_days_per_run or int(os.getenv("OLAP_ARCHIVE_MAX_DAYS_PER_RUN", "30"))
+
+    async def start(self):
+        """Archive closed days on a fixed interval"""
+        print(f"Started event archiver (every {self.interval_seconds}s, {self.hot_days} hot days)")
+
+        while True:
+            try:
+                await duckdb_client.write(self.archive)
+            except Exception as e:
+                print(f"Event archival failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def archive(self, today: Optional[date] = None) -> Dict[str, int]:
+        """Archive every day before the hot window; runs on the writer thread
+
+        Returns the number of rows archived per table.
+        """
+        cutoff = (today or datetime.utcnow().date()) - timedelta(days=self.hot_days)
+        conn = duckdb_client.conn
+        archived = {}
+        days_left = self.max_days_per_run
+
+        for table in ARCHIVED_TABLES:
+            archived[table] = 0
+            days = conn.execute(f"""
+                SELECT DISTINCT CAST(event_timestamp AS DATE) AS day
+                FROM {table}
+                WHERE event_timestamp < ?
+                ORDER BY day
+                LIMIT ?
+            """, [cutoff, days_left]).fetchall()
+
+            for (day,) in days:
+                archived[table] += self._archive_day(conn, table, day)
+            days_left -= len(days)
+
+        if any(archived.values()):
+            self.refresh_views()
+            conn.execute("CHECKPOINT")
+            print(f"Archived raw events before {cutoff}: {archived}")
+        return archived
+
+    def _archive_day(self, conn, table: str, day: date) -> int:
+        day_range = [day, day + timedelta(days=1)]
+        min_id, max_id, rows = conn.execute(f"""
+            SELECT MIN(id), MAX(id), COUNT(*) FROM {table}
+            WHERE event_timestamp >= ? AND event_timestamp < ?
+        """, day_range).fetchone()
+        if not rows:
+            return 0
+
+        partition = os.path.join(
+            self.archive_path, table, f"year={day.year}", f"month={day.month}", f"day={day.day}"
+        )
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"{table}-{min_id}-{max_id}.parquet")
+        tmp_path = f"{path}.tmp"
+
+        conn.execute(f"""
+            COPY (
+                SELECT * FROM {table}
+                WHERE event_timestamp >= ? AND event_timestamp < ?
+                ORDER BY id
+            ) TO '{tmp_path}' (FORMAT PARQUET)
+        """, day_range)
+        os.replace(tmp_path, path)
+
+        # Only drop rows once their file is in place
+        with duckdb_client.transaction():
+            conn.execute(f"""
+                DELETE FROM {table}
+                WHERE event_timestamp >= ? AND event_timestamp < ?
+            """, day_range)
+            duckdb_client.mark_written(table)
+        return rows
+
+    def refresh_views(self):
+        """(Re)create the <table>_all views over hot rows plus archived Parquet"""
+        conn = duckdb_client.conn
+        for table in ARCHIVED_TABLES:
+            hot = hot_events_sql(table)
+            files = os.path.join(self.archive_path, table, "*", "*", "*", "*.parquet")
+            if glob.glob(files):
+                sql = f"""
+                    {hot}
+                    UNION ALL BY NAME
+                    SELECT * FROM read_parquet('{files}', hive_partitioning = true)
+                """
+            else:
+                sql = hot
+            conn.execute(f"CREATE OR REPLACE VIEW {table}_all AS {sql}")
+        duckdb_client.mark_written(*(f"{table}_all" for table in ARCHIVED_TABLES))
+
+
+# Global archiver instance
+event_archiver = EventArchiver()
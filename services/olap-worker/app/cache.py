@@ -0,0 +1,87 @@
+"""Query result cache invalidated by table ingest watermarks"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional, Tuple
+
+from app.duckdb_client import duckdb_client
+
+
+@dataclass
+class CachedResponse:
+    """Serialised response body and the watermarks it was computed at"""
+
+    body: bytes
+    etag: str
+    watermarks: Tuple[int, ...]
+    created_at: float
+    # Computed over sealed event-time buckets only, so it never goes stale
+    sealed: bool = False
+
+
+class QueryResultCache:
+    """LRU cache of serialised query responses
+
+    Entries are keyed by the normalised SQL and its parameters and remember
+    the ingest watermark of every table the query reads; an entry is stale as
+    soon as any of those watermarks advances. `max_age_seconds` bounds how long
+    results of queries relative to CURRENT_TIMESTAMP can lag the clock.
+    Sealed entries (see app/event_time.py) are final and only leave the cache
+    when evicted.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_age_seconds: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("OLAP_CACHE_MAX_ENTRIES", "256"))
+        self.max_age_seconds = max_age_seconds or float(os.getenv("OLAP_CACHE_MAX_AGE_SECONDS", "60"))
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(scope: str, sql: str, params: Optional[Iterable[Any]] = None) -> str:
+        """Cache key for a query, insensitive to whitespace in the SQL"""
+        normalised = " ".join(sql.split())
+        return json.dumps([scope, normalised, list(params or [])], default=str)
+
+    def watermarks(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """Current ingest watermarks of the given tables"""
+        return tuple(duckdb_client.watermark(table) for table in tables)
+
+    def get(self, key: str, tables: Iterable[str]) -> Optional[CachedResponse]:
+        """Return the entry for key if none of its tables changed since it was stored"""
+        entry = self._entries.get(key)
+        if entry is None or not entry.sealed and (
+            entry.watermarks != self.watermarks(tables)
+            or time.monotonic() - entry.created_at > self.max_age_seconds
+        ):
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, body: bytes, watermarks: Tuple[int, ...], sealed: bool = False) -> CachedResponse:
+        """Store a response computed while the tables were at `watermarks`"""
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.sha1(body).hexdigest()}"',
+            watermarks=watermarks,
+            created_at=time.monotonic(),
+            sealed=sealed,
+        )
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Global cache instance
+query_cache = QueryResultCache()
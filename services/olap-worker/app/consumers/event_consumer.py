@@ -1,33 +1,64 @@
 """OLAP Event Consumer - Processes domain events and materializes to DuckDB"""
 import json
+import os
 import asyncio
 from datetime import datetime
-from typing import Set
+from typing import Dict, List, Optional, Set, Tuple
 from nats.js.api import ConsumerConfig, AckPolicy
 
 from app.nats_client import nats_client
 from app.duckdb_client import duckdb_client
+from app.ingest import ORDER_LINE_ITEM, IngestBuffer, coerce_value
+from app.aggregates import SalesAggregator
+from app.event_time import SALES_AGGREGATE, EventTimeWatermark
+from app.live import live_aggregates, read_ar_deltas, read_sales_hours
 
 
 class OLAPEventConsumer:
     """Consumes all domain events and materializes to DuckDB OLAP tables"""
 
+    SUBJECTS = [
+        "orders.order_created",
+        "orders.order_updated",
+        "orders.stock_reserved",
+        "orders.reservation_failed",
+        "orders.invoice_created",
+    ]
+
+    # Raw table each subject is materialised into
+    SUBJECT_TABLES: Dict[str, str] = {
+        "orders.order_created": "order_events",
+        "orders.order_updated": "order_events",
+        "orders.stock_reserved": "stock_events",
+        "orders.reservation_failed": "stock_events",
+        "orders.invoice_created": "invoice_events",
+    }
+
     def __init__(self):
-        self.processed_events: Set[str] = set()  # Idempotency tracking
         self.consumer_name = "olap-worker"
+        self.fetch_batch_size = int(os.getenv("OLAP_FETCH_BATCH_SIZE", "256"))
+        self.buffer = IngestBuffer()
+        self.sales = SalesAggregator()
+        # Late orders of sealed hours, merged into sales_corrections
+        self.corrections = SalesAggregator()
+        self.event_time = EventTimeWatermark()
+        # Last stream sequence committed per table (mirrors ingest_watermarks)
+        self.watermarks: Dict[str, int] = {}
+        # Messages whose rows are buffered but not yet flushed (acked after flush)
+        self.pending: List[Tuple[object, int]] = []
+        self.pending_seqs: Set[int] = set()
+        self.pending_watermarks: Dict[str, int] = {}
 
     async def start(self):
         """Start consuming events from all subjects"""
         print("Starting OLAP event consumer...")
+        self.watermarks = await duckdb_client.read(duckdb_client.get_stream_watermarks)
+        print(f"Resuming from stream watermarks: {self.watermarks}")
+        self.event_time.load(await duckdb_client.read(duckdb_client.get_event_time_state, SALES_AGGREGATE))
+        print(f"Sales sealed through {self.event_time.sealed_through}")
 
         # Subscribe to all order-related events
-        subjects = [
-            "orders.order_created",
-            "orders.order_updated",
-            "orders.stock_reserved",
-            "orders.reservation_failed",
-            "orders.invoice_created",
-        ]
+        subjects = self.SUBJECTS
 
         # Create durable pull-based consumer
         try:
@@ -45,22 +76,32 @@ class OLAPEventConsumer:
 
             print(f"Subscribed to subjects: {subjects}")
 
-            # Continuously fetch and process messages
+            # Continuously fetch, buffer and flush messages
             while True:
                 try:
-                    # Fetch up to 10 messages with 5 second timeout
-                    messages = await consumer.fetch(batch=10, timeout=5)
+                    # Wait no longer than the flush latency so time-based flushes fire
+                    messages = await consumer.fetch(
+                        batch=self.fetch_batch_size,
+                        timeout=self.buffer.max_latency_seconds,
+                    )
 
                     for msg in messages:
                         await self.handle_message(msg)
 
                 except asyncio.TimeoutError:
                     # No messages available, continue polling
-                    continue
+                    pass
                 except Exception as e:
                     print(f"Error fetching messages: {e}")
                     await asyncio.sleep(5)
 
+                try:
+                    if self.buffer.should_flush():
+                        await self.flush()
+                except Exception as e:
+                    print(f"Error flushing batch: {e}")
+                    await asyncio.sleep(5)
+
         except Exception as e:
             print(f"Error setting up consumer: {e}")
             raise
@@ -69,42 +110,101 @@ class OLAPEventConsumer:
         """Process a single NATS message"""
         try:
             subject = msg.subject
-            payload = json.loads(msg.data.decode())
-            event_id = payload.get("event_id", f"{subject}:{payload.get('order_id', 'unknown')}")
+            seq = msg.metadata.sequence.stream
+            table = self.SUBJECT_TABLES.get(subject)
 
-            # Idempotency check
-            if event_id in self.processed_events:
-                print(f"Skipping duplicate event: {event_id}")
+            # Idempotency check: already committed, or redelivered while still buffered
+            if table and seq <= self.watermarks.get(table, 0):
+                print(f"Skipping already applied event: {subject} #{seq}")
                 await msg.ack()
                 return
+            if seq in self.pending_seqs:
+                self.pending.append((msg, seq))
+                return
 
-            print(f"Processing event: {subject} - {event_id}")
-
-            # Route to appropriate handler
-            if subject == "orders.order_created":
-                await self.handle_order_created(payload)
-            elif subject == "orders.order_updated":
-                await self.handle_order_updated(payload)
-            elif subject == "orders.stock_reserved":
-                await self.handle_stock_reserved(payload)
-            elif subject == "orders.reservation_failed":
-                await self.handle_reservation_failed(payload)
-            elif subject == "orders.invoice_created":
-                await self.handle_invoice_created(payload)
-            else:
-                print(f"Unknown event type: {subject}")
-
-            # Mark as processed
-            self.processed_events.add(event_id)
-            await msg.ack()
+            payload = json.loads(msg.data.decode())
+            print(f"Processing event: {subject} #{seq}")
+            await self.apply_event(subject, payload)
 
-            print(f"Successfully processed: {event_id}")
+            # Ack once the buffered rows are flushed
+            self.pending.append((msg, seq))
+            self.pending_seqs.add(seq)
+            if table:
+                self.pending_watermarks[table] = max(seq, self.pending_watermarks.get(table, 0))
 
         except Exception as e:
             print(f"Error handling message: {e}")
             # Don't ack on error - message will be redelivered
             await msg.nak()
 
+    async def apply_event(self, subject: str, payload: dict):
+        """Route a decoded event to its handler"""
+        if subject == "orders.order_created":
+            await self.handle_order_created(payload)
+        elif subject == "orders.order_updated":
+            await self.handle_order_updated(payload)
+        elif subject == "orders.stock_reserved":
+            await self.handle_stock_reserved(payload)
+        elif subject == "orders.reservation_failed":
+            await self.handle_reservation_failed(payload)
+        elif subject == "orders.invoice_created":
+            await self.handle_invoice_created(payload)
+        else:
+            print(f"Unknown event type: {subject}")
+
+    async def flush(self):
+        """Write buffered events to DuckDB in one transaction, then ack them"""
+        pending, self.pending = self.pending, []
+        watermarks, self.pending_watermarks = self.pending_watermarks, {}
+        self.pending_seqs = set()
+        sales, sales_minutes = self.sales.drain()
+        corrections, _ = self.corrections.drain()
+        event_time = self.event_time.pending()
+
+        def apply():
+            with duckdb_client.transaction() as conn:
+                duckdb_client.insert_event_batches(batches)
+                duckdb_client.merge_sales_by_hour(sales)
+                duckdb_client.merge_sales_by_minute(sales_minutes)
+                duckdb_client.merge_sales_corrections(corrections)
+                duckdb_client.merge_sales_by_sku_hour(batches.get("order_line_events"))
+                if event_time:
+                    duckdb_client.advance_event_time_state(SALES_AGGREGATE, *event_time)
+                duckdb_client.advance_stream_watermarks(watermarks)
+                return (
+                    read_sales_hours(conn, sales) if live_sales else [],
+                    read_ar_deltas(conn, batches["invoice_events"]) if live_ar else [],
+                )
+
+        changed_hours, ar_deltas = [], []
+        try:
+            # Resets the buffer even if a row fails to convert
+            batches = self.buffer.drain()
+
+            # Read back what changed for /stream subscribers, in the same transaction
+            live_sales = live_aggregates.wants("sales_by_hour")
+            live_ar = live_aggregates.wants("ar") and "invoice_events" in batches
+
+            if batches or sales or corrections or watermarks:
+                changed_hours, ar_deltas = await duckdb_client.write(apply)
+        except Exception:
+            # Nothing was committed - let JetStream redeliver the whole batch
+            self.event_time.rollback()
+            for msg, _ in pending:
+                await msg.nak()
+            raise
+
+        for table, seq in watermarks.items():
+            self.watermarks[table] = max(seq, self.watermarks.get(table, 0))
+        self.event_time.commit()
+        for msg, _ in pending:
+            await msg.ack()
+        live_aggregates.publish_sales_hours(changed_hours)
+        live_aggregates.publish_ar_deltas(ar_deltas)
+
+        if pending:
+            print(f"Flushed {len(pending)} events ({sum(b.num_rows for b in batches.values())} rows)")
+
     async def handle_order_created(self, payload: dict):
         """Handle order_created event"""
         order_id = payload.get("order_id")
@@ -113,8 +213,20 @@ class OLAPEventConsumer:
         status = payload.get("status", "placed")
         event_timestamp = datetime.fromisoformat(payload.get("timestamp"))
 
-        # Insert raw event
-        duckdb_client.insert_order_event(
+        # Lines that don't fit the item struct are dropped; the order itself is kept
+        items = []
+        for item in payload.get("items") or []:
+            try:
+                line = coerce_value(item, ORDER_LINE_ITEM)
+            except (TypeError, ValueError) as e:
+                print(f"Dropping malformed line item of order {order_id}: {e}")
+                continue
+            if line["sku"]:
+                items.append(line)
+
+        # Buffer raw event
+        row = self.buffer.append(
+            "order_events",
             order_id=order_id,
             event_type="order_created",
             customer_id=customer_id,
@@ -122,9 +234,18 @@ class OLAPEventConsumer:
             status=status,
             event_timestamp=event_timestamp,
         )
+        # Line items, exploded into order_line_events when the buffer drains
+        if items:
+            self.buffer.append(
+                "order_line_events",
+                order_id=row["order_id"],
+                customer_id=row["customer_id"],
+                event_timestamp=event_timestamp,
+                items=items,
+            )
 
         # Update sales_by_hour aggregate
-        await self.update_sales_aggregate(event_timestamp, total_amount)
+        await self.update_sales_aggregate(event_timestamp, row["total_amount"], row["customer_id"])
 
     async def handle_order_updated(self, payload: dict):
         """Handle order_updated event"""
@@ -134,8 +255,9 @@ class OLAPEventConsumer:
         status = payload.get("status")
         event_timestamp = datetime.fromisoformat(payload.get("timestamp"))
 
-        # Insert raw event
-        duckdb_client.insert_order_event(
+        # Buffer raw event
+        self.buffer.append(
+            "order_events",
             order_id=order_id,
             event_type="order_updated",
             customer_id=customer_id,
@@ -151,8 +273,9 @@ class OLAPEventConsumer:
         qty_reserved = payload.get("qty_reserved", 0)
         event_timestamp = datetime.fromisoformat(payload.get("timestamp"))
 
-        # Insert raw event
-        duckdb_client.insert_stock_event(
+        # Buffer raw event
+        row = self.buffer.append(
+            "stock_events",
             event_type="stock_reserved",
             sku=sku,
             order_id=order_id,
@@ -163,7 +286,7 @@ class OLAPEventConsumer:
         # Update stock snapshot
         # Note: In production, you'd query OLTP database for current inventory levels
         # For now, we'll just log the reservation
-        print(f"Stock reserved: {sku} - {qty_reserved} units for order {order_id}")
+        print(f"Stock reserved: {sku} - {row['qty_reserved']} units for order {order_id}")
 
     async def handle_reservation_failed(self, payload: dict):
         """Handle reservation_failed event"""
@@ -172,8 +295,9 @@ class OLAPEventConsumer:
         reason = payload.get("reason", "insufficient_stock")
         event_timestamp = datetime.fromisoformat(payload.get("timestamp"))
 
-        # Insert raw event
-        duckdb_client.insert_stock_event(
+        # Buffer raw event
+        self.buffer.append(
+            "stock_events",
             event_type="reservation_failed",
             sku=sku,
             order_id=order_id,
@@ -192,8 +316,9 @@ class OLAPEventConsumer:
         due_date = payload.get("due_date")
         event_timestamp = datetime.fromisoformat(payload.get("timestamp"))
 
-        # Insert raw event
-        duckdb_client.insert_invoice_event(
+        # Buffer raw event
+        row = self.buffer.append(
+            "invoice_events",
             invoice_id=invoice_id,
             order_id=order_id,
             event_type="invoice_created",
@@ -203,29 +328,21 @@ class OLAPEventConsumer:
             event_timestamp=event_timestamp,
         )
 
-        print(f"Invoice created: {invoice_id} for order {order_id} - ${amount}")
-
-    async def update_sales_aggregate(self, event_timestamp: datetime, order_amount: float):
-        """Update sales_by_hour aggregate table"""
-        # Truncate timestamp to hour
-        hour = event_timestamp.replace(minute=0, second=0, microsecond=0)
-
-        # In production, you'd query DuckDB for existing values
-        # For now, we'll use a simple increment approach
-        result = duckdb_client.conn.execute("""
-            SELECT total_orders, total_revenue
-            FROM sales_by_hour
-            WHERE hour = ?
-        """, [hour]).fetchone()
-
-        if result:
-            total_orders = result[0] + 1
-            total_revenue = result[1] + order_amount
-        else:
-            total_orders = 1
-            total_revenue = order_amount
-
-        duckdb_client.upsert_sales_by_hour(hour, total_orders, total_revenue)
+        print(f"Invoice created: {invoice_id} for order {order_id} - ${row['amount']}")
+
+    async def update_sales_aggregate(self, event_timestamp: datetime, order_amount: float,
+                                     customer_id: Optional[str] = None):
+        """Count an order towards sales_by_hour (merged on the next flush)
+
+        Orders for hours already sealed by the event-time watermark go to
+        sales_corrections instead.
+        """
+        if self.event_time.is_late(event_timestamp):
+            self.event_time.late_events += 1
+            self.corrections.add(event_timestamp, order_amount, customer_id)
+            return
+        self.sales.add(event_timestamp, order_amount, customer_id)
+        self.event_time.observe(event_timestamp)
 
 
 # Global consumer instance
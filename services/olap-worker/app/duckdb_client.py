@@ -1,29 +1,265 @@
 """DuckDB Client for OLAP Worker"""
+import asyncio
 import os
+import queue
+import threading
 import duckdb
-from typing import Optional
-from datetime import datetime
+import pyarrow as pa
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+from app.aggregates import SalesBucket, SalesCounts
+from app.sketches import HyperLogLog, TDigest
+
+
+# Raw event tables that are archived, each exposed with its history as <table>_all
+ARCHIVED_TABLES: List[str] = ["order_events", "invoice_events", "stock_events", "order_line_events"]
+
+
+def hot_events_sql(table: str) -> str:
+    """Hot rows of a raw event table with the hive partition columns of its archive"""
+    return f"""
+        SELECT *, year(event_timestamp) AS year, month(event_timestamp) AS month,
+               day(event_timestamp) AS day
+        FROM {table}
+    """
+
+
+class RecordBatchStream:
+    """Arrow record batches of one query, read from its own cursor
+
+    Batches are pulled one at a time on the reader pool, so the result is never
+    materialised as a whole. The cursor is closed once the stream is exhausted
+    or abandoned.
+    """
+
+    def __init__(self, client: "DuckDBClient", cursor: duckdb.DuckDBPyConnection,
+                 reader: pa.RecordBatchReader):
+        self.client = client
+        self.cursor = cursor
+        self.reader = reader
+        self._close_callbacks: List[Callable[[], Any]] = []
+        self._closed = False
+
+    @property
+    def schema(self) -> pa.Schema:
+        return self.reader.schema
+
+    async def __aiter__(self) -> AsyncIterator[pa.RecordBatch]:
+        try:
+            while True:
+                batch = await self.client.read(_read_next_batch, self.reader)
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            self.close()
+
+    def add_close_callback(self, callback: Callable[[], Any]):
+        """Call `callback` once when the stream is closed"""
+        self._close_callbacks.append(callback)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.cursor.close()
+        for callback in self._close_callbacks:
+            callback()
+
+
+def resource_settings(db_path: str) -> Dict[str, Any]:
+    """DuckDB resource profile from the environment, applied at connect time
+
+    Defaults suit a Pi 5 shared with Postgres, NATS and Grafana: a hard memory
+    limit below the container's, two threads, and a size-bounded spill directory
+    next to the database, so large aggregations and sorts go to disk instead of
+    getting the worker OOM-killed.
+    """
+    settings: Dict[str, Any] = {
+        "memory_limit": os.getenv("DUCKDB_MEMORY_LIMIT", "512MB"),
+        "threads": int(os.getenv("DUCKDB_THREADS", "2")),
+        "max_temp_directory_size": os.getenv("DUCKDB_MAX_TEMP_DIRECTORY_SIZE", "8GB"),
+        # Lets aggregations and exports stream without keeping rows in order
+        "preserve_insertion_order": os.getenv("DUCKDB_PRESERVE_INSERTION_ORDER", "false").lower() == "true",
+    }
+    # DuckDB spills to `<database>.tmp` unless told otherwise
+    temp_directory = os.getenv("DUCKDB_TEMP_DIRECTORY")
+    if temp_directory:
+        settings["temp_directory"] = temp_directory
+    elif db_path != ":memory:":
+        settings["temp_directory"] = f"{db_path}.tmp"
+    return settings
+
+
+def _read_next_batch(reader: pa.RecordBatchReader) -> Optional[pa.RecordBatch]:
+    try:
+        return reader.read_next_batch()
+    except StopIteration:
+        return None
 
 
 class DuckDBClient:
-    """DuckDB connection manager for OLAP tables"""
+    """DuckDB connection manager for OLAP tables
+
+    Once started, a single writer thread owns the primary connection and runs
+    every write transaction submitted through `write()`, while queries run via
+    `read()`/`query()` on a thread pool where each thread holds its own cursor.
+    Before `start()` (e.g. in tests) both run inline on the primary connection.
+    """
 
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, reader_threads: Optional[int] = None,
+                 settings: Optional[Dict[str, Any]] = None):
         self.db_path = db_path or os.getenv("DUCKDB_PATH", "/data/pulse_olap.duckdb")
+        self.settings = settings
+        self.reader_threads = reader_threads or int(os.getenv("DUCKDB_READER_THREADS", "4"))
+        self.stream_batch_rows = int(os.getenv("OLAP_STREAM_BATCH_ROWS", "65536"))
         self.conn: Optional[duckdb.DuckDBPyConnection] = None
+        self._write_queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._reader_cursors: List[duckdb.DuckDBPyConnection] = []
+        self._idle_cursors: "queue.Queue[duckdb.DuckDBPyConnection]" = queue.Queue()
+        self._reader_pool: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        # Full customer sketch per recent hour, owned by the writer thread
+        self._hour_sketches: Dict[datetime, HyperLogLog] = {}
+        self._hour_digests: Dict[datetime, TDigest] = {}
+        # Sketches merged by the open transaction, cached only once it commits
+        self._staged_sketches: Optional[Dict[datetime, Tuple[HyperLogLog, TDigest]]] = None
+        self.sketch_retention = timedelta(hours=int(os.getenv("OLAP_SKETCH_CACHE_HOURS", "48")))
+        # Ingest watermark per table, advanced whenever a write to it commits
+        self._watermarks: Dict[str, int] = {}
+        self._dirty_tables: Optional[set] = None
 
     def connect(self):
         """Establish connection to DuckDB"""
-        self.conn = duckdb.connect(self.db_path)
-        print(f"Connected to DuckDB at {self.db_path}")
+        if self.settings is None:
+            self.settings = resource_settings(self.db_path)
+        self.conn = duckdb.connect(self.db_path, config=self.settings)
+        print(f"Connected to DuckDB at {self.db_path} with {self.settings}")
         self._initialize_schema()
 
+    def start(self):
+        """Start the writer thread and the pool of reader cursors"""
+        for _ in range(self.reader_threads):
+            cursor = self.conn.cursor()
+            self._reader_cursors.append(cursor)
+            self._idle_cursors.put(cursor)
+
+        self._reader_pool = ThreadPoolExecutor(
+            max_workers=self.reader_threads,
+            thread_name_prefix="duckdb-reader",
+            initializer=self._init_reader,
+        )
+        self._writer = threading.Thread(
+            target=self._write_loop, name="duckdb-writer", daemon=True
+        )
+        self._writer.start()
+        print(f"DuckDB writer thread started with {self.reader_threads} reader cursors")
+
     def close(self):
         """Close DuckDB connection"""
+        if self._writer:
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+        if self._reader_pool:
+            self._reader_pool.shutdown(wait=True)
+            self._reader_pool = None
+            for cursor in self._reader_cursors:
+                cursor.close()
+            self._reader_cursors = []
+
         if self.conn:
             self.conn.close()
             print("DuckDB connection closed")
 
+    async def write(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run fn on the writer thread, which owns all write transactions"""
+        if self._writer is None:
+            return fn(*args, **kwargs)
+
+        future: Future = Future()
+        self._write_queue.put((fn, args, kwargs, future))
+        return await asyncio.wrap_future(future)
+
+    async def read(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn on a reader thread; inside it, `cursor()` is that thread's cursor"""
+        if self._reader_pool is None:
+            return fn(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, fn, *args)
+
+    async def query(self, sql: str, params: Optional[list] = None) -> Tuple[List[str], List[tuple]]:
+        """Run a read query on a reader cursor and return (columns, rows)"""
+        return await self.read(self._fetch, sql, params)
+
+    async def stream(self, sql: str, params: Optional[list] = None,
+                     batch_size: Optional[int] = None) -> RecordBatchStream:
+        """Run a read query and return its result as a stream of Arrow record batches"""
+        # A dedicated cursor, so pooled reader cursors stay free while the stream is consumed
+        cursor = self.conn.cursor()
+        try:
+            reader = await self.read(
+                lambda: cursor.execute(sql, params or []).fetch_record_batch(
+                    batch_size or self.stream_batch_rows
+                )
+            )
+        except Exception:
+            cursor.close()
+            raise
+        return RecordBatchStream(self, cursor, reader)
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """Connection to use on the current thread (reader cursor or primary)"""
+        return getattr(self._local, "cursor", None) or self.conn
+
+    def prepared_statements(self) -> set:
+        """Names of the statements already PREPAREd on the current thread's cursor"""
+        cursor = self.cursor()
+        prepared = getattr(self._local, "prepared", None)
+        if prepared is None or prepared[0] is not cursor:
+            prepared = self._local.prepared = (cursor, set())
+        return prepared[1]
+
+    def watermark(self, table: str) -> int:
+        """Ingest watermark of a table; changes whenever committed data changes"""
+        return self._watermarks.get(table, 0)
+
+    def mark_written(self, *tables: str):
+        """Record a write, advancing watermarks now or when the open transaction commits"""
+        if self._dirty_tables is not None:
+            self._dirty_tables.update(tables)
+            return
+        for table in tables:
+            self._watermarks[table] = self._watermarks.get(table, 0) + 1
+
+    def _fetch(self, sql: str, params: Optional[list]) -> Tuple[List[str], List[tuple]]:
+        result = self.cursor().execute(sql, params or [])
+        columns = [desc[0] for desc in result.description]
+        return columns, result.fetchall()
+
+    def _init_reader(self):
+        self._local.cursor = self._idle_cursors.get()
+
+    def _write_loop(self):
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+
+            fn, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
     def _initialize_schema(self):
         """Create OLAP tables if they don't exist"""
         # Create sequences first (before tables that use them)
@@ -36,10 +272,95 @@ class DuckDBClient:
         self.conn.execute("""
             CREATE SEQUENCE IF NOT EXISTS stock_events_seq START 1
         """)
+        self.conn.execute("""
+            CREATE SEQUENCE IF NOT EXISTS order_line_events_seq START 1
+        """)
 
         # Sales by hour aggregate
         self.conn.execute("""
             CREATE TABLE IF NOT EXISTS sales_by_hour (
+                hour TIMESTAMP PRIMARY KEY,
+                total_orders INTEGER DEFAULT 0,
+                total_revenue DECIMAL(14,2) DEFAULT 0,
+                avg_order_value DECIMAL(14,2) DEFAULT 0,
+                unique_customers INTEGER DEFAULT 0,
+                customer_sketch BLOB,
+                order_value_sketch BLOB,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Columns added after the table was first shipped
+        self.conn.execute("ALTER TABLE sales_by_hour ADD COLUMN IF NOT EXISTS unique_customers INTEGER DEFAULT 0")
+        self.conn.execute("ALTER TABLE sales_by_hour ADD COLUMN IF NOT EXISTS customer_sketch BLOB")
+        self.conn.execute("ALTER TABLE sales_by_hour ADD COLUMN IF NOT EXISTS order_value_sketch BLOB")
+
+        # Finer and coarser sales rollups (see app/rollups.py)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sales_by_minute (
+                minute TIMESTAMP PRIMARY KEY,
+                total_orders INTEGER DEFAULT 0,
+                total_revenue DECIMAL(14,2) DEFAULT 0,
+                avg_order_value DECIMAL(14,2) DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for level in ("day", "month"):
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS sales_by_{level} (
+                    {level} TIMESTAMP PRIMARY KEY,
+                    total_orders INTEGER DEFAULT 0,
+                    total_revenue DECIMAL(14,2) DEFAULT 0,
+                    avg_order_value DECIMAL(14,2) DEFAULT 0,
+                    unique_customers INTEGER DEFAULT 0,
+                    customer_sketch BLOB,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+        # Last JetStream stream sequence materialised into each table
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_watermarks (
+                table_name VARCHAR PRIMARY KEY,
+                stream_seq BIGINT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # How far each cascaded rollup has absorbed the level below it
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                level VARCHAR PRIMARY KEY,
+                rolled_through TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Units and revenue per SKU and hour, from order line items
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sales_by_sku_hour (
+                hour TIMESTAMP NOT NULL,
+                sku VARCHAR NOT NULL,
+                total_qty BIGINT DEFAULT 0,
+                total_revenue DECIMAL(14,2) DEFAULT 0,
+                order_lines INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (hour, sku)
+            )
+        """)
+
+        # Event-time watermark per aggregate: hours before sealed_through are final
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS event_time_state (
+                aggregate VARCHAR PRIMARY KEY,
+                max_event_time TIMESTAMP NOT NULL,
+                sealed_through TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Orders that arrived after their hour was sealed (see app/event_time.py)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sales_corrections (
                 hour TIMESTAMP PRIMARY KEY,
                 total_orders INTEGER DEFAULT 0,
                 total_revenue DECIMAL(14,2) DEFAULT 0,
@@ -48,6 +369,48 @@ class DuckDBClient:
             )
         """)
 
+        # Complete day/month series: closed buckets plus the not yet rolled-up tail
+        self.conn.execute("""
+            CREATE OR REPLACE VIEW sales_rollup_day AS
+            SELECT CAST(DATE_TRUNC('day', bucket) AS TIMESTAMP) AS day,
+                   SUM(total_orders) AS total_orders,
+                   SUM(total_revenue) AS total_revenue,
+                   SUM(total_revenue) / NULLIF(SUM(total_orders), 0) AS avg_order_value
+            FROM (
+                SELECT day AS bucket, total_orders, total_revenue FROM sales_by_day
+                UNION ALL
+                SELECT hour, total_orders, total_revenue FROM sales_by_hour
+                WHERE hour >= COALESCE(
+                    (SELECT rolled_through FROM rollup_state WHERE level = 'day'),
+                    '-infinity'::TIMESTAMP
+                )
+            )
+            GROUP BY 1
+        """)
+        self.conn.execute("""
+            CREATE OR REPLACE VIEW sales_rollup_month AS
+            SELECT CAST(DATE_TRUNC('month', bucket) AS TIMESTAMP) AS month,
+                   SUM(total_orders) AS total_orders,
+                   SUM(total_revenue) AS total_revenue,
+                   SUM(total_revenue) / NULLIF(SUM(total_orders), 0) AS avg_order_value
+            FROM (
+                SELECT month AS bucket, total_orders, total_revenue FROM sales_by_month
+                UNION ALL
+                SELECT day, total_orders, total_revenue FROM sales_by_day
+                WHERE day >= COALESCE(
+                    (SELECT rolled_through FROM rollup_state WHERE level = 'month'),
+                    '-infinity'::TIMESTAMP
+                )
+                UNION ALL
+                SELECT hour, total_orders, total_revenue FROM sales_by_hour
+                WHERE hour >= COALESCE(
+                    (SELECT rolled_through FROM rollup_state WHERE level = 'day'),
+                    '-infinity'::TIMESTAMP
+                )
+            )
+            GROUP BY 1
+        """)
+
         # Stock snapshot (point-in-time inventory levels)
         self.conn.execute("""
             CREATE TABLE IF NOT EXISTS stock_snapshot (
@@ -72,6 +435,37 @@ class DuckDBClient:
                 days_30 DECIMAL(14,2) DEFAULT 0,
                 days_60 DECIMAL(14,2) DEFAULT 0,
                 days_90_plus DECIMAL(14,2) DEFAULT 0,
+                oldest_invoice_date DATE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Read by the overdue AR queries; missing from databases created before it was added
+        self.conn.execute("ALTER TABLE ar_aging ADD COLUMN IF NOT EXISTS oldest_invoice_date DATE")
+
+        # Dimension snapshots synced from OLTP (see app.snapshot_sync)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS customers (
+                id UUID PRIMARY KEY,
+                name VARCHAR,
+                email VARCHAR,
+                updated_at TIMESTAMP
+            )
+        """)
+
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                sku VARCHAR PRIMARY KEY,
+                name VARCHAR,
+                price DECIMAL(12,2),
+                updated_at TIMESTAMP
+            )
+        """)
+
+        # OLTP updated_at already synced into each snapshot table
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshot_sync_state (
+                table_name VARCHAR PRIMARY KEY,
+                synced_through TIMESTAMP NOT NULL,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
@@ -118,6 +512,38 @@ class DuckDBClient:
             )
         """)
 
+        # Order line items, one row per element of order_created `items`
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_line_events (
+                id INTEGER PRIMARY KEY DEFAULT nextval('order_line_events_seq'),
+                order_id UUID NOT NULL,
+                customer_id UUID,
+                sku VARCHAR NOT NULL,
+                qty INTEGER NOT NULL,
+                price DECIMAL(12,2) NOT NULL,
+                event_timestamp TIMESTAMP NOT NULL,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Hot rows only until the archiver adds its Parquet files (refresh_views)
+        for table in ARCHIVED_TABLES:
+            self.conn.execute(f"CREATE OR REPLACE VIEW {table}_all AS {hot_events_sql(table)}")
+
+        # Read by the stock_movement predefined query; also created by the migrations.
+        # Reads the archive too, so history survives the archiver's deletes.
+        self.conn.execute("""
+            CREATE OR REPLACE VIEW stock_movement_summary AS
+            SELECT sku,
+                   COUNT(*) AS total_reservations,
+                   SUM(qty_reserved) AS total_qty_reserved,
+                   MIN(event_timestamp) AS first_reservation,
+                   MAX(event_timestamp) AS last_reservation
+            FROM stock_events_all
+            WHERE event_type = 'stock_reserved'
+            GROUP BY sku
+        """)
+
         print("DuckDB schema initialized")
 
     def upsert_sales_by_hour(self, hour: datetime, total_orders: int, total_revenue: float):
@@ -129,6 +555,7 @@ class DuckDBClient:
             INSERT OR REPLACE INTO sales_by_hour (hour, total_orders, total_revenue, avg_order_value, updated_at)
             VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
         """, [hour, total_orders, total_revenue, avg_order_value])
+        self.mark_written("sales_by_hour")
 
     def upsert_stock_snapshot(self, sku: str, product_name: str, qty_on_hand: int,
                               reserved_qty: int, reorder_point: int = 10):
@@ -141,6 +568,7 @@ class DuckDBClient:
             (sku, product_name, qty_on_hand, reserved_qty, available_qty, reorder_point, needs_reorder, last_updated)
             VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
         """, [sku, product_name, qty_on_hand, reserved_qty, available_qty, reorder_point, needs_reorder])
+        self.mark_written("stock_snapshot")
 
     def insert_order_event(self, order_id: str, event_type: str, customer_id: str,
                           total_amount: float, status: str, event_timestamp: datetime):
@@ -149,6 +577,7 @@ class DuckDBClient:
             INSERT INTO order_events (order_id, event_type, customer_id, total_amount, status, event_timestamp)
             VALUES (?, ?, ?, ?, ?, ?)
         """, [order_id, event_type, customer_id, total_amount, status, event_timestamp])
+        self.mark_written("order_events")
 
     def insert_invoice_event(self, invoice_id: str, order_id: str, event_type: str,
                             amount: float, status: str, due_date: str, event_timestamp: datetime):
@@ -157,6 +586,7 @@ class DuckDBClient:
             INSERT INTO invoice_events (invoice_id, order_id, event_type, amount, status, due_date, event_timestamp)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """, [invoice_id, order_id, event_type, amount, status, due_date, event_timestamp])
+        self.mark_written("invoice_events")
 
     def insert_stock_event(self, event_type: str, sku: str, order_id: str,
                           qty_reserved: int, event_timestamp: datetime):
@@ -165,23 +595,302 @@ class DuckDBClient:
             INSERT INTO stock_events (event_type, sku, order_id, qty_reserved, event_timestamp)
             VALUES (?, ?, ?, ?, ?)
         """, [event_type, sku, order_id, qty_reserved, event_timestamp])
+        self.mark_written("stock_events")
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed writes on the primary connection as one transaction"""
+        self.conn.execute("BEGIN TRANSACTION")
+        self._dirty_tables = set()
+        self._staged_sketches = {}
+        try:
+            yield self.conn
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            dirty, self._dirty_tables = self._dirty_tables, None
+            self.mark_written(*dirty)
+            staged, self._staged_sketches = self._staged_sketches, None
+            self._cache_hour_sketches(staged)
+        finally:
+            self._dirty_tables = None
+            self._staged_sketches = None
+
+    def insert_event_batches(self, batches: Dict[str, pa.Table]):
+        """Insert buffered raw events, one INSERT ... SELECT per table"""
+        for table, batch in batches.items():
+            columns = ", ".join(batch.column_names)
+            self.conn.register("ingest_batch", batch)
+            try:
+                self.conn.execute(f"""
+                    INSERT INTO {table} ({columns})
+                    SELECT {columns} FROM ingest_batch
+                """)
+            finally:
+                self.conn.unregister("ingest_batch")
+            self.mark_written(table)
+
+    def replace_rows(self, table: str, rows: pa.Table):
+        """Insert or overwrite rows by primary key in a single INSERT OR REPLACE ... SELECT"""
+        columns = ", ".join(rows.column_names)
+        self.conn.register("replace_batch", rows)
+        try:
+            self.conn.execute(f"""
+                INSERT OR REPLACE INTO {table} ({columns})
+                SELECT {columns} FROM replace_batch
+            """)
+        finally:
+            self.conn.unregister("replace_batch")
+        self.mark_written(table)
+
+    def get_stream_watermarks(self) -> Dict[str, int]:
+        """Last applied stream sequence per table"""
+        rows = self.cursor().execute(
+            "SELECT table_name, stream_seq FROM ingest_watermarks"
+        ).fetchall()
+        return dict(rows)
+
+    def advance_stream_watermarks(self, watermarks: Dict[str, int]):
+        """Record applied stream sequences; call inside the transaction that applied them"""
+        if not watermarks:
+            return
+        self.conn.executemany("""
+            INSERT INTO ingest_watermarks (table_name, stream_seq, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (table_name) DO UPDATE SET
+                stream_seq = GREATEST(ingest_watermarks.stream_seq, EXCLUDED.stream_seq),
+                updated_at = now()
+        """, [[table, seq] for table, seq in watermarks.items()])
+
+    def get_snapshot_sync_state(self) -> Dict[str, datetime]:
+        """OLTP updated_at already synced per snapshot table"""
+        rows = self.cursor().execute(
+            "SELECT table_name, synced_through FROM snapshot_sync_state"
+        ).fetchall()
+        return dict(rows)
+
+    def advance_snapshot_sync_state(self, synced_through: Dict[str, datetime]):
+        """Record synced OLTP updated_at marks; call inside the transaction that merged them"""
+        if not synced_through:
+            return
+        self.conn.executemany("""
+            INSERT INTO snapshot_sync_state (table_name, synced_through, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (table_name) DO UPDATE SET
+                synced_through = GREATEST(snapshot_sync_state.synced_through, EXCLUDED.synced_through),
+                updated_at = now()
+        """, [[table, ts] for table, ts in synced_through.items()])
+
+    def get_event_time_state(self, aggregate: str) -> Optional[Tuple[datetime, datetime]]:
+        """(max_event_time, sealed_through) recorded for an aggregate"""
+        return self.cursor().execute(
+            "SELECT max_event_time, sealed_through FROM event_time_state WHERE aggregate = ?",
+            [aggregate],
+        ).fetchone()
+
+    def advance_event_time_state(self, aggregate: str, max_event_time: datetime, sealed_through: datetime):
+        """Record an aggregate's event-time watermark; call inside the transaction that flushed it"""
+        self.conn.execute("""
+            INSERT INTO event_time_state (aggregate, max_event_time, sealed_through, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (aggregate) DO UPDATE SET
+                max_event_time = GREATEST(event_time_state.max_event_time, EXCLUDED.max_event_time),
+                sealed_through = GREATEST(event_time_state.sealed_through, EXCLUDED.sealed_through),
+                updated_at = now()
+        """, [aggregate, max_event_time, sealed_through])
+        self.mark_written("event_time_state")
+
+    def merge_sales_by_minute(self, minutes: Dict[datetime, SalesCounts]):
+        """Add per-minute sales deltas to sales_by_minute in a single upsert"""
+        if minutes:
+            self.upsert_sales_delta("sales_by_minute", "minute", self._counts_delta("minute", minutes))
+
+    def merge_sales_corrections(self, hours: Dict[datetime, SalesCounts]):
+        """Add late orders of sealed hours to sales_corrections in a single upsert"""
+        if hours:
+            self.upsert_sales_delta("sales_corrections", "hour", self._counts_delta("hour", hours))
+
+    @staticmethod
+    def _counts_delta(bucket_column: str, counts: Dict[datetime, SalesCounts]) -> pa.Table:
+        return pa.table({
+            bucket_column: pa.array(list(counts), pa.timestamp("us")),
+            "total_orders": pa.array([c.total_orders for c in counts.values()], pa.int64()),
+            "total_revenue": pa.array([c.total_revenue for c in counts.values()], pa.float64()),
+        })
+
+    def upsert_sales_delta(self, table: str, bucket_column: str, delta: pa.Table):
+        """Add order/revenue deltas to a sales rollup table, keyed by bucket
+
+        `delta` has the bucket column, total_orders and total_revenue, and
+        optionally unique_customers, customer_sketch and order_value_sketch,
+        which replace the stored values (the caller has already merged the
+        sketches).
+        """
+        sketch_columns = [
+            c for c in ("unique_customers", "customer_sketch", "order_value_sketch") if c in delta.column_names
+        ]
+        insert_columns = ", ".join(sketch_columns)
+        sketch_updates = "".join(f"{c} = EXCLUDED.{c},\n" for c in sketch_columns)
+
+        self.conn.register("sales_delta", delta)
+        try:
+            self.conn.execute(f"""
+                INSERT INTO {table}
+                    ({bucket_column}, total_orders, total_revenue, avg_order_value,
+                     {insert_columns + ", " if sketch_columns else ""}updated_at)
+                SELECT {bucket_column}, total_orders, total_revenue, total_revenue / total_orders,
+                       {insert_columns + ", " if sketch_columns else ""}CURRENT_TIMESTAMP
+                FROM sales_delta
+                ON CONFLICT ({bucket_column}) DO UPDATE SET
+                    total_orders = {table}.total_orders + EXCLUDED.total_orders,
+                    total_revenue = {table}.total_revenue + EXCLUDED.total_revenue,
+                    avg_order_value = ({table}.total_revenue + EXCLUDED.total_revenue)
+                        / ({table}.total_orders + EXCLUDED.total_orders),
+                    {sketch_updates}updated_at = now()
+            """)
+        finally:
+            self.conn.unregister("sales_delta")
+        self.mark_written(table)
+
+    def merge_sales_by_sku_hour(self, lines: Optional[pa.Table]):
+        """Add a batch of order lines to sales_by_sku_hour, grouped in one upsert"""
+        if lines is None or not lines.num_rows:
+            return
+
+        self.conn.register("sku_lines", lines)
+        try:
+            self.conn.execute("""
+                INSERT INTO sales_by_sku_hour (hour, sku, total_qty, total_revenue, order_lines, updated_at)
+                SELECT DATE_TRUNC('hour', event_timestamp), sku, SUM(qty), SUM(qty * price), COUNT(*),
+                       CURRENT_TIMESTAMP
+                FROM sku_lines
+                GROUP BY 1, 2
+                ON CONFLICT (hour, sku) DO UPDATE SET
+                    total_qty = sales_by_sku_hour.total_qty + EXCLUDED.total_qty,
+                    total_revenue = sales_by_sku_hour.total_revenue + EXCLUDED.total_revenue,
+                    order_lines = sales_by_sku_hour.order_lines + EXCLUDED.order_lines,
+                    updated_at = now()
+            """)
+        finally:
+            self.conn.unregister("sku_lines")
+        self.mark_written("sales_by_sku_hour")
+
+    def merge_sales_by_hour(self, buckets: Dict[datetime, SalesBucket]):
+        """Add per-hour sales deltas to sales_by_hour in a single upsert
+
+        Customer sketches and order value digests of recently touched hours
+        are cached, so the stored sketches are only read back the first time an
+        hour is seen by this process.
+        """
+        if not buckets:
+            return
+
+        missing = [hour for hour in buckets if hour not in self._hour_sketches]
+        if missing:
+            placeholders = ", ".join("?" for _ in missing)
+            stored = self.conn.execute(f"""
+                SELECT hour, customer_sketch, order_value_sketch FROM sales_by_hour
+                WHERE hour IN ({placeholders})
+            """, missing).fetchall()
+            for hour, sketch, digest in stored:
+                if sketch is not None:
+                    self._hour_sketches[hour] = HyperLogLog.from_bytes(sketch)
+                if digest is not None:
+                    self._hour_digests[hour] = TDigest.from_bytes(digest)
+
+        # Merge into copies: the cache must not see deltas a rollback discards,
+        # or a redelivered batch would be counted twice in the digests
+        merged = {}
+        hours, unique_customers, sketches, digests = [], [], [], []
+        for hour, bucket in buckets.items():
+            cached = self._hour_sketches.get(hour)
+            sketch = HyperLogLog.from_bytes(cached.to_bytes()) if cached else HyperLogLog()
+            sketch.merge(bucket.customers)
+            cached = self._hour_digests.get(hour)
+            digest = TDigest.from_bytes(cached.to_bytes()) if cached else TDigest()
+            digest.merge(bucket.order_values)
+            merged[hour] = (sketch, digest)
+            hours.append(hour)
+            unique_customers.append(sketch.count())
+            sketches.append(sketch.to_bytes())
+            digests.append(digest.to_bytes())
+
+        delta = pa.table({
+            "hour": pa.array(hours, pa.timestamp("us")),
+            "total_orders": pa.array([b.total_orders for b in buckets.values()], pa.int64()),
+            "total_revenue": pa.array([b.total_revenue for b in buckets.values()], pa.float64()),
+            "unique_customers": pa.array(unique_customers, pa.int64()),
+            "customer_sketch": pa.array(sketches, pa.binary()),
+            "order_value_sketch": pa.array(digests, pa.binary()),
+        })
+        self.upsert_sales_delta("sales_by_hour", "hour", delta)
+
+        if self._staged_sketches is not None:
+            self._staged_sketches.update(merged)
+        else:
+            self._cache_hour_sketches(merged)
+
+    def _cache_hour_sketches(self, merged: Dict[datetime, Tuple[HyperLogLog, TDigest]]):
+        """Cache committed hour sketches, dropping hours past the retention window"""
+        if not merged:
+            return
+        for hour, (sketch, digest) in merged.items():
+            self._hour_sketches[hour] = sketch
+            self._hour_digests[hour] = digest
+
+        # Keep sketches only for hours that can still receive events
+        horizon = max(self._hour_sketches) - self.sketch_retention
+        for hour in [h for h in self._hour_sketches if h < horizon]:
+            del self._hour_sketches[hour]
+            self._hour_digests.pop(hour, None)
 
     def get_sales_summary(self, hours: int = 24):
         """Get sales summary for last N hours"""
-        return self.conn.execute(f"""
-            SELECT * FROM sales_by_hour
-            WHERE hour >= CURRENT_TIMESTAMP - INTERVAL '{hours} hours'
+        return self.cursor().execute("""
+            SELECT hour, total_orders, total_revenue, avg_order_value, updated_at
+            FROM sales_by_hour
+            WHERE hour >= CURRENT_TIMESTAMP - to_hours(CAST(? AS INTEGER))
             ORDER BY hour DESC
-        """).fetchall()
+        """, [int(hours)]).fetchall()
 
     def get_low_stock_items(self):
         """Get items that need reordering"""
-        return self.conn.execute("""
+        return self.cursor().execute("""
             SELECT * FROM stock_snapshot
             WHERE needs_reorder = TRUE
             ORDER BY available_qty ASC
         """).fetchall()
 
+    def get_resource_usage(self) -> Dict[str, Any]:
+        """Effective resource settings, buffer memory by component and spill files"""
+        cursor = self.cursor()
+        names = ["memory_limit", "threads", "temp_directory", "max_temp_directory_size",
+                 "preserve_insertion_order"]
+        values = cursor.execute(
+            "SELECT " + ", ".join(f"current_setting('{name}')" for name in names)
+        ).fetchone()
+
+        components = cursor.execute("""
+            SELECT tag, memory_usage_bytes, temporary_storage_bytes
+            FROM duckdb_memory()
+            ORDER BY memory_usage_bytes + temporary_storage_bytes DESC
+        """).fetchall()
+        temp_files = cursor.execute("SELECT path, size FROM duckdb_temporary_files()").fetchall()
+
+        return {
+            "settings": dict(zip(names, values)),
+            "memory_usage_bytes": sum(row[1] for row in components),
+            "temporary_storage_bytes": sum(row[2] for row in components),
+            "components": [
+                {"tag": tag, "memory_usage_bytes": memory, "temporary_storage_bytes": temporary}
+                for tag, memory, temporary in components
+                if memory or temporary
+            ],
+            "temp_files": [{"path": path, "size_bytes": size} for path, size in temp_files],
+        }
+
 
 # Global client instance
 duckdb_client = DuckDBClient()
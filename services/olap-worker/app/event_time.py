@@ -0,0 +1,107 @@
+"""Event-time watermark of the sales aggregates
+
+The watermark trails the highest order timestamp seen by the consumer by the
+allowed lateness. Hours that end at or before the watermark are sealed:
+their rows in sales_by_hour and sales_by_minute (and the day/month rollups
+built from them) no longer change. An order that arrives for a sealed hour is
+still stored as a raw event, but its totals go to sales_corrections instead of
+the sealed bucket.
+
+The consumer tracks the watermark of the events it has buffered, so events in
+the same batch are judged against it, and records it in event_time_state in
+the transaction that flushes them. The rollup cascade folds hours into
+sales_by_day only once that committed watermark has sealed them, however far
+the wall clock is ahead, so results over sealed ranges are final and can be
+cached without expiry.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+
+
+# Aggregate whose progress is tracked in event_time_state
+SALES_AGGREGATE = "sales_by_hour"
+
+# Tables whose rows before the watermark are final
+SEALABLE_TABLES = {"sales_by_minute", "sales_by_hour", "sales_by_day", "sales_by_month"}
+
+
+def to_naive_utc(ts: datetime) -> datetime:
+    """Naive UTC, as stored in DuckDB"""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+class EventTimeWatermark:
+    """Maximum observed event time minus the allowed lateness, sealed per hour"""
+
+    def __init__(self, allowed_lateness_seconds: Optional[float] = None):
+        self.allowed_lateness = timedelta(seconds=allowed_lateness_seconds or float(
+            os.getenv("OLAP_ALLOWED_LATENESS_SECONDS", "300")
+        ))
+        # Committed progress (mirrors event_time_state)
+        self.max_event_time: Optional[datetime] = None
+        self.sealed_through: Optional[datetime] = None
+        # Progress including buffered events not yet flushed
+        self.pending_max_event_time: Optional[datetime] = None
+        self.late_events = 0
+
+    def load(self, state: Optional[Tuple[datetime, datetime]]):
+        """Resume from the (max_event_time, sealed_through) stored in event_time_state"""
+        if state is None:
+            return
+        self.max_event_time, self.sealed_through = state
+        self.pending_max_event_time = self.max_event_time
+
+    def seal_point(self, max_event_time: Optional[datetime]) -> Optional[datetime]:
+        """Start of the first hour that is not sealed at a given max event time"""
+        if max_event_time is None:
+            return None
+        return (max_event_time - self.allowed_lateness).replace(minute=0, second=0, microsecond=0)
+
+    def is_late(self, event_timestamp: datetime) -> bool:
+        """Whether an event belongs to an hour that is (or is about to be) sealed"""
+        sealed_through = self.seal_point(self.pending_max_event_time)
+        return sealed_through is not None and to_naive_utc(event_timestamp) < sealed_through
+
+    def observe(self, event_timestamp: datetime):
+        """Advance the pending watermark with an on-time event
+
+        Timestamps ahead of the clock are capped, so one bad producer clock
+        can't seal hours that are still receiving orders.
+        """
+        ts = min(to_naive_utc(event_timestamp), datetime.utcnow())
+        if self.pending_max_event_time is None or ts > self.pending_max_event_time:
+            self.pending_max_event_time = ts
+
+    def pending(self) -> Optional[Tuple[datetime, datetime]]:
+        """(max_event_time, sealed_through) to record with the next flush, if it advanced"""
+        if self.pending_max_event_time is None or self.pending_max_event_time == self.max_event_time:
+            return None
+        return self.pending_max_event_time, self.seal_point(self.pending_max_event_time)
+
+    def commit(self):
+        """The pending watermark was flushed"""
+        self.max_event_time = self.pending_max_event_time
+        self.sealed_through = self.seal_point(self.max_event_time)
+
+    def rollback(self):
+        """The flush failed; its events will be redelivered and judged again"""
+        self.pending_max_event_time = self.max_event_time
+
+    def is_sealed(self, end: datetime, tables: Iterable[str]) -> bool:
+        """Whether results over tables up to `end` (exclusive) are final"""
+        return (
+            self.sealed_through is not None
+            and to_naive_utc(end) <= self.sealed_through
+            and all(table in SEALABLE_TABLES for table in tables)
+        )
+
+    def stats(self) -> dict:
+        return {
+            "allowed_lateness_seconds": self.allowed_lateness.total_seconds(),
+            "max_event_time": str(self.max_event_time) if self.max_event_time else None,
+            "sealed_through": str(self.sealed_through) if self.sealed_through else None,
+            "late_events": self.late_events,
+        }
@@ -0,0 +1,82 @@
+"""Columnar (Arrow IPC / Parquet) encodings for query results"""
+import io
+from typing import AsyncIterator, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.duckdb_client import RecordBatchStream
+
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# Accept header values mapped to the media type served for them
+COLUMNAR_MEDIA_TYPES = {
+    ARROW_STREAM_MEDIA_TYPE: ARROW_STREAM_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE: PARQUET_MEDIA_TYPE,
+    "application/x-parquet": PARQUET_MEDIA_TYPE,
+}
+
+
+def negotiate_columnar_format(accept: Optional[str]) -> Optional[str]:
+    """Columnar media type requested by an Accept header, or None for JSON"""
+    for value in (accept or "").split(","):
+        media_type = value.split(";")[0].strip().lower()
+        if media_type in COLUMNAR_MEDIA_TYPES:
+            return COLUMNAR_MEDIA_TYPES[media_type]
+    return None
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out the bytes written since the last drain
+
+    tell() keeps counting across drains, so Parquet footer offsets stay valid.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+async def encode_record_batches(stream: RecordBatchStream, media_type: str) -> AsyncIterator[bytes]:
+    """Encode a record batch stream chunk by chunk as Arrow IPC or Parquet
+
+    Each record batch becomes one IPC message or one Parquet row group and is
+    sent as soon as it is encoded.
+    """
+    sink = _ChunkSink()
+    if media_type == PARQUET_MEDIA_TYPE:
+        writer = pq.ParquetWriter(sink, stream.schema)
+    else:
+        writer = pa.ipc.new_stream(sink, stream.schema)
+
+    try:
+        header = sink.drain()
+        if header:
+            yield header
+
+        async for batch in stream:
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+        stream.close()
+
+    yield sink.drain()
@@ -0,0 +1,202 @@
+"""Micro-batching ingest buffer for DuckDB event tables"""
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# Column layout of each raw event table as buffered before a flush
+EVENT_TABLE_SCHEMAS: Dict[str, pa.Schema] = {
+    "order_events": pa.schema([
+        ("order_id", pa.string()),
+        ("event_type", pa.string()),
+        ("customer_id", pa.string()),
+        ("total_amount", pa.float64()),
+        ("status", pa.string()),
+        ("event_timestamp", pa.timestamp("us")),
+    ]),
+    "invoice_events": pa.schema([
+        ("invoice_id", pa.string()),
+        ("order_id", pa.string()),
+        ("event_type", pa.string()),
+        ("amount", pa.float64()),
+        ("status", pa.string()),
+        ("due_date", pa.string()),
+        ("event_timestamp", pa.timestamp("us")),
+    ]),
+    "stock_events": pa.schema([
+        ("event_type", pa.string()),
+        ("sku", pa.string()),
+        ("order_id", pa.string()),
+        ("qty_reserved", pa.int64()),
+        ("event_timestamp", pa.timestamp("us")),
+    ]),
+    "order_line_events": pa.schema([
+        ("order_id", pa.string()),
+        ("customer_id", pa.string()),
+        ("sku", pa.string()),
+        ("qty", pa.int64()),
+        ("price", pa.float64()),
+        ("event_timestamp", pa.timestamp("us")),
+    ]),
+}
+
+# Fields kept from each element of an order_created `items` array
+ORDER_LINE_ITEM = pa.struct([
+    ("sku", pa.string()),
+    ("qty", pa.int64()),
+    ("price", pa.float64()),
+])
+
+# Tables buffered as one row per event with a list column; drain() explodes
+# the list into one row per element, repeating the event's other columns
+EXPLODED_TABLES: Dict[str, Tuple[str, pa.Schema]] = {
+    "order_line_events": ("items", pa.schema([
+        ("order_id", pa.string()),
+        ("customer_id", pa.string()),
+        ("event_timestamp", pa.timestamp("us")),
+        ("items", pa.list_(ORDER_LINE_ITEM)),
+    ])),
+}
+
+
+def coerce_value(value: Any, type_: pa.DataType) -> Any:
+    """Convert a decoded JSON value to what an Arrow column of `type_` accepts
+
+    Raises ValueError or TypeError for values that don't fit, so a malformed
+    event is rejected on its own instead of failing the whole batch at drain.
+    """
+    if value is None:
+        return None
+    if pa.types.is_string(type_):
+        if isinstance(value, (dict, list, bool)):
+            raise TypeError(f"expected a string, got {value!r}")
+        return str(value)
+    if pa.types.is_integer(type_):
+        if isinstance(value, bool):
+            raise TypeError(f"expected an integer, got {value!r}")
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"expected an integer, got {value!r}")
+        return int(number)
+    if pa.types.is_floating(type_):
+        if isinstance(value, bool):
+            raise TypeError(f"expected a number, got {value!r}")
+        return float(value)
+    if pa.types.is_timestamp(type_):
+        return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if pa.types.is_struct(type_):
+        if not isinstance(value, dict):
+            raise TypeError(f"expected an object, got {value!r}")
+        return {field.name: coerce_value(value.get(field.name), field.type) for field in type_}
+    if pa.types.is_list(type_):
+        if not isinstance(value, list):
+            raise TypeError(f"expected a list, got {value!r}")
+        return [coerce_value(element, type_.value_type) for element in value]
+    return value
+
+
+def explode(table: pa.Table, column: str) -> pa.Table:
+    """One row per element of a list-of-struct column, with the struct fields as columns"""
+    lists = table.column(column).combine_chunks()
+    parents = pc.list_parent_indices(lists)
+    elements = pc.list_flatten(lists)
+
+    columns = {
+        name: table.column(name).take(parents)
+        for name in table.column_names if name != column
+    }
+    for index, field in enumerate(elements.type):
+        columns[field.name] = elements.field(index)
+    return pa.table(columns)
+
+
+class IngestBuffer:
+    """Buffers decoded events per table as column arrays until flushed
+
+    A flush is due once `max_events` rows are buffered or the oldest buffered
+    row has waited `max_latency_seconds`.
+    """
+
+    def __init__(self, max_events: Optional[int] = None, max_latency_seconds: Optional[float] = None):
+        self.max_events = max_events or int(os.getenv("OLAP_BATCH_MAX_EVENTS", "500"))
+        self.max_latency_seconds = max_latency_seconds or (
+            int(os.getenv("OLAP_BATCH_MAX_LATENCY_MS", "1000")) / 1000
+        )
+        self._columns: Dict[str, Dict[str, list]] = {}
+        self._size = 0
+        self._oldest: Optional[float] = None
+        self._reset()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def buffered_schema(table: str) -> pa.Schema:
+        """Layout rows of a table are buffered in (one row per event)"""
+        if table in EXPLODED_TABLES:
+            return EXPLODED_TABLES[table][1]
+        return EVENT_TABLE_SCHEMAS[table]
+
+    def append(self, table: str, **values: Any) -> Dict[str, Any]:
+        """Buffer one row for a raw event table (one event, for exploded tables)
+
+        Values are coerced to the column types first and returned; a value
+        that doesn't fit raises ValueError and leaves the buffer unchanged.
+        """
+        row = {}
+        for field in self.buffered_schema(table):
+            try:
+                row[field.name] = coerce_value(values.get(field.name), field.type)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid {table}.{field.name}: {e}") from e
+
+        columns = self._columns[table]
+        for name, column in columns.items():
+            column.append(row[name])
+
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._size += 1
+        return row
+
+    def should_flush(self) -> bool:
+        """Whether the buffer reached its size or latency limit"""
+        if self._size == 0:
+            return False
+        if self._size >= self.max_events:
+            return True
+        return time.monotonic() - self._oldest >= self.max_latency_seconds
+
+    def drain(self) -> Dict[str, pa.Table]:
+        """Return buffered rows as one Arrow table per event table and reset
+
+        The buffer is reset even if conversion fails, so the caller can nak
+        the batch and start over from redelivered events.
+        """
+        tables = {}
+        try:
+            for table, columns in self._columns.items():
+                if not next(iter(columns.values())):
+                    continue
+                if table in EXPLODED_TABLES:
+                    list_column, schema = EXPLODED_TABLES[table]
+                    rows = explode(pa.table(columns, schema=schema), list_column)
+                    if rows.num_rows:
+                        tables[table] = rows.select(EVENT_TABLE_SCHEMAS[table].names)
+                else:
+                    tables[table] = pa.table(columns, schema=EVENT_TABLE_SCHEMAS[table])
+        finally:
+            self._reset()
+        return tables
+
+    def _reset(self):
+        self._columns = {
+            table: {name: [] for name in self.buffered_schema(table).names}
+            for table in EVENT_TABLE_SCHEMAS
+        }
+        self._size = 0
+        self._oldest = None
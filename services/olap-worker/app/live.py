@@ -0,0 +1,164 @@
+"""Live aggregate updates pushed to /stream subscribers
+
+Writers publish what a committed flush changed: sales_by_hour buckets (their
+new totals), low-stock transitions and AR deltas. Every subscriber keeps at
+most one pending update per (topic, key); a subscriber that reads slower than
+updates arrive gets the latest bucket state (or the summed delta) rather than
+a growing backlog. Publishing only happens on the event loop.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pyarrow as pa
+
+
+# Topics a subscriber can ask for
+LIVE_TOPICS: List[str] = ["sales_by_hour", "low_stock", "ar"]
+
+
+class Subscriber:
+    """Pending updates of one stream client, coalesced per key"""
+
+    def __init__(self, topics: Iterable[str], max_pending: int):
+        self.topics = set(topics)
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple[str, str], dict] = {}
+        self.lagged = False
+        self.ready = asyncio.Event()
+
+    def offer(self, topic: str, key: str, payload: dict, additive: bool = False):
+        """Queue an update, replacing (or, if additive, adding to) the pending one for the key"""
+        slot = (topic, key)
+        previous = self.pending.get(slot)
+        if additive and previous is not None:
+            payload = {
+                name: previous[name] + value
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and name in previous
+                else value
+                for name, value in payload.items()
+            }
+        self.pending[slot] = payload
+
+        if len(self.pending) > self.max_pending:
+            # Too far behind even after coalescing; the client has to refetch
+            self.pending.clear()
+            self.lagged = True
+        self.ready.set()
+
+    def drain(self) -> Tuple[bool, List[Tuple[str, dict]]]:
+        """Take the pending updates; returns (lagged, [(topic, payload)])"""
+        lagged, self.lagged = self.lagged, False
+        updates = [(topic, payload) for (topic, _), payload in self.pending.items()]
+        self.pending = {}
+        self.ready.clear()
+        return lagged, updates
+
+
+class LiveAggregates:
+    """Fans committed aggregate changes out to stream subscribers"""
+
+    def __init__(self, max_pending: Optional[int] = None, heartbeat_seconds: Optional[float] = None):
+        self.max_pending = max_pending or int(os.getenv("OLAP_STREAM_MAX_PENDING", "1000"))
+        self.heartbeat_seconds = heartbeat_seconds or float(os.getenv("OLAP_STREAM_HEARTBEAT_SECONDS", "15"))
+        self.subscribers: Set[Subscriber] = set()
+
+    def subscribe(self, topics: Iterable[str]) -> Subscriber:
+        subscriber = Subscriber(topics, self.max_pending)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def wants(self, topic: str) -> bool:
+        """Whether anyone listens to a topic (lets writers skip building updates)"""
+        return any(topic in subscriber.topics for subscriber in self.subscribers)
+
+    def publish(self, topic: str, key: str, payload: dict, additive: bool = False):
+        for subscriber in self.subscribers:
+            if topic in subscriber.topics:
+                subscriber.offer(topic, key, payload, additive)
+
+    def publish_sales_hours(self, rows: List[tuple]):
+        for row in rows:
+            self.publish("sales_by_hour", *sales_hour_update(row))
+
+    def publish_ar_deltas(self, rows: List[tuple]):
+        for row in rows:
+            self.publish("ar", *ar_delta_update(row), additive=True)
+
+    def publish_low_stock(self, transitions: List[tuple]):
+        for row in transitions:
+            self.publish("low_stock", *low_stock_update(row))
+
+
+def sales_hour_update(row: tuple) -> Tuple[str, dict]:
+    """Key and payload for a (hour, total_orders, total_revenue, avg_order_value, unique_customers) row"""
+    hour, total_orders, total_revenue, avg_order_value, unique_customers = row
+    return str(hour), {
+        "hour": str(hour),
+        "total_orders": total_orders,
+        "total_revenue": float(total_revenue),
+        "avg_order_value": float(avg_order_value or 0),
+        "unique_customers": unique_customers,
+    }
+
+
+def ar_delta_update(row: tuple) -> Tuple[str, dict]:
+    """Key and payload for a (customer_id, invoice_count, invoiced_amount) delta"""
+    customer_id, invoices, amount = row
+    return str(customer_id), {
+        "customer_id": customer_id,
+        "invoices": invoices,
+        "invoiced_amount": float(amount or 0),
+    }
+
+
+def low_stock_update(row: tuple) -> Tuple[str, dict]:
+    """Key and payload for a (sku, product_name, available_qty, reorder_point, needs_reorder) row"""
+    sku, product_name, available_qty, reorder_point, needs_reorder = row
+    return sku, {
+        "sku": sku,
+        "product_name": product_name,
+        "available_qty": available_qty,
+        "reorder_point": reorder_point,
+        "needs_reorder": needs_reorder,
+    }
+
+
+def read_sales_hours(conn, hours: Iterable[datetime]) -> List[tuple]:
+    """Current sales_by_hour rows for the given hours"""
+    hours = list(hours)
+    if not hours:
+        return []
+    return conn.execute("""
+        SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers
+        FROM sales_by_hour
+        WHERE hour IN (SELECT UNNEST(?::TIMESTAMP[]))
+        ORDER BY hour
+    """, [hours]).fetchall()
+
+
+def read_ar_deltas(conn, invoices: pa.Table) -> List[tuple]:
+    """Invoice count and amount per customer for a batch of invoice events"""
+    conn.register("ar_invoices", invoices)
+    try:
+        return conn.execute("""
+            SELECT CAST(o.customer_id AS VARCHAR), COUNT(*), SUM(i.amount)
+            FROM ar_invoices i
+            LEFT JOIN (
+                SELECT DISTINCT order_id, customer_id FROM order_events_all
+                WHERE event_type = 'order_created'
+                  AND CAST(order_id AS VARCHAR) IN (SELECT order_id FROM ar_invoices)
+            ) o ON CAST(o.order_id AS VARCHAR) = i.order_id
+            WHERE i.event_type = 'invoice_created'
+            GROUP BY 1
+        """).fetchall()
+    finally:
+        conn.unregister("ar_invoices")
+
+
+# Global live update hub
+live_aggregates = LiveAggregates()
@@ -0,0 +1,150 @@
+"""Query profiling with DuckDB's JSON profiler and a log of slow queries
+
+A profiled query runs with `enable_profiling = 'json'` on its own cursor and
+writes the operator tree to a per-thread file, which is read back once the
+result has been fetched. Every scheduled query is timed and recorded per
+fingerprint (the whitespace-normalised SQL); the slowest fingerprints of the
+recent window are kept with the plan of their latest profiled run. A slow
+fingerprint without a plan is profiled the next time it runs.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+
+
+PROFILE_DIR = tempfile.mkdtemp(prefix="olap-profile-")
+
+
+def fingerprint(sql: str) -> str:
+    """Stable identifier of a query, insensitive to whitespace in the SQL"""
+    normalised = " ".join(sql.split())
+    return hashlib.sha1(normalised.encode()).hexdigest()[:16]
+
+
+def operator_tree(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Trim a DuckDB profiler node (and its children) to timings and cardinalities"""
+    return {
+        "operator": node.get("operator_type") or node.get("operator_name"),
+        "timing_ms": round(node.get("operator_timing", 0.0) * 1000, 3),
+        "cardinality": node.get("operator_cardinality", 0),
+        "rows_scanned": node.get("operator_rows_scanned", 0),
+        "extra_info": node.get("extra_info", {}),
+        "children": [operator_tree(child) for child in node.get("children", [])],
+    }
+
+
+def run_profiled(cursor: duckdb.DuckDBPyConnection, sql: str,
+                 params: Optional[list]) -> Tuple[List[str], List[tuple], Dict[str, Any]]:
+    """Run a query with the JSON profiler enabled on this cursor
+
+    Returns (columns, rows, profile), where profile holds the CPU time and the
+    operator tree. Profiling is switched off again before returning.
+    """
+    path = os.path.join(PROFILE_DIR, f"{threading.get_ident()}.json")
+    cursor.execute("PRAGMA enable_profiling = 'json'")
+    cursor.execute(f"PRAGMA profiling_output = '{path}'")
+    try:
+        result = cursor.execute(sql, params or [])
+        columns = [desc[0] for desc in result.description]
+        rows = result.fetchall()
+    finally:
+        cursor.execute("PRAGMA disable_profiling")
+
+    with open(path) as f:
+        root = json.load(f)
+    return columns, rows, {
+        "cpu_time_ms": round(root.get("cpu_time", 0.0) * 1000, 3),
+        "rows_scanned": root.get("cumulative_rows_scanned", 0),
+        "plan": [operator_tree(child) for child in root.get("children", [])],
+    }
+
+
+@dataclass
+class SlowQuery:
+    """Timings of one query fingerprint in the current window"""
+
+    fingerprint: str
+    sql: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+    last_seen: float = 0.0
+    profile: Optional[Dict[str, Any]] = None
+    profiled_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "sql": " ".join(self.sql.split()),
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "last_ms": round(self.last_ms, 3),
+            "last_seen": self.last_seen,
+            "profiled_at": self.profiled_at,
+            "profile": self.profile,
+        }
+
+
+class SlowQueryLog:
+    """Slowest query fingerprints of a rolling window, with their latest plans"""
+
+    def __init__(self, max_entries: Optional[int] = None, window_seconds: Optional[float] = None,
+                 threshold_ms: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("OLAP_SLOW_QUERY_LOG_SIZE", "20"))
+        self.window_seconds = window_seconds or float(os.getenv("OLAP_SLOW_QUERY_WINDOW_SECONDS", "3600"))
+        self.threshold_ms = threshold_ms or float(os.getenv("OLAP_SLOW_QUERY_MS", "250"))
+        self._entries: Dict[str, SlowQuery] = {}
+        self._lock = threading.Lock()
+
+    def wants_profile(self, key: str) -> bool:
+        """Whether a fingerprint is slow but has no plan yet"""
+        entry = self._entries.get(key)
+        return entry is not None and entry.profile is None and entry.max_ms >= self.threshold_ms
+
+    def record(self, key: str, sql: str, duration_ms: float, profile: Optional[Dict[str, Any]] = None):
+        """Record one run; called from reader threads"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if duration_ms < self.threshold_ms and profile is None:
+                    return
+                entry = self._entries[key] = SlowQuery(key, sql)
+
+            entry.count += 1
+            entry.total_ms += duration_ms
+            entry.max_ms = max(entry.max_ms, duration_ms)
+            entry.last_ms = duration_ms
+            entry.last_seen = now
+            if profile is not None:
+                entry.profile = profile
+                entry.profiled_at = now
+            self._evict(now)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Entries of the window, slowest first"""
+        with self._lock:
+            self._evict(time.time())
+            ranked = sorted(self._entries.values(), key=lambda e: e.max_ms, reverse=True)
+            return [entry.to_dict() for entry in ranked]
+
+    def _evict(self, now: float):
+        for key in [k for k, e in self._entries.items() if now - e.last_seen > self.window_seconds]:
+            del self._entries[key]
+        if len(self._entries) > self.max_entries:
+            ranked = sorted(self._entries.values(), key=lambda e: e.max_ms, reverse=True)
+            for entry in ranked[self.max_entries:]:
+                del self._entries[entry.fingerprint]
+
+
+# Global slow query log
+slow_query_log = SlowQueryLog()
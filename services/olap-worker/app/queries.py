@@ -0,0 +1,222 @@
+"""Typed registry of the predefined OLAP queries
+
+Each named query declares its parameters with a type, default and bounds.
+Request values are validated and converted before anything runs, so a bad
+parameter is a 400 rather than a DuckDB binder error. On every reader cursor
+the SQL is PREPAREd once and then run with EXECUTE, which skips parsing and
+planning on repeated calls.
+
+DuckDB's Python API can't bind parameters to EXECUTE, so the validated
+values are rendered as typed SQL literals (`sql_literal`); only ints,
+floats, booleans, dates, timestamps and quoted strings ever reach the
+statement.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+import duckdb
+from pydantic import TypeAdapter, ValidationError
+
+
+@dataclass(frozen=True)
+class QueryParam:
+    """A typed parameter of a named query, bound as `$name` in its SQL"""
+
+    name: str
+    type: type
+    default: Any = None
+    ge: Optional[Any] = None
+    le: Optional[Any] = None
+
+    def validate(self, value: Any) -> Any:
+        """Convert a request value to the parameter type and check its bounds"""
+        try:
+            value = TypeAdapter(self.type).validate_python(value)
+        except ValidationError:
+            raise ValueError(f"Parameter '{self.name}' must be of type {self.type.__name__}") from None
+        if self.ge is not None and value < self.ge:
+            raise ValueError(f"Parameter '{self.name}' must be >= {self.ge}")
+        if self.le is not None and value > self.le:
+            raise ValueError(f"Parameter '{self.name}' must be <= {self.le}")
+        return value
+
+
+LIMIT = QueryParam("limit", int, default=100, ge=1, le=1000)
+
+# Columnar exports stream their result in record batches, so they aren't held
+# to the JSON cap; a null limit renders as LIMIT NULL and returns every row
+EXPORT_LIMIT = QueryParam("limit", int, ge=1)
+
+
+@dataclass(frozen=True)
+class NamedQuery:
+    """A predefined query: SQL with `$name` parameters and the tables it reads"""
+
+    name: str
+    sql: str
+    params: Tuple[QueryParam, ...]
+    # Tables the query reads (views resolved to their base tables)
+    tables: Tuple[str, ...]
+
+    @property
+    def statement(self) -> str:
+        """Name of the prepared statement on each cursor"""
+        return f"olap_{self.name}"
+
+    def bind(self, values: Optional[Dict[str, Any]] = None, export: bool = False) -> Dict[str, Any]:
+        """Validate request values against the declared parameters, filling defaults
+
+        With export=True the limit is checked against EXPORT_LIMIT instead,
+        and a missing limit means no limit.
+        """
+        values = dict(values or {})
+        unknown = set(values) - {param.name for param in self.params}
+        if unknown:
+            raise ValueError(f"Unknown parameters for {self.name}: {sorted(unknown)}")
+
+        bound = {}
+        for param in self.params:
+            value = values.get(param.name)
+            if export and param.name == EXPORT_LIMIT.name:
+                bound[param.name] = None if value is None else EXPORT_LIMIT.validate(value)
+                continue
+            if value is None:
+                if param.default is None:
+                    raise ValueError(f"Missing parameter '{param.name}' for {self.name}")
+                value = param.default
+            bound[param.name] = param.validate(value)
+        return bound
+
+    def execute(self, cursor: duckdb.DuckDBPyConnection, bound: Dict[str, Any],
+                prepared: set) -> duckdb.DuckDBPyConnection:
+        """Run with bound values, preparing the statement first if this cursor hasn't yet
+
+        `prepared` holds the statement names already prepared on the cursor.
+        """
+        if self.statement not in prepared:
+            cursor.execute(f"PREPARE {self.statement} AS {self.sql}")
+            prepared.add(self.statement)
+        args = ", ".join(f'"{name}" := {sql_literal(value)}' for name, value in bound.items())
+        return cursor.execute(f"EXECUTE {self.statement}({args})")
+
+
+def sql_literal(value: Any) -> str:
+    """Render a validated parameter value as a typed SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return str(int(value))
+    if isinstance(value, float):
+        return f"CAST('{float(value)!r}' AS DOUBLE)"
+    if isinstance(value, datetime):
+        return f"TIMESTAMP '{value.replace(tzinfo=None).isoformat(sep=' ')}'"
+    if isinstance(value, date):
+        return f"DATE '{value.isoformat()}'"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise TypeError(f"Unsupported parameter type: {type(value).__name__}")
+
+
+QUERY_REGISTRY: Dict[str, NamedQuery] = {
+    query.name: query
+    for query in [
+        NamedQuery(
+            "sales_24h",
+            """
+            SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers, updated_at
+            FROM sales_by_hour
+            WHERE hour >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
+            ORDER BY hour DESC
+            LIMIT $limit
+            """,
+            (LIMIT,),
+            ("sales_by_hour",),
+        ),
+        NamedQuery(
+            "sales_7d",
+            """
+            SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers, updated_at
+            FROM sales_by_hour
+            WHERE hour >= CURRENT_TIMESTAMP - INTERVAL '7 days'
+            ORDER BY hour DESC
+            LIMIT $limit
+            """,
+            (LIMIT,),
+            ("sales_by_hour",),
+        ),
+        NamedQuery(
+            "low_stock",
+            """
+            SELECT sku, product_name, qty_on_hand, reserved_qty, available_qty, reorder_point, last_updated
+            FROM stock_snapshot
+            WHERE needs_reorder = TRUE
+            ORDER BY available_qty ASC
+            LIMIT $limit
+            """,
+            (LIMIT,),
+            ("stock_snapshot",),
+        ),
+        NamedQuery(
+            "overdue_ar",
+            """
+            SELECT customer_id, customer_name, total_outstanding, days_30, days_60, days_90_plus,
+                   oldest_invoice_date, DATEDIFF('day', oldest_invoice_date, CURRENT_DATE) AS days_overdue
+            FROM ar_aging
+            WHERE total_outstanding > 0
+            ORDER BY days_overdue DESC
+            LIMIT $limit
+            """,
+            (LIMIT,),
+            ("ar_aging",),
+        ),
+        NamedQuery(
+            "daily_orders",
+            """
+            SELECT day AS order_date, total_orders, total_revenue, avg_order_value
+            FROM sales_rollup_day
+            WHERE day >= CURRENT_DATE - to_days(CAST($days AS INTEGER))
+            ORDER BY order_date DESC
+            LIMIT $limit
+            """,
+            (QueryParam("days", int, default=30, ge=1, le=365), LIMIT),
+            ("sales_by_hour", "sales_by_day"),
+        ),
+        NamedQuery(
+            "stock_movement",
+            """
+            SELECT sku, total_reservations, total_qty_reserved, first_reservation, last_reservation
+            FROM stock_movement_summary
+            ORDER BY total_qty_reserved DESC
+            LIMIT $limit
+            """,
+            (LIMIT,),
+            ("stock_events", "stock_events_all"),
+        ),
+        NamedQuery(
+            "top_customers",
+            """
+            SELECT customer_id, customer_name, total_outstanding
+            FROM ar_aging
+            ORDER BY total_outstanding DESC
+            LIMIT $limit
+            """,
+            (LIMIT,),
+            ("ar_aging",),
+        ),
+        NamedQuery(
+            "revenue_by_day",
+            """
+            SELECT day AS order_date, total_orders, total_revenue, avg_order_value
+            FROM sales_rollup_day
+            WHERE day >= CURRENT_DATE - to_days(CAST($days AS INTEGER))
+            ORDER BY order_date DESC
+            LIMIT $limit
+            """,
+            (QueryParam("days", int, default=365, ge=1, le=3650), LIMIT),
+            ("sales_by_hour", "sales_by_day"),
+        ),
+    ]
+}
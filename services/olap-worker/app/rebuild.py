@@ -0,0 +1,324 @@
+"""Rebuild the OLAP database by replaying the JetStream stream
+
+Usage:
+    python -m app.rebuild [--from-seq N | --since ISO_TIMESTAMP] [--batch-size N] [--no-swap]
+
+Events are replayed through an ephemeral pull consumer (no acks, so the
+durable olap-worker consumer is untouched) into a fresh database file next to
+DUCKDB_PATH. Raw events are bulk-loaded into constraint-free staging tables
+and sales aggregates are skipped during the replay. At the end, the staged
+rows are moved into the indexed tables in one insert per table. The
+aggregates are then recomputed, and the new file is atomically renamed over
+DUCKDB_PATH. The worker must be stopped before the swap: a running worker
+keeps acking events past the replayed sequence into the old file, and those
+would be lost with it. The swap refuses to run while the live file is locked
+by another process; start the worker again afterwards.
+
+The replayed stream sequences are recorded as ingest watermarks, so once the
+worker restarts its durable consumer acks already replayed events without
+applying them twice.
+
+Days that the archiver has already moved to Parquet stay authoritative: staged
+events for those days are dropped and aggregates are computed over hot rows
+plus archive.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from uuid import uuid4
+
+import duckdb
+import pyarrow as pa
+from nats.js.api import AckPolicy, ConsumerConfig, DeliverPolicy
+
+from app.archive import event_archiver
+from app.consumers.event_consumer import OLAPEventConsumer
+from app.duckdb_client import duckdb_client
+from app.event_time import SALES_AGGREGATE
+from app.ingest import EVENT_TABLE_SCHEMAS, IngestBuffer
+from app.nats_client import nats_client
+from app.rollups import rollup_engine
+from app.sketches import HyperLogLog, TDigest
+
+
+STAGING_SUFFIX = "_rebuild"
+
+
+class OLAPRebuilder:
+    """Replays the event stream into a fresh DuckDB file and swaps it in"""
+
+    def __init__(self, batch_size: int = 5000, progress_seconds: float = 5.0):
+        self.batch_size = batch_size
+        self.progress_seconds = progress_seconds
+        self.target_path = duckdb_client.db_path
+        self.rebuild_path = f"{self.target_path}.rebuild"
+        self.consumer = OLAPEventConsumer()
+        # Buffer sized for bulk loading; flushed by count only
+        self.consumer.buffer = IngestBuffer(max_events=batch_size * 4, max_latency_seconds=3600)
+        self.events = 0
+        # Last replayed stream sequence per table, recorded for the live consumer
+        self.watermarks: Dict[str, int] = {}
+
+    async def run(self, from_seq: Optional[int] = None, since: Optional[datetime] = None,
+                  swap: bool = True):
+        """Replay, finalise and (optionally) swap in the rebuilt database"""
+        for path in (self.rebuild_path, f"{self.rebuild_path}.wal"):
+            if os.path.exists(path):
+                os.remove(path)
+
+        duckdb_client.db_path = self.rebuild_path
+        duckdb_client.connect()
+        self.create_staging_tables()
+
+        started = time.monotonic()
+        await nats_client.connect()
+        try:
+            await self.replay(from_seq, since)
+        finally:
+            await nats_client.close()
+        replayed_in = time.monotonic() - started
+
+        self.finalize()
+        duckdb_client.close()
+        print(
+            f"Rebuilt {self.events} events in {time.monotonic() - started:.1f}s "
+            f"(replay {self.events / max(replayed_in, 1e-9):.0f} events/s)"
+        )
+
+        if swap:
+            self.swap()
+        else:
+            print(f"Rebuilt database left at {self.rebuild_path}")
+
+    def create_staging_tables(self):
+        """Constraint-free copies of the raw event tables for bulk loading"""
+        for table, schema in EVENT_TABLE_SCHEMAS.items():
+            duckdb_client.conn.execute(f"""
+                CREATE TABLE {table}{STAGING_SUFFIX} AS
+                SELECT {", ".join(schema.names)} FROM {table} WHERE FALSE
+            """)
+
+    async def replay(self, from_seq: Optional[int], since: Optional[datetime]):
+        """Pull every event up to the stream's current last sequence"""
+        info = await nats_client.js.stream_info(nats_client.stream_name)
+        last_seq = info.state.last_seq
+        if not info.state.messages:
+            print("Stream is empty, nothing to replay")
+            return
+
+        if since:
+            config = ConsumerConfig(
+                deliver_policy=DeliverPolicy.BY_START_TIME,
+                opt_start_time=since.isoformat() + "Z",
+            )
+        else:
+            config = ConsumerConfig(
+                deliver_policy=DeliverPolicy.BY_START_SEQUENCE,
+                opt_start_seq=from_seq or 1,
+            )
+        # Ephemeral: no durable name, no acks, removed by the server once idle
+        config.name = f"olap-rebuild-{uuid4().hex[:8]}"
+        config.ack_policy = AckPolicy.NONE
+        config.filter_subjects = OLAPEventConsumer.SUBJECTS
+        config.inactive_threshold = 60
+
+        await nats_client.js.add_consumer(nats_client.stream_name, config=config)
+        subscription = await nats_client.js.pull_subscribe_bind(
+            config.name, stream=nats_client.stream_name,
+        )
+        print(f"Replaying stream {nats_client.stream_name} through sequence {last_seq}")
+
+        seq = 0
+        started = last_report = time.monotonic()
+        while seq < last_seq:
+            try:
+                messages = await subscription.fetch(batch=self.batch_size, timeout=5)
+            except asyncio.TimeoutError:
+                # Remaining sequences are on subjects we don't consume
+                break
+
+            for msg in messages:
+                seq = msg.metadata.sequence.stream
+                try:
+                    await self.consumer.apply_event(msg.subject, json.loads(msg.data.decode()))
+                except (TypeError, ValueError) as e:
+                    # The live consumer naks these too; one bad event shouldn't stop a rebuild
+                    print(f"Skipping malformed event {msg.subject} #{seq}: {e}")
+                self.watermarks[OLAPEventConsumer.SUBJECT_TABLES[msg.subject]] = seq
+                self.events += 1
+
+            if self.consumer.buffer.should_flush():
+                self.flush()
+
+            now = time.monotonic()
+            if now - last_report >= self.progress_seconds:
+                print(
+                    f"Replayed {self.events} events, seq {seq}/{last_seq} "
+                    f"({100 * seq / last_seq:.1f}%), {self.events / (now - started):.0f} events/s"
+                )
+                last_report = now
+
+        self.flush()
+        await subscription.unsubscribe()
+        await nats_client.js.delete_consumer(nats_client.stream_name, config.name)
+
+    def flush(self):
+        """Append buffered events to the staging tables"""
+        batches = self.consumer.buffer.drain()
+        # Aggregates are recomputed in bulk by finalize()
+        self.consumer.sales.drain()
+        self.consumer.corrections.drain()
+        with duckdb_client.transaction():
+            duckdb_client.insert_event_batches(
+                {f"{table}{STAGING_SUFFIX}": batch for table, batch in batches.items()}
+            )
+
+    def finalize(self):
+        """Move staged rows into the indexed tables and build aggregates"""
+        conn = duckdb_client.conn
+        event_archiver.refresh_views()
+
+        with duckdb_client.transaction():
+            for table, schema in EVENT_TABLE_SCHEMAS.items():
+                staging = f"{table}{STAGING_SUFFIX}"
+                archived_through = self.archived_through(table)
+                if archived_through:
+                    conn.execute(
+                        f"DELETE FROM {staging} WHERE event_timestamp < ?",
+                        [archived_through + timedelta(days=1)],
+                    )
+
+                columns = ", ".join(schema.names)
+                conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}")
+                conn.execute(f"DROP TABLE {staging}")
+
+            # The durable consumer skips everything replayed here
+            duckdb_client.advance_stream_watermarks(self.watermarks)
+
+        print("Building sales aggregates")
+        with duckdb_client.transaction():
+            self.build_sales_aggregates()
+        rollup_engine.cascade()
+
+        event_archiver.refresh_views()
+        conn.execute("CHECKPOINT")
+
+    def archived_through(self, table: str) -> Optional[date]:
+        """Latest day of a table that already lives in the Parquet archive"""
+        days = [
+            path.split(os.sep)[-3:]
+            for path in glob.glob(os.path.join(event_archiver.archive_path, table, "*", "*", "*"))
+        ]
+        dates = [
+            date(*(int(part.split("=")[1]) for part in parts))
+            for parts in days
+        ]
+        return max(dates) if dates else None
+
+    def build_sales_aggregates(self):
+        """Recompute the sales aggregates from all order_created events and order lines
+
+        Late orders are folded into their hours, so sales_corrections starts
+        empty and the event-time watermark resumes from the latest order.
+        """
+        conn = duckdb_client.conn
+        orders = "(SELECT * FROM order_events_all WHERE event_type = 'order_created')"
+
+        conn.execute(f"""
+            INSERT INTO sales_by_minute (minute, total_orders, total_revenue, avg_order_value)
+            SELECT DATE_TRUNC('minute', event_timestamp), COUNT(*), SUM(total_amount), AVG(total_amount)
+            FROM {orders}
+            GROUP BY 1
+        """)
+
+        totals = conn.execute(f"""
+            SELECT DATE_TRUNC('hour', event_timestamp), COUNT(*), SUM(total_amount)
+            FROM {orders}
+            GROUP BY 1
+            ORDER BY 1
+        """).fetchall()
+
+        sketches: Dict[datetime, HyperLogLog] = defaultdict(HyperLogLog)
+        digests: Dict[datetime, TDigest] = defaultdict(TDigest)
+        result = conn.execute(f"""
+            SELECT DATE_TRUNC('hour', event_timestamp), CAST(customer_id AS VARCHAR), total_amount
+            FROM {orders}
+        """)
+        while True:
+            rows = result.fetchmany(self.batch_size)
+            if not rows:
+                break
+            for hour, customer_id, total_amount in rows:
+                if customer_id is not None:
+                    sketches[hour].add(customer_id)
+                digests[hour].add(float(total_amount or 0))
+
+        if totals:
+            hours = [row[0] for row in totals]
+            duckdb_client.upsert_sales_delta("sales_by_hour", "hour", pa.table({
+                "hour": pa.array(hours, pa.timestamp("us")),
+                "total_orders": pa.array([row[1] for row in totals], pa.int64()),
+                "total_revenue": pa.array([float(row[2] or 0) for row in totals], pa.float64()),
+                "unique_customers": pa.array([sketches[h].count() for h in hours], pa.int64()),
+                "customer_sketch": pa.array([sketches[h].to_bytes() for h in hours], pa.binary()),
+                "order_value_sketch": pa.array([digests[h].to_bytes() for h in hours], pa.binary()),
+            }))
+
+        conn.execute("""
+            INSERT INTO sales_by_sku_hour (hour, sku, total_qty, total_revenue, order_lines)
+            SELECT DATE_TRUNC('hour', event_timestamp), sku, SUM(qty), SUM(qty * price), COUNT(*)
+            FROM order_line_events_all
+            GROUP BY 1, 2
+        """)
+
+        max_event_time = conn.execute(f"SELECT MAX(event_timestamp) FROM {orders}").fetchone()[0]
+        if max_event_time:
+            event_time = self.consumer.event_time
+            duckdb_client.advance_event_time_state(
+                SALES_AGGREGATE, max_event_time, event_time.seal_point(max_event_time)
+            )
+
+    def swap(self):
+        """Atomically replace the live database file with the rebuilt one
+
+        Raises RuntimeError, leaving both files in place, while the live file
+        is open in another process.
+        """
+        if os.path.exists(self.target_path):
+            try:
+                duckdb.connect(self.target_path).close()
+            except duckdb.IOException as e:
+                raise RuntimeError(
+                    f"{self.target_path} is in use; stop the OLAP worker before swapping "
+                    f"(rebuilt database left at {self.rebuild_path})"
+                ) from e
+
+        # A WAL left by the old file must not be replayed onto the new one
+        stale_wal = f"{self.target_path}.wal"
+        if os.path.exists(stale_wal):
+            os.remove(stale_wal)
+        os.replace(self.rebuild_path, self.target_path)
+        print(f"Swapped rebuilt database into {self.target_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the OLAP DuckDB file from JetStream")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--from-seq", type=int, help="Stream sequence to start from (default 1)")
+    start.add_argument("--since", type=datetime.fromisoformat, help="Replay events stored since this UTC time")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Messages per fetch")
+    parser.add_argument("--no-swap", action="store_true", help="Leave the rebuilt file next to the live one")
+    args = parser.parse_args()
+
+    rebuilder = OLAPRebuilder(batch_size=args.batch_size)
+    asyncio.run(rebuilder.run(from_seq=args.from_seq, since=args.since, swap=not args.no_swap))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Multi-resolution sales rollups (minute -> hour -> day -> month)
+
+sales_by_minute and sales_by_hour are maintained live by the ingest flush.
+Day and month buckets are derived from the level below once its buckets
+close: the cascade folds every closed child bucket past the parent's
+`rolled_through` mark into the parent table in one transaction, so each child
+row is read exactly once. An hour is closed only once the consumer's committed
+event-time watermark has sealed it; until then a lagging consumer may still
+add on-time orders to it. The sales_rollup_day/_month views add the not yet
+folded tail, so every level always covers up to the latest flush.
+"""
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+
+from app.duckdb_client import duckdb_client
+from app.event_time import SALES_AGGREGATE
+from app.sketches import HyperLogLog
+
+
+# Finest to coarsest
+ROLLUP_LEVELS: List[str] = ["minute", "hour", "day", "month"]
+
+# Table each level is read from for range queries
+ROLLUP_SOURCES: Dict[str, str] = {
+    "minute": "sales_by_minute",
+    "hour": "sales_by_hour",
+    "day": "sales_rollup_day",
+    "month": "sales_rollup_month",
+}
+
+# Levels derived by the cascade, mapped to the level they are folded from
+CASCADE_CHILDREN: Dict[str, str] = {
+    "day": "hour",
+    "month": "day",
+}
+
+# Nominal bucket width, used to estimate how many rows a range returns
+LEVEL_WIDTHS: Dict[str, timedelta] = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "month": timedelta(days=30),
+}
+
+
+def truncate(ts: datetime, level: str) -> datetime:
+    """Start of the level bucket containing ts"""
+    ts = ts.replace(second=0, microsecond=0)
+    if level == "minute":
+        return ts
+    ts = ts.replace(minute=0)
+    if level == "hour":
+        return ts
+    ts = ts.replace(hour=0)
+    if level == "day":
+        return ts
+    return ts.replace(day=1)
+
+
+class RollupEngine:
+    """Cascades closed sales buckets into coarser rollup tables"""
+
+    def __init__(self, grace_seconds: Optional[int] = None, interval_seconds: Optional[int] = None,
+                 max_points: Optional[int] = None):
+        # How long after a bucket ends late events may still arrive for it
+        self.grace = timedelta(
+            seconds=grace_seconds or int(os.getenv("OLAP_ROLLUP_GRACE_SECONDS", "300"))
+        )
+        self.interval_seconds = interval_seconds or int(os.getenv("OLAP_ROLLUP_INTERVAL_SECONDS", "60"))
+        self.max_points = max_points or int(os.getenv("OLAP_ROLLUP_MAX_POINTS", "500"))
+
+    async def start(self):
+        """Run the cascade on a fixed interval"""
+        print(f"Started rollup cascade (every {self.interval_seconds}s)")
+
+        while True:
+            try:
+                await duckdb_client.write(self.cascade)
+            except Exception as e:
+                print(f"Rollup cascade failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def cascade(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Fold every closed bucket into the next level up; runs on the writer thread
+
+        Returns the number of parent buckets touched per level.
+        """
+        # Child buckets ending before this are closed
+        closed_through = (now or datetime.utcnow()) - self.grace
+        touched = {level: 0 for level in CASCADE_CHILDREN}
+
+        with duckdb_client.transaction() as conn:
+            # Hours past the event-time seal can still receive orders
+            sealed_through = self.sealed_through(conn)
+            if sealed_through is None:
+                return touched
+            closed_through = min(closed_through, sealed_through)
+
+            for level, child in CASCADE_CHILDREN.items():
+                touched[level] = self._fold(conn, level, child, closed_through)
+                # The next level may only absorb what this level has absorbed
+                closed_through = min(closed_through, self.rolled_through(conn, level) or closed_through)
+
+        return touched
+
+    def sealed_through(self, conn) -> Optional[datetime]:
+        """Start of the first sales hour not yet sealed, as committed by the consumer"""
+        row = conn.execute(
+            "SELECT sealed_through FROM event_time_state WHERE aggregate = ?", [SALES_AGGREGATE]
+        ).fetchone()
+        return row[0] if row else None
+
+    def rolled_through(self, conn, level: str) -> Optional[datetime]:
+        """End of the child range already folded into a level"""
+        row = conn.execute(
+            "SELECT rolled_through FROM rollup_state WHERE level = ?", [level]
+        ).fetchone()
+        return row[0] if row else None
+
+    def _fold(self, conn, level: str, child: str, closed_through: datetime) -> int:
+        child_table = f"sales_by_{child}"
+        since = self.rolled_through(conn, level)
+        if since is None:
+            first = conn.execute(f"SELECT MIN({child}) FROM {child_table}").fetchone()[0]
+            if first is None:
+                return 0
+            since = truncate(first, child)
+
+        # Only whole child buckets that ended before closed_through
+        until = truncate(closed_through, child)
+        if until <= since:
+            return 0
+
+        rows = conn.execute(f"""
+            SELECT CAST(DATE_TRUNC('{level}', {child}) AS TIMESTAMP) AS bucket,
+                   SUM(total_orders), SUM(total_revenue)
+            FROM {child_table}
+            WHERE {child} >= ? AND {child} < ?
+            GROUP BY 1
+        """, [since, until]).fetchall()
+
+        if rows:
+            sketches = self._merged_sketches(conn, level, child, since, until)
+            buckets = [row[0] for row in rows]
+            delta = pa.table({
+                level: pa.array(buckets, pa.timestamp("us")),
+                "total_orders": pa.array([row[1] for row in rows], pa.int64()),
+                "total_revenue": pa.array([float(row[2]) for row in rows], pa.float64()),
+                "unique_customers": pa.array(
+                    [sketches[b].count() for b in buckets], pa.int64()
+                ),
+                "customer_sketch": pa.array(
+                    [sketches[b].to_bytes() for b in buckets], pa.binary()
+                ),
+            })
+            duckdb_client.upsert_sales_delta(f"sales_by_{level}", level, delta)
+
+        conn.execute("""
+            INSERT OR REPLACE INTO rollup_state (level, rolled_through, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        """, [level, until])
+        return len(rows)
+
+    def _merged_sketches(self, conn, level: str, child: str, since: datetime,
+                         until: datetime) -> Dict[datetime, HyperLogLog]:
+        """Stored parent sketches merged with the sketches of the folded children"""
+        sketches: Dict[datetime, HyperLogLog] = defaultdict(HyperLogLog)
+
+        child_sketches = conn.execute(f"""
+            SELECT CAST(DATE_TRUNC('{level}', {child}) AS TIMESTAMP), customer_sketch
+            FROM sales_by_{child}
+            WHERE {child} >= ? AND {child} < ? AND customer_sketch IS NOT NULL
+        """, [since, until]).fetchall()
+        for bucket, blob in child_sketches:
+            sketches[bucket].merge(HyperLogLog.from_bytes(blob))
+
+        parent_sketches = conn.execute(f"""
+            SELECT {level}, customer_sketch FROM sales_by_{level}
+            WHERE {level} >= ? AND {level} < ? AND customer_sketch IS NOT NULL
+        """, [truncate(since, level), until]).fetchall()
+        for bucket, blob in parent_sketches:
+            sketches[bucket].merge(HyperLogLog.from_bytes(blob))
+
+        return sketches
+
+    def choose_level(self, start: datetime, end: datetime) -> str:
+        """Finest level that answers the range in at most `max_points` rows"""
+        for level in ROLLUP_LEVELS:
+            if (end - start) / LEVEL_WIDTHS[level] <= self.max_points:
+                return level
+        return ROLLUP_LEVELS[-1]
+
+
+# Global rollup engine
+rollup_engine = RollupEngine()
@@ -0,0 +1,153 @@
+"""Grafana JSON datasource API
+
+Implements the SimpleJSON protocol (`/`, `/search`, `/query`) on top of the
+aggregate semantic layer. The dashboard's time range is pushed into the
+DuckDB WHERE clause, the bucket size follows the panel interval (so long
+ranges read day or month rollups), and each series is downsampled with LTTB
+to at most `maxDataPoints` before it leaves the worker.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.consumers.event_consumer import olap_consumer
+from app.downsample import lttb
+from app.rollups import LEVEL_WIDTHS, ROLLUP_LEVELS
+from app.routers.query import cached_response
+from app.scheduler import QueryAdmissionError, query_scheduler
+from app.schemas import (
+    AggregateMeasure,
+    GrafanaQueryRequest,
+    GrafanaQueryResponse,
+    GrafanaSeries,
+)
+from app.semantic import TIME_DIMENSION, compile_aggregate
+
+
+router = APIRouter(prefix="/grafana", tags=["Grafana"])
+
+# Upper bound on buckets read per series before downsampling
+MAX_BUCKETS = int(os.getenv("OLAP_GRAFANA_MAX_BUCKETS", "10000"))
+
+
+def choose_grain(start: datetime, end: datetime, interval: timedelta) -> str:
+    """Coarsest rollup level no wider than the panel interval
+
+    Falls back to coarser levels while the range would span more than
+    MAX_BUCKETS buckets.
+    """
+    grain = ROLLUP_LEVELS[0]
+    for level in ROLLUP_LEVELS:
+        if LEVEL_WIDTHS[level] <= interval:
+            grain = level
+
+    index = ROLLUP_LEVELS.index(grain)
+    while (end - start) / LEVEL_WIDTHS[grain] > MAX_BUCKETS and index < len(ROLLUP_LEVELS) - 1:
+        index += 1
+        grain = ROLLUP_LEVELS[index]
+    return grain
+
+
+def parse_grafana_time(value: str) -> datetime:
+    """Epoch milliseconds (`${__from}`) or ISO 8601 timestamp as naive UTC"""
+    if value.isdigit():
+        return datetime.utcfromtimestamp(int(value) / 1000)
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return to_utc(ts)
+
+
+def to_utc(ts: datetime) -> datetime:
+    """Naive UTC, as stored in DuckDB"""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def epoch_ms(ts: datetime) -> int:
+    return int(ts.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+async def series_response(request: Request, targets: List[str], start: datetime, end: datetime,
+                          interval_ms: Optional[int], max_points: int) -> Response:
+    """Query, downsample and serve one series per target"""
+    if end <= start:
+        raise HTTPException(status_code=400, detail="to must be after from")
+
+    interval = timedelta(milliseconds=interval_ms) if interval_ms else (end - start) / max_points
+    grain = choose_grain(start, end, interval)
+    try:
+        compiled = [
+            compile_aggregate([target], [TIME_DIMENSION], {}, start, end, grain, MAX_BUCKETS)
+            for target in targets
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def build():
+        series = []
+        for target, query in zip(targets, compiled):
+            _, rows = await query_scheduler.query(query.sql, query.params, query.source.tables)
+            points = [(epoch_ms(row[0]), float(row[1])) for row in rows if row[1] is not None]
+            series.append(GrafanaSeries(
+                target=target,
+                datapoints=[(value, int(ts)) for ts, value in lttb(points, max_points)],
+            ))
+        return GrafanaQueryResponse(series)
+
+    sql = "\n;\n".join(query.sql for query in compiled)
+    params = [max_points] + [param for query in compiled for param in query.params]
+    tables = sorted({table for query in compiled for table in query.source.tables})
+    try:
+        sealed = all(olap_consumer.event_time.is_sealed(query.end, query.source.tables) for query in compiled)
+        return await cached_response(request, sql, params, tables, build, sealed)
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/")
+async def test_connection():
+    """Datasource health check"""
+    return JSONResponse(content={"status": "ok"})
+
+
+@router.post("/search")
+async def search():
+    """Metric names a panel can query"""
+    return JSONResponse(content=[measure.value for measure in AggregateMeasure])
+
+
+@router.post("/query", response_model=GrafanaQueryResponse)
+async def query(body: GrafanaQueryRequest, request: Request):
+    """Time series for each target over the dashboard range"""
+    return await series_response(
+        request,
+        [target.target.value for target in body.targets],
+        to_utc(body.range.from_),
+        to_utc(body.range.to),
+        body.intervalMs,
+        body.maxDataPoints,
+    )
+
+
+@router.get("/query", response_model=GrafanaQueryResponse)
+async def query_get(
+    request: Request,
+    target: List[AggregateMeasure] = Query(..., description="Metric(s) to plot"),
+    from_: str = Query(..., alias="from", description="Range start, epoch ms or ISO 8601"),
+    to: str = Query(..., description="Range end, epoch ms or ISO 8601"),
+    maxDataPoints: int = Query(500, ge=3, le=10000),
+    intervalMs: Optional[int] = Query(None, ge=1),
+):
+    """Same as POST /grafana/query, for the JSON API datasource (`from=${__from}&to=${__to}`)"""
+    try:
+        start, end = parse_grafana_time(from_), parse_grafana_time(to)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from/to must be epoch milliseconds or ISO 8601")
+    return await series_response(
+        request, [measure.value for measure in target], start, end, intervalMs, maxDataPoints,
+    )
@@ -1,16 +1,36 @@
 """OLAP Query API Router"""
 import time
-from typing import Dict, Any, List
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
-
-from app.duckdb_client import duckdb_client
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Any, List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from app.cache import query_cache
+from app.consumers.event_consumer import olap_consumer
+from app.export import encode_record_batches, negotiate_columnar_format
+from app.rollups import ROLLUP_SOURCES, rollup_engine
+from app.profiling import slow_query_log
+from app.queries import QUERY_REGISTRY
+from app.scheduler import QueryAdmissionError, query_scheduler
+from app.semantic import TIME_DIMENSION, compile_aggregate, is_aligned, next_bucket
+from app.sketches import TDigest
 from app.schemas import (
     QueryRequest,
     QueryResponse,
     PredefinedQuery,
     SalesByHourResponse,
     SalesByHourRow,
+    SalesCorrectionRow,
+    SalesCorrectionsResponse,
+    SalesPercentilesResponse,
+    SkuRanking,
+    SkuTrendGrain,
+    SkuTrendResponse,
+    SkuTrendRow,
+    TopSkuRow,
+    TopSkusResponse,
     LowStockResponse,
     LowStockRow,
     OverdueARResponse,
@@ -19,6 +39,13 @@ from app.schemas import (
     DailyOrderRow,
     StockMovementResponse,
     StockMovementRow,
+    RollupLevel,
+    SalesRollupResponse,
+    SalesRollupRow,
+    AggregateRequest,
+    AggregateResponse,
+    QueryProfile,
+    SlowQueryResponse,
 )
 
 
@@ -26,124 +53,200 @@ router = APIRouter(prefix="/query", tags=["OLAP Queries"])
 
 
 # Predefined safe queries (prevents SQL injection)
-PREDEFINED_QUERIES: Dict[str, str] = {
-    "sales_24h": """
-        SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers, updated_at
-        FROM sales_by_hour
-        WHERE hour >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
-        ORDER BY hour DESC
-        LIMIT ?
-    """,
-    "sales_7d": """
-        SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers, updated_at
-        FROM sales_by_hour
-        WHERE hour >= CURRENT_TIMESTAMP - INTERVAL '7 days'
-        ORDER BY hour DESC
-        LIMIT ?
-    """,
-    "low_stock": """
-        SELECT sku, product_name, qty_on_hand, reserved_qty, available_qty, reorder_point, last_updated
-        FROM stock_snapshot
-        WHERE needs_reorder = TRUE
-        ORDER BY available_qty ASC
-        LIMIT ?
-    """,
-    "overdue_ar": """
-        SELECT customer_id, customer_name, total_outstanding, days_30, days_60, days_90_plus,
-               oldest_invoice_date, DATEDIFF('day', oldest_invoice_date, CURRENT_DATE) AS days_overdue
-        FROM ar_aging
-        WHERE total_outstanding > 0
-        ORDER BY days_overdue DESC
-        LIMIT ?
-    """,
-    "daily_orders": """
-        SELECT order_date, total_orders, total_revenue, avg_order_value
-        FROM daily_order_volume
-        WHERE order_date >= CURRENT_DATE - INTERVAL '? days'
-        ORDER BY order_date DESC
-        LIMIT ?
-    """,
-    "stock_movement": """
-        SELECT sku, total_reservations, total_qty_reserved, first_reservation, last_reservation
-        FROM stock_movement_summary
-        ORDER BY total_qty_reserved DESC
-        LIMIT ?
-    """,
-    "top_customers": """
-        SELECT customer_id, customer_name, total_outstanding
-        FROM ar_aging
-        ORDER BY total_outstanding DESC
-        LIMIT ?
-    """,
-    "revenue_by_day": """
-        SELECT DATE_TRUNC('day', event_timestamp) AS order_date,
-               COUNT(DISTINCT order_id) AS total_orders,
-               SUM(total_amount) AS total_revenue,
-               AVG(total_amount) AS avg_order_value
-        FROM order_events
-        WHERE event_type = 'order_created'
-          AND event_timestamp >= CURRENT_DATE - INTERVAL '? days'
-        GROUP BY DATE_TRUNC('day', event_timestamp)
-        ORDER BY order_date DESC
-        LIMIT ?
-    """,
-}
+PREDEFINED_QUERIES: Dict[str, str] = {name: query.sql for name, query in QUERY_REGISTRY.items()}
+
+# Tables the rollup views read
+ROLLUP_TABLES: List[str] = ["sales_by_minute", "sales_by_hour", "sales_by_day", "sales_by_month"]
+
+
+async def cached_response(
+    request: Request,
+    sql: str,
+    params: Optional[list],
+    tables: List[str],
+    build: Callable[[], Awaitable[BaseModel]],
+    sealed: bool = False,
+) -> Response:
+    """Serve a query response from the result cache, building it on a miss
+
+    Responses carry an ETag; a request whose If-None-Match matches the current
+    entry gets an empty 304. Pass `sealed` for results over sealed event-time
+    buckets only, which are cached without expiry.
+    """
+    key = query_cache.key(request.url.path, sql, params)
+    entry = query_cache.get(key, tables)
+
+    if entry is None:
+        # Snapshot watermarks first so writes landing mid-query invalidate the entry
+        watermarks = query_cache.watermarks(tables)
+        body = JSONResponse(content=jsonable_encoder(await build())).body
+        entry = query_cache.put(key, body, watermarks, sealed)
+
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=304, headers={"ETag": entry.etag})
+    return Response(content=entry.body, media_type="application/json", headers={"ETag": entry.etag})
 
 
 @router.post("/execute", response_model=QueryResponse)
-async def execute_query(request: QueryRequest):
+async def execute_query(
+    request: QueryRequest,
+    http_request: Request,
+    profile: bool = Query(False, description="Run with DuckDB profiling and return the plan"),
+):
     """
     Execute a predefined OLAP query
 
     Only predefined queries are allowed to prevent SQL injection.
+    Send `Accept: application/vnd.apache.arrow.stream` or
+    `Accept: application/vnd.apache.parquet` to stream the result as Arrow IPC
+    or Parquet record batches instead of JSON; streamed extracts aren't held to
+    the JSON limit of 1000 rows, and `"limit": null` returns every row. With
+    `profile=true` the query bypasses the result cache and the JSON response
+    includes its operator tree with per-operator timings and cardinalities.
     """
+    query_name = request.query_name.value
+    if query_name not in QUERY_REGISTRY:
+        raise HTTPException(status_code=400, detail=f"Unknown query: {query_name}")
+
+    media_type = None if profile else negotiate_columnar_format(http_request.headers.get("accept"))
+
+    # Validate parameters against the query's declared types before running anything
+    query = QUERY_REGISTRY[query_name]
     try:
-        query_name = request.query_name.value
+        if media_type:
+            bound = query.bind({**(request.params or {}), "limit": request.limit}, export=True)
+        else:
+            bound = query.bind({**(request.params or {}), "limit": request.limit or 100})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        if query_name not in PREDEFINED_QUERIES:
-            raise HTTPException(status_code=400, detail=f"Unknown query: {query_name}")
+    try:
+        if profile:
+            columns, rows, plan = await query_scheduler.profile(query.sql, bound, query.tables)
+            return QueryResponse(
+                query_name=query_name,
+                columns=columns,
+                rows=rows,
+                row_count=len(rows),
+                execution_time_ms=plan["execution_time_ms"],
+                profile=plan,
+            )
+
+        if media_type:
+            stream = await query_scheduler.stream(query.sql, bound, query.tables)
+            return StreamingResponse(
+                encode_record_batches(stream, media_type),
+                media_type=media_type,
+                headers={"X-Query-Name": query_name},
+            )
+
+        async def build():
+            # Start timing
+            start_time = time.time()
+
+            # Execute the prepared query with validated parameters through the scheduler
+            columns, rows = await query_scheduler.run(query, bound)
+
+            # Calculate execution time
+            execution_time_ms = (time.time() - start_time) * 1000
+
+            return QueryResponse(
+                query_name=query_name,
+                columns=columns,
+                rows=rows,
+                row_count=len(rows),
+                execution_time_ms=round(execution_time_ms, 2),
+            )
+
+        return await cached_response(
+            http_request, query.sql, sorted(bound.items()), list(query.tables), build
+        )
 
-        sql = PREDEFINED_QUERIES[query_name]
-        limit = request.limit or 100
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query execution failed: {str(e)}")
 
-        # Start timing
-        start_time = time.time()
 
-        # Execute query with parameterized limit
-        result = duckdb_client.conn.execute(sql, [limit])
+@router.post("/aggregate", response_model=AggregateResponse)
+async def aggregate(request: AggregateRequest, http_request: Request):
+    """
+    Aggregate whitelisted measures by dimensions over a time range
 
-        # Fetch results
-        rows = result.fetchall()
-        columns = [desc[0] for desc in result.description]
+    The request is compiled to parameterised SQL and answered from the
+    smallest table that can serve it exactly (month/day/hour/minute rollups
+    before raw events); the response names that table in `source`.
+    """
+    dimensions = [d.value for d in request.dimensions]
+    try:
+        compiled = compile_aggregate(
+            measures=[m.value for m in request.measures],
+            dimensions=dimensions,
+            filters={d.value: values for d, values in request.filters.items()},
+            start=request.start,
+            end=request.end or datetime.utcnow(),
+            grain=request.grain.value,
+            limit=request.limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Calculate execution time
+    async def build():
+        start_time = time.time()
+        columns, rows = await query_scheduler.query(compiled.sql, compiled.params, compiled.source.tables)
         execution_time_ms = (time.time() - start_time) * 1000
 
-        return QueryResponse(
-            query_name=query_name,
+        return AggregateResponse(
+            source=compiled.source.table,
+            grain=request.grain.value if TIME_DIMENSION in dimensions else None,
+            start=str(compiled.start),
+            end=str(compiled.end),
             columns=columns,
             rows=rows,
             row_count=len(rows),
             execution_time_ms=round(execution_time_ms, 2),
         )
 
+    try:
+        sealed = olap_consumer.event_time.is_sealed(compiled.end, compiled.source.tables)
+        return await cached_response(
+            http_request, compiled.sql, compiled.params, list(compiled.source.tables), build, sealed
+        )
+    except QueryAdmissionError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query execution failed: {str(e)}")
 
 
 @router.get("/sales/hourly", response_model=SalesByHourResponse)
-async def get_sales_hourly(hours: int = Query(24, ge=1, le=168, description="Number of hours (max 7 days)")):
-    """Get hourly sales summary"""
-    try:
-        results = duckdb_client.conn.execute("""
-            SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers, updated_at
-            FROM sales_by_hour
-            WHERE hour >= CURRENT_TIMESTAMP - INTERVAL ? ' hours'
-            ORDER BY hour DESC
-        """, [hours]).fetchall()
+async def get_sales_hourly(request: Request, hours: int = Query(24, ge=1, le=168, description="Number of hours (max 7 days)")):
+    """
+    Get hourly sales summary
+
+    Hours before `sealed_through` are final: orders that arrive for them later
+    are reported by /query/sales/corrections instead.
+    """
+    sql = """
+        WITH watermark AS (
+            SELECT sealed_through FROM event_time_state WHERE aggregate = 'sales_by_hour'
+        )
+        SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers, updated_at,
+               sealed_through, COALESCE(hour < sealed_through, FALSE) AS sealed
+        FROM sales_by_hour LEFT JOIN watermark ON TRUE
+        WHERE hour >= CURRENT_TIMESTAMP - to_hours(CAST(? AS INTEGER))
+        ORDER BY hour DESC
+    """
+    tables = ["sales_by_hour", "event_time_state"]
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [hours], tables)
+        sealed_through = olap_consumer.event_time.sealed_through
+        if results:
+            sealed_through = results[0][6]
 
         return SalesByHourResponse(
             hours=hours,
+            sealed_through=str(sealed_through) if sealed_through else None,
             data=[
                 SalesByHourRow(
                     hour=str(row[0]),
@@ -152,24 +255,32 @@ async def get_sales_hourly(hours: int = Query(24, ge=1, le=168, description="Num
                     avg_order_value=float(row[3]),
                     unique_customers=row[4],
                     updated_at=str(row[5]),
+                    sealed=row[7],
                 )
                 for row in results
             ],
         )
+
+    try:
+        return await cached_response(request, sql, [hours], tables, build)
+    except QueryAdmissionError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/inventory/low-stock", response_model=LowStockResponse)
-async def get_low_stock_items():
+async def get_low_stock_items(request: Request):
     """Get items that need reordering"""
-    try:
-        results = duckdb_client.conn.execute("""
-            SELECT sku, product_name, qty_on_hand, reserved_qty, available_qty, reorder_point, last_updated
-            FROM stock_snapshot
-            WHERE needs_reorder = TRUE
-            ORDER BY available_qty ASC
-        """).fetchall()
+    sql = """
+        SELECT sku, product_name, qty_on_hand, reserved_qty, available_qty, reorder_point, last_updated
+        FROM stock_snapshot
+        WHERE needs_reorder = TRUE
+        ORDER BY available_qty ASC
+    """
+
+    async def build():
+        _, results = await query_scheduler.query(sql, None, ["stock_snapshot"])
 
         return LowStockResponse(
             items=[
@@ -185,21 +296,28 @@ async def get_low_stock_items():
                 for row in results
             ],
         )
+
+    try:
+        return await cached_response(request, sql, None, ["stock_snapshot"], build)
+    except QueryAdmissionError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/ar/overdue", response_model=OverdueARResponse)
-async def get_overdue_ar():
+async def get_overdue_ar(request: Request):
     """Get customers with overdue invoices"""
-    try:
-        results = duckdb_client.conn.execute("""
-            SELECT customer_id, customer_name, total_outstanding, days_30, days_60, days_90_plus,
-                   oldest_invoice_date, DATEDIFF('day', oldest_invoice_date, CURRENT_DATE) AS days_overdue
-            FROM ar_aging
-            WHERE total_outstanding > 0
-            ORDER BY days_overdue DESC
-        """).fetchall()
+    sql = """
+        SELECT customer_id, customer_name, total_outstanding, days_30, days_60, days_90_plus,
+               oldest_invoice_date, DATEDIFF('day', oldest_invoice_date, CURRENT_DATE) AS days_overdue
+        FROM ar_aging
+        WHERE total_outstanding > 0
+        ORDER BY days_overdue DESC
+    """
+
+    async def build():
+        _, results = await query_scheduler.query(sql, None, ["ar_aging"])
 
         return OverdueARResponse(
             items=[
@@ -216,47 +334,328 @@ async def get_overdue_ar():
                 for row in results
             ],
         )
+
+    try:
+        return await cached_response(request, sql, None, ["ar_aging"], build)
+    except QueryAdmissionError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/orders/daily", response_model=DailyOrderResponse)
-async def get_daily_orders(days: int = Query(30, ge=1, le=365, description="Number of days")):
+async def get_daily_orders(request: Request, days: int = Query(30, ge=1, le=365, description="Number of days")):
     """Get daily order volume and revenue"""
-    try:
-        results = duckdb_client.conn.execute("""
-            SELECT order_date, total_orders, total_revenue, avg_order_value
-            FROM daily_order_volume
-            WHERE order_date >= CURRENT_DATE - INTERVAL ? ' days'
-            ORDER BY order_date DESC
-        """, [days]).fetchall()
+    sql = """
+        SELECT day, total_orders, total_revenue, avg_order_value
+        FROM sales_rollup_day
+        WHERE day >= CURRENT_DATE - to_days(CAST(? AS INTEGER))
+        ORDER BY day DESC
+    """
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [days], ["sales_by_hour", "sales_by_day"])
 
         return DailyOrderResponse(
             days=days,
             data=[
                 DailyOrderRow(
-                    order_date=str(row[0]),
+                    order_date=str(row[0].date()),
+                    total_orders=row[1],
+                    total_revenue=float(row[2]),
+                    avg_order_value=float(row[3]),
+                )
+                for row in results
+            ],
+        )
+
+    try:
+        return await cached_response(request, sql, [days], ["sales_by_hour", "sales_by_day"], build)
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sales/rollup", response_model=SalesRollupResponse)
+async def get_sales_rollup(
+    request: Request,
+    start: datetime = Query(..., description="Range start (inclusive)"),
+    end: datetime = Query(None, description="Range end (exclusive, default now)"),
+    level: RollupLevel = Query(None, description="Bucket size (default: chosen from the range)"),
+):
+    """
+    Get sales over a time range from the rollup tables
+
+    Without `level`, the finest resolution that answers the range in at most
+    OLAP_ROLLUP_MAX_POINTS buckets is used, so long ranges read day or month
+    rollups instead of hourly or per-minute rows.
+    """
+    end = end or datetime.utcnow()
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    level_name = level.value if level else rollup_engine.choose_level(start, end)
+    source = ROLLUP_SOURCES[level_name]
+    sql = f"""
+        SELECT {level_name}, total_orders, total_revenue, avg_order_value
+        FROM {source}
+        WHERE {level_name} >= CAST(DATE_TRUNC('{level_name}', CAST(? AS TIMESTAMP)) AS TIMESTAMP)
+          AND {level_name} < ?
+        ORDER BY {level_name}
+    """
+
+    # The last bucket may extend past `end`; results are final once it is sealed
+    last_bucket_end = end if is_aligned(end, level_name) else next_bucket(end, level_name)
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [start, end], ROLLUP_TABLES)
+
+        return SalesRollupResponse(
+            level=level_name,
+            start=str(start),
+            end=str(end),
+            data=[
+                SalesRollupRow(
+                    bucket=str(row[0]),
+                    total_orders=row[1],
+                    total_revenue=float(row[2]),
+                    avg_order_value=float(row[3] or 0),
+                )
+                for row in results
+            ],
+        )
+
+    try:
+        return await cached_response(
+            request, sql, [start, end], ROLLUP_TABLES, build,
+            olap_consumer.event_time.is_sealed(last_bucket_end, ROLLUP_TABLES),
+        )
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sales/percentiles", response_model=SalesPercentilesResponse)
+async def get_sales_percentiles(
+    request: Request,
+    start: datetime = Query(..., description="Range start (inclusive, truncated to the hour)"),
+    end: datetime = Query(None, description="Range end (exclusive, default now)"),
+    q: List[float] = Query([0.5, 0.95, 0.99], description="Quantiles between 0 and 1"),
+):
+    """
+    Get order value percentiles over a time range
+
+    Answered by merging the order value t-digests stored per hour in
+    sales_by_hour, so the cost grows with the number of hours in the range
+    rather than the number of orders, and raw events are never read.
+    """
+    end = end or datetime.utcnow()
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if any(not 0 <= value <= 1 for value in q):
+        raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+
+    sql = """
+        SELECT order_value_sketch
+        FROM sales_by_hour
+        WHERE hour >= CAST(DATE_TRUNC('hour', CAST(? AS TIMESTAMP)) AS TIMESTAMP)
+          AND hour < ?
+          AND order_value_sketch IS NOT NULL
+    """
+    last_bucket_end = end if is_aligned(end, "hour") else next_bucket(end, "hour")
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [start, end], ["sales_by_hour"])
+        digest = TDigest()
+        for (sketch,) in results:
+            digest.merge(TDigest.from_bytes(sketch))
+
+        def estimate(value: float) -> Optional[float]:
+            result = digest.quantile(value)
+            return round(result, 2) if result is not None else None
+
+        return SalesPercentilesResponse(
+            start=str(start),
+            end=str(end),
+            hours=len(results),
+            orders=int(digest.count()),
+            min=estimate(0.0),
+            max=estimate(1.0),
+            percentiles={f"p{value * 100:g}": estimate(value) for value in q},
+        )
+
+    try:
+        return await cached_response(
+            request, sql, [start, end, *q], ["sales_by_hour"], build,
+            olap_consumer.event_time.is_sealed(last_bucket_end, ["sales_by_hour"]),
+        )
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sales/top-skus", response_model=TopSkusResponse)
+async def get_top_skus(
+    request: Request,
+    start: datetime = Query(..., description="Range start (inclusive, truncated to the hour)"),
+    end: datetime = Query(None, description="Range end (exclusive, default now)"),
+    by: SkuRanking = Query(SkuRanking.REVENUE, description="Rank by revenue or units sold"),
+    limit: int = Query(20, ge=1, le=500),
+):
+    """Get the best-selling SKUs over a time range, from sales_by_sku_hour"""
+    end = end or datetime.utcnow()
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    order_by = "total_revenue" if by == SkuRanking.REVENUE else "total_qty"
+    sql = f"""
+        SELECT sku, SUM(total_qty) AS total_qty, SUM(total_revenue) AS total_revenue,
+               SUM(order_lines) AS order_lines
+        FROM sales_by_sku_hour
+        WHERE hour >= CAST(DATE_TRUNC('hour', CAST(? AS TIMESTAMP)) AS TIMESTAMP)
+          AND hour < ?
+        GROUP BY sku
+        ORDER BY {order_by} DESC, sku
+        LIMIT ?
+    """
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [start, end, limit], ["sales_by_sku_hour"])
+
+        return TopSkusResponse(
+            start=str(start),
+            end=str(end),
+            ranked_by=by.value,
+            data=[
+                TopSkuRow(
+                    sku=row[0],
+                    total_qty=row[1],
+                    total_revenue=float(row[2]),
+                    order_lines=row[3],
+                )
+                for row in results
+            ],
+        )
+
+    try:
+        return await cached_response(request, sql, [start, end, limit], ["sales_by_sku_hour"], build)
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sales/sku-trend", response_model=SkuTrendResponse)
+async def get_sku_trend(
+    request: Request,
+    sku: str = Query(..., min_length=1, max_length=64),
+    start: datetime = Query(..., description="Range start (inclusive, truncated to the grain)"),
+    end: datetime = Query(None, description="Range end (exclusive, default now)"),
+    grain: SkuTrendGrain = Query(SkuTrendGrain.DAY, description="Bucket size"),
+):
+    """Get units and revenue of one SKU per bucket, from sales_by_sku_hour"""
+    end = end or datetime.utcnow()
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    sql = f"""
+        SELECT CAST(DATE_TRUNC('{grain.value}', hour) AS TIMESTAMP) AS bucket,
+               SUM(total_qty), SUM(total_revenue), SUM(order_lines)
+        FROM sales_by_sku_hour
+        WHERE sku = ?
+          AND hour >= CAST(DATE_TRUNC('{grain.value}', CAST(? AS TIMESTAMP)) AS TIMESTAMP)
+          AND hour < ?
+        GROUP BY bucket
+        ORDER BY bucket
+    """
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [sku, start, end], ["sales_by_sku_hour"])
+
+        return SkuTrendResponse(
+            sku=sku,
+            grain=grain.value,
+            start=str(start),
+            end=str(end),
+            data=[
+                SkuTrendRow(
+                    bucket=str(row[0]),
+                    total_qty=row[1],
+                    total_revenue=float(row[2]),
+                    order_lines=row[3],
+                )
+                for row in results
+            ],
+        )
+
+    try:
+        return await cached_response(request, sql, [sku, start, end], ["sales_by_sku_hour"], build)
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sales/corrections", response_model=SalesCorrectionsResponse)
+async def get_sales_corrections(
+    request: Request,
+    days: int = Query(7, ge=1, le=365, description="Number of days of sealed hours"),
+):
+    """
+    Get orders that arrived after their hour was sealed
+
+    These are not part of sales_by_hour or the rollups; add them to the
+    sealed totals to account for every order.
+    """
+    sql = """
+        SELECT hour, total_orders, total_revenue, avg_order_value, updated_at
+        FROM sales_corrections
+        WHERE hour >= CURRENT_TIMESTAMP - to_days(CAST(? AS INTEGER))
+        ORDER BY hour DESC
+    """
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [days], ["sales_corrections"])
+        sealed_through = olap_consumer.event_time.sealed_through
+
+        return SalesCorrectionsResponse(
+            days=days,
+            sealed_through=str(sealed_through) if sealed_through else None,
+            data=[
+                SalesCorrectionRow(
+                    hour=str(row[0]),
                     total_orders=row[1],
                     total_revenue=float(row[2]),
                     avg_order_value=float(row[3]),
+                    updated_at=str(row[4]),
                 )
                 for row in results
             ],
         )
+
+    try:
+        return await cached_response(request, sql, [days], ["sales_corrections"], build)
+    except QueryAdmissionError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/inventory/movement", response_model=StockMovementResponse)
-async def get_stock_movement(limit: int = Query(50, ge=1, le=500)):
+async def get_stock_movement(request: Request, limit: int = Query(50, ge=1, le=500)):
     """Get stock movement summary"""
-    try:
-        results = duckdb_client.conn.execute("""
-            SELECT sku, total_reservations, total_qty_reserved, first_reservation, last_reservation
-            FROM stock_movement_summary
-            ORDER BY total_qty_reserved DESC
-            LIMIT ?
-        """, [limit]).fetchall()
+    sql = """
+        SELECT sku, total_reservations, total_qty_reserved, first_reservation, last_reservation
+        FROM stock_movement_summary
+        ORDER BY total_qty_reserved DESC
+        LIMIT ?
+    """
+
+    async def build():
+        _, results = await query_scheduler.query(sql, [limit], ["stock_events", "stock_events_all"])
 
         return StockMovementResponse(
             items=[
@@ -270,10 +669,56 @@ async def get_stock_movement(limit: int = Query(50, ge=1, le=500)):
                 for row in results
             ],
         )
+
+    try:
+        return await cached_response(request, sql, [limit], ["stock_events", "stock_events_all"], build)
+    except QueryAdmissionError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/profile", response_model=QueryProfile)
+async def profile_query(request: QueryRequest):
+    """
+    Profile a predefined OLAP query
+
+    Runs the query with DuckDB's JSON profiler and returns only the profile:
+    the operator tree with per-operator timings, cardinalities and rows
+    scanned. The run is also recorded in the slow query log.
+    """
+    query = QUERY_REGISTRY[request.query_name.value]
+    try:
+        bound = query.bind({**(request.params or {}), "limit": request.limit or 100})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        _, _, plan = await query_scheduler.profile(query.sql, bound, query.tables)
+        return plan
+    except QueryAdmissionError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query profiling failed: {str(e)}")
+
+
+@router.get("/profile/slow", response_model=SlowQueryResponse)
+async def get_slow_queries():
+    """
+    Slowest recent queries
+
+    Query fingerprints that ran slower than OLAP_SLOW_QUERY_MS (or were
+    profiled explicitly) within the last OLAP_SLOW_QUERY_WINDOW_SECONDS,
+    slowest first, with the plan of their latest profiled run. A slow query
+    is profiled automatically the next time it runs.
+    """
+    return SlowQueryResponse(
+        threshold_ms=slow_query_log.threshold_ms,
+        window_seconds=slow_query_log.window_seconds,
+        queries=slow_query_log.entries(),
+    )
+
+
 @router.get("/available")
 async def list_available_queries():
     """List all available predefined queries"""
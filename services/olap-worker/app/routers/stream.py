@@ -0,0 +1,94 @@
+"""Server-Sent Events stream of live OLAP aggregates"""
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.live import LIVE_TOPICS, Subscriber, live_aggregates, low_stock_update, sales_hour_update
+from app.scheduler import query_scheduler
+
+
+router = APIRouter(prefix="/stream", tags=["Live Streams"])
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def seed(subscriber: Subscriber):
+    """Queue the current state, so clients need no separate initial fetch"""
+    if "sales_by_hour" in subscriber.topics:
+        _, rows = await query_scheduler.query("""
+            SELECT hour, total_orders, total_revenue, avg_order_value, unique_customers
+            FROM sales_by_hour
+            WHERE hour >= CURRENT_TIMESTAMP - INTERVAL '24 hours'
+            ORDER BY hour
+        """, None, ["sales_by_hour"])
+        for row in rows:
+            subscriber.offer("sales_by_hour", *sales_hour_update(row))
+
+    if "low_stock" in subscriber.topics:
+        _, rows = await query_scheduler.query("""
+            SELECT sku, product_name, available_qty, reorder_point, needs_reorder
+            FROM stock_snapshot
+            WHERE needs_reorder = TRUE
+        """, None, ["stock_snapshot"])
+        for row in rows:
+            subscriber.offer("low_stock", *low_stock_update(row))
+
+
+async def event_stream(request: Request, subscriber: Subscriber) -> AsyncIterator[str]:
+    """Yield coalesced updates as SSE events until the client disconnects"""
+    try:
+        while not await request.is_disconnected():
+            try:
+                await asyncio.wait_for(subscriber.ready.wait(), timeout=live_aggregates.heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            lagged, updates = subscriber.drain()
+            if lagged:
+                yield sse_event("reset", {"reason": "subscriber fell too far behind; refetch current state"})
+            for topic, payload in updates:
+                yield sse_event(topic, payload)
+    finally:
+        live_aggregates.unsubscribe(subscriber)
+
+
+@router.get("/aggregates")
+async def stream_aggregates(
+    request: Request,
+    topics: Optional[List[str]] = Query(None, description=f"Subset of {LIVE_TOPICS} (default all)"),
+    snapshot: bool = Query(True, description="Start with the current state"),
+):
+    """
+    Stream aggregate changes as Server-Sent Events
+
+    Events are pushed as flushes commit: `sales_by_hour` (new totals of each
+    changed hour), `low_stock` (SKUs entering or leaving the reorder list) and
+    `ar` (invoiced amount per customer since the previous event). Updates queue
+    per subscriber and coalesce per key, so a slow client receives the latest
+    state instead of a backlog; a client that still falls behind gets a
+    `reset` event.
+    """
+    topics = topics or LIVE_TOPICS
+    unknown = set(topics) - set(LIVE_TOPICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {sorted(unknown)}")
+
+    subscriber = live_aggregates.subscribe(topics)
+    if snapshot:
+        try:
+            await seed(subscriber)
+        except Exception:
+            live_aggregates.unsubscribe(subscriber)
+            raise
+
+    return StreamingResponse(
+        event_stream(request, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,267 @@
+"""Admission control for OLAP read queries
+
+Every API query takes one of a bounded number of execution slots. Requests
+beyond that wait in a priority queue, where queries over aggregate tables go
+ahead of raw-event scans. Scans can never hold every slot, so dashboards keep
+a free lane under ad-hoc load. When the queue is full, a request is rejected
+straight away (429). Each request has a deadline covering queueing and
+execution; a query still running at the deadline is interrupted on its cursor
+(504). A query that exhausts DuckDB's memory limit and spill space fails on
+its own (503).
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import duckdb
+
+from app.duckdb_client import RecordBatchStream, duckdb_client
+from app.profiling import fingerprint, run_profiled, slow_query_log
+from app.queries import NamedQuery
+
+
+# Raw event tables; queries touching them are scans
+SCAN_TABLES = {"order_events", "invoice_events", "stock_events", "order_line_events"}
+
+AGGREGATE_PRIORITY = 0
+SCAN_PRIORITY = 1
+
+
+class QueryAdmissionError(Exception):
+    """A query was not run to completion by the scheduler"""
+
+    status_code = 503
+
+
+class QueryRejected(QueryAdmissionError):
+    """The queue is full"""
+
+    status_code = 429
+
+
+class QueryTimeout(QueryAdmissionError):
+    """The request deadline passed while queued or running"""
+
+    status_code = 504
+
+
+class QueryOutOfMemory(QueryAdmissionError):
+    """The query needed more than the memory limit and spill space allow"""
+
+    status_code = 503
+
+
+class QueryScheduler:
+    """Bounded, prioritised execution of read queries with deadlines"""
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_queue: Optional[int] = None,
+                 timeout_seconds: Optional[float] = None, export_timeout_seconds: Optional[float] = None):
+        # One slot per reader cursor, so an admitted query never waits for a thread
+        self.max_concurrent = max_concurrent or int(
+            os.getenv("OLAP_QUERY_MAX_CONCURRENT", str(duckdb_client.reader_threads))
+        )
+        self.max_queue = max_queue or int(os.getenv("OLAP_QUERY_MAX_QUEUE", "32"))
+        self.timeout_seconds = timeout_seconds or float(os.getenv("OLAP_QUERY_TIMEOUT_SECONDS", "10"))
+        self.export_timeout_seconds = export_timeout_seconds or float(
+            os.getenv("OLAP_EXPORT_TIMEOUT_SECONDS", "300")
+        )
+        # Slots scans may hold at once; the rest stay free for aggregate queries
+        self.scan_limit = max(1, self.max_concurrent - 1)
+        self.running = 0
+        self.running_scans = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.out_of_memory = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    @staticmethod
+    def priority(tables: Iterable[str]) -> int:
+        """Scan priority for queries over raw events, aggregate priority otherwise"""
+        return SCAN_PRIORITY if any(table in SCAN_TABLES for table in tables) else AGGREGATE_PRIORITY
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    async def query(self, sql: str, params: Optional[list] = None, tables: Iterable[str] = (),
+                    timeout: Optional[float] = None) -> Tuple[List[str], List[tuple]]:
+        """Run a read query through the scheduler and return (columns, rows)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout_seconds)
+        priority = self.priority(tables)
+
+        await self.acquire(priority, deadline)
+        try:
+            columns, rows, _ = await self._execute(sql, params, deadline)
+            return columns, rows
+        finally:
+            self.release(priority)
+
+    async def run(self, query: NamedQuery, bound: Dict[str, Any],
+                  timeout: Optional[float] = None) -> Tuple[List[str], List[tuple]]:
+        """Run a named query with validated parameters as a prepared statement"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout_seconds)
+        priority = self.priority(query.tables)
+
+        await self.acquire(priority, deadline)
+        try:
+            columns, rows, _ = await self._execute(query.sql, bound, deadline, named=query)
+            return columns, rows
+        finally:
+            self.release(priority)
+
+    async def profile(self, sql: str, params: Optional[list] = None, tables: Iterable[str] = (),
+                      timeout: Optional[float] = None) -> Tuple[List[str], List[tuple], Dict[str, Any]]:
+        """Run a read query with DuckDB profiling and return (columns, rows, profile)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout_seconds)
+        priority = self.priority(tables)
+
+        await self.acquire(priority, deadline)
+        try:
+            return await self._execute(sql, params, deadline, profile=True)
+        finally:
+            self.release(priority)
+
+    async def stream(self, sql: str, params: Optional[list] = None,
+                     tables: Iterable[str] = ()) -> RecordBatchStream:
+        """Open a record batch stream holding a slot until it is closed
+
+        Streams get the (longer) export deadline, after which the cursor is
+        interrupted.
+        """
+        loop = asyncio.get_running_loop()
+        priority = self.priority(tables)
+        await self.acquire(priority, loop.time() + self.timeout_seconds)
+        try:
+            stream = await duckdb_client.stream(sql, params)
+        except Exception:
+            self.release(priority)
+            raise
+
+        interrupt = loop.call_later(self.export_timeout_seconds, stream.cursor.interrupt)
+        stream.add_close_callback(interrupt.cancel)
+        stream.add_close_callback(lambda: self.release(priority))
+        return stream
+
+    async def acquire(self, priority: int, deadline: float):
+        """Wait for an execution slot, in priority order, until the deadline"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+        self._dispatch()
+        if waiter.done():
+            return
+
+        if self.queued > self.max_queue:
+            waiter.cancel()
+            self.rejected += 1
+            raise QueryRejected(
+                f"OLAP query queue is full ({self.max_queue} waiting), retry shortly"
+            )
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), max(deadline - loop.time(), 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up
+                self.release(priority)
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise QueryTimeout("OLAP query timed out waiting for a slot") from None
+            raise
+
+    def release(self, priority: int):
+        """Free a slot and hand it to the next eligible waiter"""
+        self.running -= 1
+        if priority == SCAN_PRIORITY:
+            self.running_scans -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters and self.running < self.max_concurrent:
+            priority, _, waiter = self._waiters[0]
+            if waiter.done():
+                heapq.heappop(self._waiters)
+                continue
+            if priority == SCAN_PRIORITY and self.running_scans >= self.scan_limit:
+                # Aggregates sort first, so nobody queued can use the free slot
+                return
+
+            heapq.heappop(self._waiters)
+            self.running += 1
+            if priority == SCAN_PRIORITY:
+                self.running_scans += 1
+            waiter.set_result(None)
+
+    async def _execute(self, sql: str, params: Optional[Any], deadline: float, profile: bool = False,
+                       named: Optional[NamedQuery] = None) -> Tuple[List[str], List[tuple], Optional[Dict[str, Any]]]:
+        loop = asyncio.get_running_loop()
+        running = {}
+        key = fingerprint(sql)
+        # Slow queries seen without a plan are profiled on their next run
+        profile = profile or slow_query_log.wants_profile(key)
+
+        def run():
+            cursor = duckdb_client.cursor()
+            running["cursor"] = cursor
+            started = time.perf_counter()
+            if profile:
+                columns, rows, plan = run_profiled(cursor, sql, params)
+            else:
+                if named is not None:
+                    result = named.execute(cursor, params, duckdb_client.prepared_statements())
+                else:
+                    result = cursor.execute(sql, params or [])
+                columns = [desc[0] for desc in result.description]
+                rows, plan = result.fetchall(), None
+
+            duration_ms = (time.perf_counter() - started) * 1000
+            if plan is not None:
+                plan = {"fingerprint": key, "execution_time_ms": round(duration_ms, 3), **plan}
+            slow_query_log.record(key, sql, duration_ms, plan)
+            return columns, rows, plan
+
+        task = asyncio.ensure_future(duckdb_client.read(run))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(deadline - loop.time(), 0))
+        except asyncio.CancelledError:
+            # Client went away; don't leave the query running on the cursor
+            if "cursor" in running:
+                running["cursor"].interrupt()
+            raise
+        except asyncio.TimeoutError:
+            if "cursor" in running:
+                running["cursor"].interrupt()
+            # The cursor goes back to the pool only once the interrupted query has unwound
+            try:
+                await task
+            except Exception:
+                pass
+            self.timed_out += 1
+            raise QueryTimeout("OLAP query exceeded its deadline and was cancelled") from None
+        except duckdb.OutOfMemoryException as e:
+            # Out of both memory and spill space; fail the query, not the worker
+            self.out_of_memory += 1
+            raise QueryOutOfMemory(f"OLAP query ran out of memory: {e}") from None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "running_scans": self.running_scans,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "out_of_memory": self.out_of_memory,
+        }
+
+
+# Global query scheduler
+query_scheduler = QueryScheduler()
@@ -1,6 +1,7 @@
 """Pydantic Schemas for OLAP Query API"""
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, Field, validator
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel, Field, RootModel, field_validator, validator
 from enum import Enum
 
 
@@ -19,10 +20,25 @@ class PredefinedQuery(str, Enum):
 class QueryRequest(BaseModel):
     """Request for custom SQL query"""
     query_name: PredefinedQuery = Field(..., description="Predefined query name")
-    limit: Optional[int] = Field(100, ge=1, le=1000, description="Result limit")
+    limit: Optional[int] = Field(
+        100, ge=1,
+        description="Result limit: at most 1000 for JSON; uncapped, or null for all rows, "
+                    "when streaming Arrow or Parquet",
+    )
     params: Optional[Dict[str, Any]] = Field(default_factory=dict, description="Query parameters")
 
 
+class QueryProfile(BaseModel):
+    """DuckDB profile of one query run"""
+    fingerprint: str = Field(..., description="Hash of the whitespace-normalised SQL")
+    execution_time_ms: float = Field(..., description="Wall time of the query in milliseconds")
+    cpu_time_ms: float = Field(..., description="CPU time summed over DuckDB threads")
+    rows_scanned: int = Field(..., description="Rows read by all scans")
+    plan: List[Dict[str, Any]] = Field(
+        ..., description="Operator tree with per-operator timing_ms, cardinality and rows_scanned"
+    )
+
+
 class QueryResponse(BaseModel):
     """Response from query execution"""
     query_name: str = Field(..., description="Query that was executed")
@@ -30,6 +46,7 @@ class QueryResponse(BaseModel):
     rows: List[List[Any]] = Field(..., description="Result rows")
     row_count: int = Field(..., description="Number of rows returned")
     execution_time_ms: float = Field(..., description="Query execution time in milliseconds")
+    profile: Optional[QueryProfile] = Field(None, description="Query profile, with ?profile=true")
 
 
 class SalesByHourRow(BaseModel):
@@ -40,14 +57,90 @@ class SalesByHourRow(BaseModel):
     avg_order_value: float
     unique_customers: int
     updated_at: str
+    # Final: later orders for this hour go to sales corrections
+    sealed: bool = False
 
 
 class SalesByHourResponse(BaseModel):
     """Sales summary response"""
     hours: int
+    sealed_through: Optional[str] = None
     data: List[SalesByHourRow]
 
 
+class SalesPercentilesResponse(BaseModel):
+    """Order value distribution over a time range, estimated from hourly t-digests"""
+    start: str
+    end: str
+    hours: int
+    orders: int
+    min: Optional[float] = None
+    max: Optional[float] = None
+    percentiles: Dict[str, Optional[float]]
+
+
+class SkuRanking(str, Enum):
+    """What /query/sales/top-skus ranks SKUs by"""
+    REVENUE = "revenue"
+    QTY = "qty"
+
+
+class TopSkuRow(BaseModel):
+    """Sales of one SKU over the requested range"""
+    sku: str
+    total_qty: int
+    total_revenue: float
+    order_lines: int
+
+
+class TopSkusResponse(BaseModel):
+    """Best-selling SKUs over a time range"""
+    start: str
+    end: str
+    ranked_by: str
+    data: List[TopSkuRow]
+
+
+class SkuTrendGrain(str, Enum):
+    """Bucket sizes of /query/sales/sku-trend"""
+    HOUR = "hour"
+    DAY = "day"
+    MONTH = "month"
+
+
+class SkuTrendRow(BaseModel):
+    """Sales of one SKU in one bucket"""
+    bucket: str
+    total_qty: int
+    total_revenue: float
+    order_lines: int
+
+
+class SkuTrendResponse(BaseModel):
+    """Sales of one SKU over a time range, per bucket"""
+    sku: str
+    grain: str
+    start: str
+    end: str
+    data: List[SkuTrendRow]
+
+
+class SalesCorrectionRow(BaseModel):
+    """Orders that arrived after their hour was sealed"""
+    hour: str
+    total_orders: int
+    total_revenue: float
+    avg_order_value: float
+    updated_at: str
+
+
+class SalesCorrectionsResponse(BaseModel):
+    """Late orders per sealed hour"""
+    days: int
+    sealed_through: Optional[str] = None
+    data: List[SalesCorrectionRow]
+
+
 class LowStockRow(BaseModel):
     """Low stock item"""
     sku: str
@@ -107,3 +200,131 @@ class StockMovementRow(BaseModel):
 class StockMovementResponse(BaseModel):
     """Stock movement response"""
     items: List[StockMovementRow]
+
+
+class RollupLevel(str, Enum):
+    """Sales rollup resolutions"""
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+    MONTH = "month"
+
+
+class SalesRollupRow(BaseModel):
+    """Sales for one rollup bucket"""
+    bucket: str
+    total_orders: int
+    total_revenue: float
+    avg_order_value: float
+
+
+class SalesRollupResponse(BaseModel):
+    """Sales over a time range at the chosen rollup resolution"""
+    level: str
+    start: str
+    end: str
+    data: List[SalesRollupRow]
+
+
+class AggregateMeasure(str, Enum):
+    """Measures available to /query/aggregate"""
+    ORDERS = "orders"
+    REVENUE = "revenue"
+    AVG_ORDER_VALUE = "avg_order_value"
+    CUSTOMERS = "customers"
+    QTY_RESERVED = "qty_reserved"
+    RESERVATIONS = "reservations"
+    RESERVATION_FAILURES = "reservation_failures"
+    INVOICED_AMOUNT = "invoiced_amount"
+    INVOICES = "invoices"
+
+
+class AggregateDimension(str, Enum):
+    """Dimensions available to /query/aggregate"""
+    TIME = "time"
+    SKU = "sku"
+    CUSTOMER = "customer"
+    STATUS = "status"
+
+
+class AggregateRequest(BaseModel):
+    """Declarative aggregate query"""
+    measures: List[AggregateMeasure] = Field(..., min_length=1, description="Measures to compute")
+    dimensions: List[AggregateDimension] = Field(default_factory=list, description="Dimensions to group by")
+    filters: Dict[AggregateDimension, List[str]] = Field(
+        default_factory=dict, description="Allowed values per dimension"
+    )
+    start: datetime = Field(..., description="Range start (inclusive)")
+    end: Optional[datetime] = Field(None, description="Range end (exclusive, default now)")
+    grain: RollupLevel = Field(RollupLevel.DAY, description="Bucket size of the time dimension")
+    limit: int = Field(1000, ge=1, le=10000, description="Result limit")
+
+    @field_validator("filters")
+    @classmethod
+    def filters_not_empty(cls, filters):
+        for dimension, values in filters.items():
+            if not 1 <= len(values) <= 100:
+                raise ValueError(f"filter on {dimension.value} needs 1 to 100 values")
+        return filters
+
+
+class AggregateResponse(BaseModel):
+    """Result of a declarative aggregate query"""
+    source: str = Field(..., description="Table or view the query was answered from")
+    grain: Optional[str] = Field(None, description="Bucket size of the time dimension, if requested")
+    start: str
+    end: str
+    columns: List[str]
+    rows: List[List[Any]]
+    row_count: int
+    execution_time_ms: float
+
+
+class GrafanaRange(BaseModel):
+    """Dashboard time range"""
+    from_: datetime = Field(..., alias="from")
+    to: datetime
+
+
+class GrafanaTarget(BaseModel):
+    """One series requested by a panel"""
+    target: AggregateMeasure
+    refId: Optional[str] = None
+
+
+class GrafanaQueryRequest(BaseModel):
+    """Grafana JSON datasource /query request"""
+    range: GrafanaRange
+    intervalMs: Optional[int] = Field(None, ge=1, description="Panel interval in milliseconds")
+    maxDataPoints: int = Field(500, ge=3, le=10000, description="Most points to return per series")
+    targets: List[GrafanaTarget] = Field(..., min_length=1)
+
+
+class GrafanaSeries(BaseModel):
+    """Series in Grafana's [value, epoch_ms] datapoint format"""
+    target: str
+    datapoints: List[Tuple[Optional[float], int]]
+
+
+class GrafanaQueryResponse(RootModel[List[GrafanaSeries]]):
+    """Grafana JSON datasource /query response"""
+
+
+class SlowQuery(BaseModel):
+    """Timings and latest plan of one query fingerprint"""
+    fingerprint: str
+    sql: str
+    count: int = Field(..., description="Runs recorded in the window")
+    avg_ms: float
+    max_ms: float
+    last_ms: float
+    last_seen: float = Field(..., description="Unix time of the latest run")
+    profiled_at: Optional[float] = Field(None, description="Unix time of the profiled run")
+    profile: Optional[QueryProfile] = None
+
+
+class SlowQueryResponse(BaseModel):
+    """Slowest recent queries"""
+    threshold_ms: float
+    window_seconds: float
+    queries: List[SlowQuery]
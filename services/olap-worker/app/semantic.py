@@ -0,0 +1,214 @@
+"""Semantic layer: whitelisted measures and dimensions compiled to DuckDB SQL
+
+An aggregate request names measures, dimensions, filters and a time range.
+Only identifiers from the source definitions below ever reach the SQL text;
+every user-supplied value is bound as a parameter. Each request is routed to
+the smallest source that can answer it exactly, so a monthly revenue chart
+reads sales_rollup_month rather than scanning raw order events.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.rollups import LEVEL_WIDTHS, ROLLUP_LEVELS, truncate
+
+
+# Dimension that buckets rows by the request's time grain
+TIME_DIMENSION = "time"
+
+SALES_ROLLUP_MEASURES: Dict[str, str] = {
+    "orders": "SUM(total_orders)",
+    "revenue": "SUM(total_revenue)",
+    "avg_order_value": "SUM(total_revenue) / NULLIF(SUM(total_orders), 0)",
+}
+
+
+@dataclass
+class AggregateSource:
+    """A table or view the semantic layer can aggregate from"""
+
+    table: str
+    time_column: str
+    # Bucket size of time_column, or None for raw events (any grain)
+    grain: Optional[str]
+    # Measure name -> aggregate expression
+    measures: Dict[str, str]
+    # Dimension name -> column expression (the time dimension is implicit)
+    dimensions: Dict[str, str] = field(default_factory=dict)
+    # Fixed predicate selecting the rows this source describes
+    where: Optional[str] = None
+    # Base tables read, for result cache invalidation
+    tables: Tuple[str, ...] = ()
+    # Hive-partitioned <table>_all view with year/month/day columns
+    partitioned: bool = False
+
+
+# Candidate sources, smallest first; the first one that can answer a request wins
+AGGREGATE_SOURCES: List[AggregateSource] = [
+    AggregateSource(
+        table="sales_rollup_month", time_column="month", grain="month",
+        measures=SALES_ROLLUP_MEASURES,
+        tables=("sales_by_hour", "sales_by_day", "sales_by_month"),
+    ),
+    AggregateSource(
+        table="sales_rollup_day", time_column="day", grain="day",
+        measures=SALES_ROLLUP_MEASURES,
+        tables=("sales_by_hour", "sales_by_day"),
+    ),
+    AggregateSource(
+        table="sales_by_hour", time_column="hour", grain="hour",
+        measures=SALES_ROLLUP_MEASURES,
+        tables=("sales_by_hour",),
+    ),
+    AggregateSource(
+        table="sales_by_minute", time_column="minute", grain="minute",
+        measures=SALES_ROLLUP_MEASURES,
+        tables=("sales_by_minute",),
+    ),
+    AggregateSource(
+        table="order_events_all", time_column="event_timestamp", grain=None,
+        measures={
+            "orders": "COUNT(*)",
+            "revenue": "SUM(total_amount)",
+            "avg_order_value": "AVG(total_amount)",
+            "customers": "COUNT(DISTINCT customer_id)",
+        },
+        dimensions={
+            "customer": "CAST(customer_id AS VARCHAR)",
+            "status": "status",
+        },
+        where="event_type = 'order_created'",
+        tables=("order_events", "order_events_all"),
+        partitioned=True,
+    ),
+    AggregateSource(
+        table="stock_events_all", time_column="event_timestamp", grain=None,
+        measures={
+            "qty_reserved": "SUM(qty_reserved)",
+            "reservations": "COUNT(*) FILTER (WHERE event_type = 'stock_reserved')",
+            "reservation_failures": "COUNT(*) FILTER (WHERE event_type = 'reservation_failed')",
+        },
+        dimensions={
+            "sku": "sku",
+        },
+        tables=("stock_events", "stock_events_all"),
+        partitioned=True,
+    ),
+    AggregateSource(
+        table="invoice_events_all", time_column="event_timestamp", grain=None,
+        measures={
+            "invoiced_amount": "SUM(amount)",
+            "invoices": "COUNT(*)",
+        },
+        dimensions={
+            "status": "status",
+        },
+        where="event_type = 'invoice_created'",
+        tables=("invoice_events", "invoice_events_all"),
+        partitioned=True,
+    ),
+]
+
+
+@dataclass
+class CompiledAggregate:
+    """Parameterised SQL for an aggregate request and the source it reads"""
+
+    sql: str
+    params: list
+    source: AggregateSource
+    start: datetime
+    end: datetime
+
+
+def next_bucket(ts: datetime, level: str) -> datetime:
+    """Start of the level bucket after the one containing ts"""
+    ts = truncate(ts, level)
+    if level == "month":
+        return (ts + timedelta(days=32)).replace(day=1)
+    return ts + LEVEL_WIDTHS[level]
+
+
+def is_aligned(ts: datetime, level: str) -> bool:
+    """Whether ts falls exactly on a level bucket boundary"""
+    return truncate(ts, level) == ts
+
+
+def choose_source(measures: List[str], dimensions: List[str], filters: Dict[str, List[str]],
+                  start: datetime, end: datetime, grain: Optional[str]) -> AggregateSource:
+    """Smallest source with every measure and dimension at a fine enough grain
+
+    A pre-aggregated source only qualifies when the range starts and ends on
+    its bucket boundaries, so partial buckets are never over-counted.
+    """
+    needed = set(dimensions) | set(filters)
+    needed.discard(TIME_DIMENSION)
+
+    for source in AGGREGATE_SOURCES:
+        if not set(measures) <= set(source.measures) or not needed <= set(source.dimensions):
+            continue
+        if source.grain is not None:
+            if grain and ROLLUP_LEVELS.index(source.grain) > ROLLUP_LEVELS.index(grain):
+                continue
+            if not (is_aligned(start, source.grain) and is_aligned(end, source.grain)):
+                continue
+        return source
+
+    raise ValueError(
+        f"No source can answer measures {measures} by dimensions {sorted(needed)}; "
+        f"order measures, stock measures and invoice measures must be requested separately"
+    )
+
+
+def compile_aggregate(measures: List[str], dimensions: List[str], filters: Dict[str, List[str]],
+                      start: datetime, end: datetime, grain: str, limit: int) -> CompiledAggregate:
+    """Compile an aggregate request to SQL against the smallest capable source
+
+    With the time dimension, the range is widened to whole `grain` buckets.
+    Rows are ordered by time when bucketed, otherwise by the first measure.
+    """
+    measures = list(dict.fromkeys(measures))
+    dimensions = list(dict.fromkeys(dimensions))
+    if TIME_DIMENSION in filters:
+        raise ValueError("Filter time with start/end instead of a time filter")
+    if end <= start:
+        raise ValueError("end must be after start")
+
+    bucketed = TIME_DIMENSION in dimensions
+    if bucketed:
+        start = truncate(start, grain)
+        end = end if is_aligned(end, grain) else next_bucket(end, grain)
+    source = choose_source(measures, dimensions, filters, start, end, grain if bucketed else None)
+
+    select = []
+    for dimension in dimensions:
+        if dimension == TIME_DIMENSION:
+            expr = f"CAST(DATE_TRUNC('{grain}', {source.time_column}) AS TIMESTAMP)"
+        else:
+            expr = source.dimensions[dimension]
+        select.append(f'{expr} AS "{dimension}"')
+    select += [f'{source.measures[measure]} AS "{measure}"' for measure in measures]
+
+    where = [f"{source.time_column} >= ?", f"{source.time_column} < ?"]
+    params: list = [start, end]
+    if source.partitioned:
+        # Lets the archive scan skip day partitions outside the range
+        where.append("make_date(year, month, day) BETWEEN ? AND ?")
+        params += [start.date(), (end - timedelta(microseconds=1)).date()]
+    if source.where:
+        where.append(source.where)
+    for dimension, values in filters.items():
+        where.append(f"{source.dimensions[dimension]} IN ({', '.join('?' for _ in values)})")
+        params += list(values)
+
+    sql = f"SELECT {', '.join(select)}\nFROM {source.table}\nWHERE {' AND '.join(where)}"
+    if dimensions:
+        sql += f"\nGROUP BY {', '.join(str(i + 1) for i in range(len(dimensions)))}"
+    if bucketed:
+        sql += f"\nORDER BY {dimensions.index(TIME_DIMENSION) + 1}"
+    else:
+        sql += f"\nORDER BY {len(dimensions) + 1} DESC NULLS LAST"
+    sql += "\nLIMIT ?"
+    params.append(limit)
+
+    return CompiledAggregate(sql=sql, params=params, source=source, start=start, end=end)
@@ -0,0 +1,178 @@
+"""Mergeable streaming sketches stored alongside OLAP aggregates"""
+import hashlib
+import math
+import struct
+from array import array
+from typing import List, Optional, Tuple
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-count sketch
+
+    Registers serialise to `precision` + 2^precision bytes (4 KiB at the
+    default precision of 12, ~1.6% standard error) and merge by taking the
+    per-register maximum, so hourly sketches roll up into any coarser range.
+    """
+
+    def __init__(self, precision: int = 12, registers: Optional[bytearray] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.size)
+
+    def add(self, value: str):
+        """Add a value to the sketch"""
+        hashed = int.from_bytes(
+            hashlib.blake2b(value.encode(), digest_size=8).digest(), "big"
+        )
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        remainder = hashed & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - remainder.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added"""
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+
+        # Small-range correction (linear counting)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Serialise for storage in a DuckDB BLOB column"""
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        """Load a sketch serialised with to_bytes()"""
+        return cls(precision=data[0], registers=bytearray(data[1:]))
+
+
+class TDigest:
+    """t-digest quantile sketch (merging variant)
+
+    Values are clustered into centroids (mean, weight) whose size is bounded
+    by the arcsine scale function, so centroids stay small near both tails
+    and p95/p99 remain accurate when a few large orders skew the mean. The
+    default compression of 100 keeps about 50 centroids (under 1 KiB
+    serialised). Digests merge by re-clustering their centroids, so hourly
+    digests answer percentiles over any range.
+    """
+
+    HEADER = struct.Struct("<dddI")
+
+    def __init__(self, compression: float = 100.0, centroids: Optional[List[Tuple[float, float]]] = None,
+                 min_value: float = math.inf, max_value: float = -math.inf):
+        self.compression = compression
+        # Sorted by mean
+        self.centroids: List[Tuple[float, float]] = centroids or []
+        self.min = min_value
+        self.max = max_value
+        # Unmerged values and centroids, clustered once the buffer fills up
+        self._buffer: List[Tuple[float, float]] = []
+        self._buffer_size = int(compression) * 5
+
+    def add(self, value: float, weight: float = 1.0):
+        """Add a value to the sketch"""
+        value = float(value)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._buffer.append((value, weight))
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+
+    def merge(self, other: "TDigest"):
+        """Fold another digest into this one"""
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._buffer.extend(other.centroids)
+        self._buffer.extend(other._buffer)
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+
+    def count(self) -> float:
+        """Total weight of the values added"""
+        return sum(w for _, w in self.centroids) + sum(w for _, w in self._buffer)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value at quantile q (0..1), or None for an empty digest"""
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1 or q <= 0:
+            return self.min if q <= 0 else self.centroids[0][0]
+        if q >= 1:
+            return self.max
+
+        total = sum(w for _, w in self.centroids)
+        target = q * total
+        # Interpolate between centroid midpoints, with min/max at the ends
+        previous_mean, previous_position = self.min, 0.0
+        cumulative = 0.0
+        for mean, weight in self.centroids:
+            position = cumulative + weight / 2
+            if target < position:
+                fraction = (target - previous_position) / (position - previous_position)
+                return previous_mean + fraction * (mean - previous_mean)
+            previous_mean, previous_position = mean, position
+            cumulative += weight
+        fraction = (target - previous_position) / (total - previous_position)
+        return previous_mean + fraction * (self.max - previous_mean)
+
+    def _scale(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _inverse_scale(self, k: float) -> float:
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in points)
+
+        merged = []
+        mean, weight = points[0]
+        weight_before = 0.0
+        q_limit = self._inverse_scale(self._scale(0.0) + 1)
+        for next_mean, next_weight in points[1:]:
+            if (weight_before + weight + next_weight) / total <= q_limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged.append((mean, weight))
+                weight_before += weight
+                q_limit = self._inverse_scale(self._scale(weight_before / total) + 1)
+                mean, weight = next_mean, next_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def to_bytes(self) -> bytes:
+        """Serialise for storage in a DuckDB BLOB column"""
+        self._compress()
+        values = array("d", [x for centroid in self.centroids for x in centroid])
+        return self.HEADER.pack(self.compression, self.min, self.max, len(self.centroids)) + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        """Load a digest serialised with to_bytes()"""
+        compression, min_value, max_value, size = cls.HEADER.unpack_from(data)
+        values = array("d")
+        values.frombytes(data[cls.HEADER.size:cls.HEADER.size + size * 16])
+        centroids = list(zip(values[0::2], values[1::2]))
+        return cls(compression, centroids, min_value, max_value)
@@ -0,0 +1,257 @@
+"""Periodic OLTP -> OLAP sync of state that events don't carry
+
+Inventory levels, customer names and product names live only in Postgres.
+Each run copies the rows changed since the last synced `updated_at` with a
+binary COPY, decodes them straight into Arrow columns and merges each table
+with one INSERT OR REPLACE ... SELECT, so dimensions stay fresh without an
+OLTP lookup per event.
+"""
+import asyncio
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.duckdb_client import duckdb_client
+from app.live import live_aggregates
+
+
+# Changed rows per OLAP table; $1 is the updated_at to sync from
+SNAPSHOT_SOURCES: Dict[str, str] = {
+    "customers": """
+        SELECT id::text, name, email, updated_at
+        FROM customers
+        WHERE updated_at > $1
+    """,
+    "products": """
+        SELECT sku, name, price::float8, updated_at
+        FROM products
+        WHERE updated_at > $1
+    """,
+    # A rename bumps products.updated_at only, so take the later of both
+    "stock_snapshot": """
+        SELECT s.sku, s.name, s.qty_on_hand::int4, s.reserved_qty::int4,
+               s.available_qty::int4, s.reorder_point::int4, s.needs_reorder,
+               GREATEST(s.updated_at, p.updated_at)
+        FROM inventory_status s
+        JOIN products p ON p.sku = s.sku
+        WHERE GREATEST(s.updated_at, p.updated_at) > $1
+    """,
+}
+
+# Column layout of each source's COPY output, named after the OLAP columns
+SNAPSHOT_SCHEMAS: Dict[str, pa.Schema] = {
+    "customers": pa.schema([
+        ("id", pa.string()),
+        ("name", pa.string()),
+        ("email", pa.string()),
+        ("updated_at", pa.timestamp("us")),
+    ]),
+    "products": pa.schema([
+        ("sku", pa.string()),
+        ("name", pa.string()),
+        ("price", pa.float64()),
+        ("updated_at", pa.timestamp("us")),
+    ]),
+    "stock_snapshot": pa.schema([
+        ("sku", pa.string()),
+        ("product_name", pa.string()),
+        ("qty_on_hand", pa.int32()),
+        ("reserved_qty", pa.int32()),
+        ("available_qty", pa.int32()),
+        ("reorder_point", pa.int32()),
+        ("needs_reorder", pa.bool_()),
+        ("last_updated", pa.timestamp("us")),
+    ]),
+}
+
+# Column holding the OLTP updated_at of each synced row
+SNAPSHOT_SYNC_COLUMNS: Dict[str, str] = {
+    "customers": "updated_at",
+    "products": "updated_at",
+    "stock_snapshot": "last_updated",
+}
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+# Postgres timestamps count microseconds from 2000-01-01
+PG_EPOCH_OFFSET_US = 946_684_800_000_000
+
+_INT16 = struct.Struct(">h")
+_INT32 = struct.Struct(">i")
+_INT64 = struct.Struct(">q")
+_FLOAT64 = struct.Struct(">d")
+
+# Binary field decoders by Arrow type: (buffer, offset, length) -> value
+COPY_DECODERS: Dict[pa.DataType, Callable[[memoryview, int, int], object]] = {
+    pa.string(): lambda buf, pos, n: str(buf[pos:pos + n], "utf-8"),
+    pa.int32(): lambda buf, pos, n: _INT32.unpack_from(buf, pos)[0],
+    pa.int64(): lambda buf, pos, n: _INT64.unpack_from(buf, pos)[0],
+    pa.float64(): lambda buf, pos, n: _FLOAT64.unpack_from(buf, pos)[0],
+    pa.bool_(): lambda buf, pos, n: buf[pos] != 0,
+    pa.timestamp("us"): lambda buf, pos, n: _INT64.unpack_from(buf, pos)[0] + PG_EPOCH_OFFSET_US,
+}
+
+
+def decode_copy_binary(data: bytes, schema: pa.Schema) -> pa.Table:
+    """Decode the output of COPY ... TO STDOUT (FORMAT binary) into an Arrow table"""
+    buf = memoryview(data)
+    if bytes(buf[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+        raise ValueError("Not a binary COPY stream")
+
+    # Signature, flags, header extension length, header extension
+    pos = len(COPY_SIGNATURE) + 4
+    pos += 4 + _INT32.unpack_from(buf, pos)[0]
+
+    decoders = [COPY_DECODERS[field.type] for field in schema]
+    columns = [[] for _ in schema]
+    while True:
+        fields = _INT16.unpack_from(buf, pos)[0]
+        pos += 2
+        if fields == -1:
+            break
+        if fields != len(schema):
+            raise ValueError(f"COPY row has {fields} fields, expected {len(schema)}")
+
+        for column, decode in zip(columns, decoders):
+            length = _INT32.unpack_from(buf, pos)[0]
+            pos += 4
+            if length == -1:
+                column.append(None)
+                continue
+            column.append(decode(buf, pos, length))
+            pos += length
+
+    return pa.table(
+        [pa.array(column, field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+class OLTPSnapshotSync:
+    """Copies changed OLTP dimension rows into DuckDB on a fixed interval"""
+
+    def __init__(self, interval_seconds: Optional[int] = None, lookback_seconds: Optional[int] = None):
+        self.interval_seconds = interval_seconds or int(os.getenv("OLAP_SNAPSHOT_SYNC_INTERVAL_SECONDS", "60"))
+        # updated_at is stamped at transaction start, so rows may commit after
+        # later stamps were synced; re-read this much before the watermark
+        self.lookback = timedelta(
+            seconds=lookback_seconds or int(os.getenv("OLAP_SNAPSHOT_SYNC_LOOKBACK_SECONDS", "60"))
+        )
+        self.pg: Optional[asyncpg.Connection] = None
+
+    async def start(self):
+        """Sync snapshots on a fixed interval"""
+        print(f"Started OLTP snapshot sync (every {self.interval_seconds}s)")
+
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"OLTP snapshot sync failed: {e}")
+                await self.close()
+            await asyncio.sleep(self.interval_seconds)
+
+    async def connect(self) -> asyncpg.Connection:
+        """Open (or reuse) the Postgres connection"""
+        if self.pg is None or self.pg.is_closed():
+            self.pg = await asyncpg.connect(
+                host=os.getenv("DB_HOST", "localhost"),
+                port=int(os.getenv("DB_PORT", "5432")),
+                database=os.getenv("POSTGRES_DB", "pulse_erp"),
+                user=os.getenv("POSTGRES_USER", "pulseadmin"),
+                password=os.getenv("POSTGRES_PASSWORD", "changeme"),
+            )
+        return self.pg
+
+    async def close(self):
+        """Close the Postgres connection"""
+        if self.pg is not None:
+            await self.pg.close()
+            self.pg = None
+
+    async def sync(self) -> Dict[str, int]:
+        """Copy rows changed since the last sync and merge them
+
+        Returns the number of rows synced per table.
+        """
+        synced_through = await duckdb_client.read(duckdb_client.get_snapshot_sync_state)
+        pg = await self.connect()
+
+        deltas = {}
+        for table, sql in SNAPSHOT_SOURCES.items():
+            since = synced_through.get(table)
+            since = since - self.lookback if since else datetime(1970, 1, 1)
+            data = await self.copy(pg, sql, since)
+            deltas[table] = decode_copy_binary(data, SNAPSHOT_SCHEMAS[table])
+
+        transitions = await duckdb_client.write(self.merge, deltas)
+        live_aggregates.publish_low_stock(transitions)
+
+        synced = {table: rows.num_rows for table, rows in deltas.items()}
+        if any(synced.values()):
+            print(f"Synced OLTP snapshots: {synced}")
+        return synced
+
+    async def copy(self, pg: asyncpg.Connection, sql: str, since: datetime) -> bytes:
+        """Run one source query as a binary COPY and return the raw stream"""
+        chunks = []
+
+        async def collect(chunk: bytes):
+            chunks.append(chunk)
+
+        await pg.copy_from_query(
+            sql, since.replace(tzinfo=timezone.utc), output=collect, format="binary",
+        )
+        return b"".join(chunks)
+
+    def merge(self, deltas: Dict[str, pa.Table]) -> List[tuple]:
+        """Upsert synced rows and advance the sync marks; runs on the writer thread
+
+        Returns the stock rows whose needs_reorder flag changed (low-stock
+        transitions) as (sku, product_name, available_qty, reorder_point,
+        needs_reorder).
+        """
+        synced_through = {}
+        transitions = []
+        with duckdb_client.transaction() as conn:
+            for table, rows in deltas.items():
+                if not rows.num_rows:
+                    continue
+                if table == "stock_snapshot":
+                    transitions = self.low_stock_transitions(conn, rows)
+                duckdb_client.replace_rows(table, rows)
+                synced_through[table] = pc.max(rows[SNAPSHOT_SYNC_COLUMNS[table]]).as_py()
+
+            if "customers" in synced_through:
+                conn.execute("""
+                    UPDATE ar_aging SET customer_name = customers.name
+                    FROM customers
+                    WHERE ar_aging.customer_id = customers.id
+                      AND ar_aging.customer_name IS DISTINCT FROM customers.name
+                """)
+                duckdb_client.mark_written("ar_aging")
+
+            duckdb_client.advance_snapshot_sync_state(synced_through)
+        return transitions
+
+    def low_stock_transitions(self, conn, rows: pa.Table) -> List[tuple]:
+        """Synced stock rows that enter or leave the reorder list"""
+        previous = dict(conn.execute("""
+            SELECT sku, needs_reorder FROM stock_snapshot
+            WHERE sku IN (SELECT UNNEST(?::VARCHAR[]))
+        """, [rows["sku"].to_pylist()]).fetchall())
+
+        return [
+            (row["sku"], row["product_name"], row["available_qty"], row["reorder_point"], row["needs_reorder"])
+            for row in rows.to_pylist()
+            if previous.get(row["sku"], False) != row["needs_reorder"]
+        ]
+
+
+# Global snapshot sync instance
+snapshot_sync = OLTPSnapshotSync()
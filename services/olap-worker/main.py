@@ -3,14 +3,18 @@ import asyncio
 import signal
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.nats_client import nats_client
 from app.duckdb_client import duckdb_client
 from app.consumers.event_consumer import olap_consumer
-from app.routers import query
+from app.archive import event_archiver
+from app.rollups import rollup_engine
+from app.snapshot_sync import snapshot_sync
+from app.scheduler import QueryAdmissionError, QueryRejected, query_scheduler
+from app.routers import grafana, query, stream
 
 
 # Global flag for graceful shutdown
@@ -23,10 +27,15 @@ async def lifespan(app: FastAPI):
     # Startup
     print("Starting OLAP Worker...")
     duckdb_client.connect()
+    duckdb_client.start()
+    await duckdb_client.write(event_archiver.refresh_views)
     await nats_client.connect()
 
     # Start consumer in background
     consumer_task = asyncio.create_task(olap_consumer.start())
+    rollup_task = asyncio.create_task(rollup_engine.start())
+    archive_task = asyncio.create_task(event_archiver.start())
+    sync_task = asyncio.create_task(snapshot_sync.start())
 
     # Setup signal handlers for graceful shutdown
     def signal_handler(sig, frame):
@@ -40,12 +49,14 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     print("Shutting down OLAP Worker...")
-    consumer_task.cancel()
-    try:
-        await consumer_task
-    except asyncio.CancelledError:
-        pass
-
+    for task in (consumer_task, rollup_task, archive_task, sync_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    await snapshot_sync.close()
     await nats_client.close()
     duckdb_client.close()
 
@@ -66,8 +77,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include query router
+# Include query routers
 app.include_router(query.router)
+app.include_router(grafana.router)
+app.include_router(stream.router)
+
+
+@app.exception_handler(QueryAdmissionError)
+async def query_admission_error_handler(request: Request, e: QueryAdmissionError):
+    """Overload and deadline errors from the query scheduler"""
+    headers = {"Retry-After": "1"} if isinstance(e, QueryRejected) else None
+    return JSONResponse(status_code=e.status_code, content={"detail": str(e)}, headers=headers)
 
 
 @app.get("/health")
@@ -88,17 +108,25 @@ async def get_stats():
     """Get processing statistics"""
     return JSONResponse(
         content={
-            "events_processed": len(olap_consumer.processed_events),
+            "stream_watermarks": olap_consumer.watermarks,
             "consumer_name": olap_consumer.consumer_name,
+            "event_time": olap_consumer.event_time.stats(),
+            "query_scheduler": query_scheduler.stats(),
         }
     )
 
 
+@app.get("/resources")
+async def get_resources():
+    """Get DuckDB resource settings, memory and spill usage"""
+    return JSONResponse(content=await duckdb_client.read(duckdb_client.get_resource_usage))
+
+
 @app.get("/sales/summary")
 async def get_sales_summary(hours: int = 24):
     """Get sales summary for last N hours"""
     try:
-        results = duckdb_client.get_sales_summary(hours)
+        results = await duckdb_client.read(duckdb_client.get_sales_summary, hours)
         return JSONResponse(
             content={
                 "hours": hours,
@@ -125,7 +153,7 @@ async def get_sales_summary(hours: int = 24):
 async def get_low_stock():
     """Get items that need reordering"""
     try:
-        results = duckdb_client.get_low_stock_items()
+        results = await duckdb_client.read(duckdb_client.get_low_stock_items)
         return JSONResponse(
             content={
                 "items": [
@@ -1,11 +1,18 @@
 """Integration tests for OLAP Worker"""
 import pytest
 import json
-from datetime import datetime
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from app.consumers.event_consumer import OLAPEventConsumer
 from app.duckdb_client import DuckDBClient
+from app.sketches import HyperLogLog
 
 
 @pytest.fixture
@@ -38,6 +45,7 @@ async def test_handle_order_created(event_consumer, duckdb_test_client):
     }
 
     await event_consumer.handle_order_created(payload)
+    await event_consumer.flush()
 
     # Verify event was inserted
     result = duckdb_test_client.conn.execute(
@@ -63,6 +71,7 @@ async def test_handle_stock_reserved(event_consumer, duckdb_test_client):
     }
 
     await event_consumer.handle_stock_reserved(payload)
+    await event_consumer.flush()
 
     # Verify event was inserted
     result = duckdb_test_client.conn.execute(
@@ -90,6 +99,7 @@ async def test_handle_invoice_created(event_consumer, duckdb_test_client):
     }
 
     await event_consumer.handle_invoice_created(payload)
+    await event_consumer.flush()
 
     # Verify event was inserted
     result = duckdb_test_client.conn.execute(
@@ -111,6 +121,7 @@ async def test_sales_aggregate_update(event_consumer, duckdb_test_client):
     # Process two orders in the same hour
     await event_consumer.update_sales_aggregate(timestamp, 100.00)
     await event_consumer.update_sales_aggregate(timestamp, 50.00)
+    await event_consumer.flush()
 
     # Verify aggregate
     hour = timestamp.replace(minute=0, second=0, microsecond=0)
@@ -125,15 +136,353 @@ async def test_sales_aggregate_update(event_consumer, duckdb_test_client):
 
 
 @pytest.mark.asyncio
-async def test_idempotent_processing(event_consumer):
-    """Test that duplicate events are skipped"""
+async def test_sales_aggregate_merges_across_flushes(event_consumer, duckdb_test_client):
+    """Each flush adds its deltas and merges the customer sketch"""
+    timestamp = datetime(2025, 10, 4, 11, 15, 0)
+    customers = [str(uuid.uuid4()) for _ in range(50)]
+
+    for customer_id in customers:
+        await event_consumer.update_sales_aggregate(timestamp, 10.00, customer_id)
+    await event_consumer.flush()
+
+    # Repeat customers in a later flush must not inflate the distinct count
+    for customer_id in customers[:10]:
+        await event_consumer.update_sales_aggregate(timestamp, 20.00, customer_id)
+    await event_consumer.flush()
+
+    result = duckdb_test_client.conn.execute(
+        "SELECT total_orders, total_revenue, avg_order_value, unique_customers "
+        "FROM sales_by_hour WHERE hour = ?",
+        [timestamp.replace(minute=0)],
+    ).fetchone()
+
+    assert result[0] == 60
+    assert float(result[1]) == 700.00
+    assert float(result[2]) == pytest.approx(11.67, abs=0.01)
+    assert 48 <= result[3] <= 52
+
+
+@pytest.mark.asyncio
+async def test_late_orders_go_to_corrections(event_consumer, duckdb_test_client):
+    """Orders for hours sealed by the event-time watermark don't change those hours"""
+    from app.event_time import EventTimeWatermark
+
+    event_consumer.event_time = EventTimeWatermark(allowed_lateness_seconds=300)
+    await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 10, 5), 10.00)
+    await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 12, 30), 20.00)
+    # 10:00 is sealed by 12:30 within the same batch; 12:26 is still on time
+    await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 10, 40), 30.00)
+    await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 12, 26), 40.00)
+    await event_consumer.flush()
+    await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 11, 59), 50.00)
+    await event_consumer.flush()
+
+    conn = duckdb_test_client.conn
+    assert conn.execute("SELECT hour, total_orders FROM sales_by_hour ORDER BY hour").fetchall() == [
+        (datetime(2025, 10, 4, 10), 1), (datetime(2025, 10, 4, 12), 2),
+    ]
+    assert conn.execute("SELECT SUM(total_orders) FROM sales_by_minute").fetchone()[0] == 3
+    assert conn.execute(
+        "SELECT hour, total_orders, CAST(total_revenue AS DOUBLE) FROM sales_corrections ORDER BY hour"
+    ).fetchall() == [(datetime(2025, 10, 4, 10), 1, 30.0), (datetime(2025, 10, 4, 11), 1, 50.0)]
+    assert duckdb_test_client.get_event_time_state("sales_by_hour") == (
+        datetime(2025, 10, 4, 12, 30), datetime(2025, 10, 4, 12),
+    )
+
+    # A restarted consumer resumes from the stored watermark
+    resumed = EventTimeWatermark(allowed_lateness_seconds=300)
+    resumed.load(duckdb_test_client.get_event_time_state("sales_by_hour"))
+    assert resumed.is_late(datetime(2025, 10, 4, 11, 59))
+    assert resumed.is_sealed(datetime(2025, 10, 4, 12), ["sales_by_hour", "sales_by_day"])
+    assert not resumed.is_sealed(datetime(2025, 10, 4, 13), ["sales_by_hour"])
+    assert not resumed.is_sealed(datetime(2025, 10, 4, 12), ["order_events"])
+
+
+@pytest.mark.asyncio
+async def test_cascade_waits_for_lagging_consumer(event_consumer, duckdb_test_client):
+    """Hours are folded into days only once sealed, however far the clock is ahead"""
+    from app.event_time import EventTimeWatermark
+    from app.rollups import RollupEngine
+
+    event_consumer.event_time = EventTimeWatermark(allowed_lateness_seconds=300)
+    engine = RollupEngine(grace_seconds=300)
+    conn = duckdb_test_client.conn
+    # The consumer is a day behind the wall clock (e.g. after a backlog)
+    now = datetime(2025, 10, 5, 12)
+
+    await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 10, 5), 100.00)
+    await event_consumer.flush()
+
+    with patch("app.rollups.duckdb_client", duckdb_test_client):
+        assert engine.cascade(now=now) == {"day": 0, "month": 0}
+
+        # Still on time by event time, so it lands in sales_by_hour
+        await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 10, 40), 50.00)
+        await event_consumer.update_sales_aggregate(datetime(2025, 10, 4, 12, 30), 20.00)
+        await event_consumer.flush()
+        assert event_consumer.event_time.sealed_through == datetime(2025, 10, 4, 12)
+
+        assert engine.cascade(now=now) == {"day": 1, "month": 0}
+        assert engine.rolled_through(conn, "day") == datetime(2025, 10, 4, 12)
+
+    assert conn.execute(
+        "SELECT total_orders, CAST(total_revenue AS DOUBLE) FROM sales_by_day"
+    ).fetchall() == [(2, 150.0)]
+    assert conn.execute(
+        "SELECT total_orders, CAST(total_revenue AS DOUBLE) FROM sales_rollup_day"
+    ).fetchall() == [(3, 170.0)]
+    assert conn.execute("SELECT COUNT(*) FROM sales_corrections").fetchone()[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_rollup_cascade(event_consumer, duckdb_test_client):
+    """Closed hours fold into days and closed days into months, once each"""
+    from app.rollups import RollupEngine
+
+    engine = RollupEngine(grace_seconds=300)
+    start = datetime(2025, 1, 30, 22, 10)
+    # One order every 30 minutes for three days
+    for i in range(144):
+        await event_consumer.update_sales_aggregate(
+            start + timedelta(minutes=30 * i), 10.00, str(uuid.uuid4())
+        )
+    await event_consumer.flush()
+
+    def daily(view_or_table, column):
+        return duckdb_test_client.conn.execute(
+            f"SELECT {column}, total_orders FROM {view_or_table} ORDER BY 1"
+        ).fetchall()
+
+    expected_days = daily("sales_rollup_day", "day")
+
+    with patch("app.rollups.duckdb_client", duckdb_test_client):
+        touched = engine.cascade(now=datetime(2025, 2, 1, 12, 3))
+        assert touched == {"day": 3, "month": 1}
+
+        # Cascading again without new closed buckets is a no-op
+        assert engine.cascade(now=datetime(2025, 2, 1, 12, 3)) == {"day": 0, "month": 0}
+
+        conn = duckdb_test_client.conn
+        assert engine.rolled_through(conn, "day") == datetime(2025, 2, 1, 11)
+        assert engine.rolled_through(conn, "month") == datetime(2025, 2, 1)
+
+        # Views still cover the open tail, and agree with the raw minutes
+        assert daily("sales_rollup_day", "day") == expected_days
+        assert daily("sales_rollup_month", "month") == [
+            (datetime(2025, 1, 1), 52), (datetime(2025, 2, 1), 92),
+        ]
+        assert conn.execute("SELECT SUM(total_orders) FROM sales_by_minute").fetchone()[0] == 144
+
+        january = conn.execute(
+            "SELECT total_orders, unique_customers FROM sales_by_month WHERE month = ?",
+            [datetime(2025, 1, 1)],
+        ).fetchone()
+        assert january[0] == 52
+        assert 50 <= january[1] <= 54
+
+    assert engine.choose_level(datetime(2025, 1, 1), datetime(2025, 1, 1, 4)) == "minute"
+    assert engine.choose_level(datetime(2025, 1, 1), datetime(2025, 1, 8)) == "hour"
+    assert engine.choose_level(datetime(2025, 1, 1), datetime(2025, 12, 31)) == "day"
+    assert engine.choose_level(datetime(2020, 1, 1), datetime(2025, 1, 1)) == "month"
+
+
+def test_event_archival(duckdb_test_client, tmp_path):
+    """Closed days move to partitioned Parquet and stay queryable via the views"""
+    from app.archive import EventArchiver
+
+    archiver = EventArchiver(archive_path=str(tmp_path), hot_days=2)
+    for day in range(1, 6):
+        for _ in range(3):
+            duckdb_test_client.insert_order_event(
+                str(uuid.uuid4()), "order_created", str(uuid.uuid4()),
+                10.0, "placed", datetime(2025, 3, day, 12),
+            )
+        duckdb_test_client.insert_stock_event(
+            "stock_reserved", "SKU-ARCH", str(uuid.uuid4()), day, datetime(2025, 3, day, 12),
+        )
+
+    with patch("app.archive.duckdb_client", duckdb_test_client):
+        stock_all = duckdb_test_client.watermark("stock_events_all")
+        archived = archiver.archive(today=date(2025, 3, 5))
+        assert archived["order_events"] == 6
+        assert duckdb_test_client.watermark("stock_events_all") > stock_all
+
+        conn = duckdb_test_client.conn
+        assert conn.execute("SELECT COUNT(*) FROM order_events").fetchone()[0] == 9
+        assert (tmp_path / "order_events" / "year=2025" / "month=3" / "day=1").is_dir()
+        assert conn.execute("SELECT COUNT(*) FROM order_events_all").fetchone()[0] == 15
+        assert conn.execute(
+            "SELECT COUNT(*) FROM order_events_all WHERE year = 2025 AND month = 3 AND day = 2"
+        ).fetchone()[0] == 3
+        # Archived reservations still count towards the stock movement summary
+        assert conn.execute(
+            "SELECT total_reservations, total_qty_reserved, first_reservation "
+            "FROM stock_movement_summary WHERE sku = 'SKU-ARCH'"
+        ).fetchone() == (5, 15, datetime(2025, 3, 1, 12))
+
+        # Nothing left to archive
+        assert archiver.archive(today=date(2025, 3, 5))["order_events"] == 0
+        assert conn.execute("SELECT COUNT(*) FROM order_events_all").fetchone()[0] == 15
+
+
+@pytest.mark.asyncio
+async def test_rebuild_finalize_and_swap(tmp_path):
+    """Replayed events load via staging tables, get aggregates and replace the live file"""
+    import duckdb
+    from app.archive import EventArchiver
+    from app.rebuild import OLAPRebuilder
+
+    live_path = str(tmp_path / "olap.duckdb")
+    duckdb.connect(live_path).close()
+    client = DuckDBClient(db_path=live_path)
+
+    with patch("app.rebuild.duckdb_client", client), \
+            patch("app.rollups.duckdb_client", client), \
+            patch("app.archive.duckdb_client", client), \
+            patch("app.rebuild.event_archiver", EventArchiver(archive_path=str(tmp_path / "archive"))):
+        rebuilder = OLAPRebuilder(batch_size=10)
+        client.db_path = rebuilder.rebuild_path
+        client.connect()
+        rebuilder.create_staging_tables()
+
+        for i in range(25):
+            await rebuilder.consumer.apply_event("orders.order_created", {
+                "order_id": str(uuid.uuid4()),
+                "customer_id": str(uuid.uuid4()),
+                "total_amount": 20.0,
+                "timestamp": datetime(2025, 5, 1, 9, i).isoformat(),
+            })
+            if rebuilder.consumer.buffer.should_flush():
+                rebuilder.flush()
+        rebuilder.flush()
+
+        # Nothing reaches the indexed table or the aggregates until finalize
+        assert client.conn.execute("SELECT COUNT(*) FROM order_events").fetchone()[0] == 0
+        assert client.conn.execute("SELECT COUNT(*) FROM sales_by_hour").fetchone()[0] == 0
+
+        rebuilder.finalize()
+        client.close()
+
+        # A worker still holding the live file blocks the swap
+        worker = subprocess.Popen(
+            [sys.executable, "-c",
+             f"import duckdb, time; conn = duckdb.connect({live_path!r}); print('open', flush=True); time.sleep(60)"],
+            stdout=subprocess.PIPE, text=True,
+        )
+        try:
+            assert worker.stdout.readline().strip() == "open"
+            with pytest.raises(RuntimeError, match="in use"):
+                rebuilder.swap()
+            assert os.path.exists(rebuilder.rebuild_path)
+        finally:
+            worker.kill()
+            worker.wait()
+
+        rebuilder.swap()
+
+    conn = duckdb.connect(live_path)
+    assert conn.execute("SELECT COUNT(*) FROM order_events").fetchone()[0] == 25
+    total_orders, total_revenue, unique_customers = conn.execute(
+        "SELECT total_orders, total_revenue, unique_customers FROM sales_by_hour"
+    ).fetchone()
+    assert (total_orders, total_revenue) == (25, 500)
+    assert 24 <= unique_customers <= 26
+    assert conn.execute("SELECT SUM(total_orders) FROM sales_by_minute").fetchone()[0] == 25
+    assert conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name LIKE '%_rebuild'"
+    ).fetchone()[0] == 0
+    conn.close()
+
+
+def test_hyperloglog_estimate_and_merge():
+    """Sketch estimates distinct values and round-trips through bytes"""
+    left, right = HyperLogLog(), HyperLogLog()
+    for i in range(5000):
+        left.add(f"customer-{i}")
+    for i in range(2500, 7500):
+        right.add(f"customer-{i}")
+
+    assert abs(left.count() - 5000) < 5000 * 0.05
+
+    left.merge(HyperLogLog.from_bytes(right.to_bytes()))
+    assert abs(left.count() - 7500) < 7500 * 0.05
+
+
+@pytest.mark.asyncio
+async def test_order_value_digests_merge_across_hours(event_consumer, duckdb_test_client):
+    """Hourly t-digests are merged across flushes and answer range percentiles"""
+    from app.sketches import TDigest
+
+    start = datetime(2025, 6, 1)
+    values = []
+    for i in range(3000):
+        # Mostly small orders with a 2% tail of large B2B orders
+        amount = 10000.0 if i % 50 == 0 else float(20 + i % 80)
+        values.append(amount)
+        await event_consumer.update_sales_aggregate(start + timedelta(seconds=4.8 * i), amount)
+        if i % 700 == 0:
+            await event_consumer.flush()
+    await event_consumer.flush()
+
+    sketches = duckdb_test_client.conn.execute(
+        "SELECT order_value_sketch FROM sales_by_hour ORDER BY hour"
+    ).fetchall()
+    assert len(sketches) == 4
+
+    digest = TDigest()
+    for (sketch,) in sketches:
+        digest.merge(TDigest.from_bytes(sketch))
+    values.sort()
+    assert digest.count() == 3000
+    assert digest.quantile(0.5) == pytest.approx(values[1500], rel=0.05)
+    assert digest.quantile(0.95) == pytest.approx(values[2850], rel=0.05)
+    assert digest.quantile(0.99) == 10000.0
+    assert (digest.quantile(0), digest.quantile(1)) == (20.0, 10000.0)
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_leaves_cached_digests_untouched(event_consumer, duckdb_test_client):
+    """A batch rolled back after its hour merge is counted once when redelivered"""
+    from app.sketches import TDigest
+
+    hour = datetime(2025, 6, 2, 9)
+    await event_consumer.update_sales_aggregate(hour + timedelta(minutes=1), 10.0)
+    await event_consumer.flush()
+
+    async def deliver():
+        for minute in range(2, 6):
+            await event_consumer.update_sales_aggregate(hour + timedelta(minutes=minute), 20.0)
+
+    await deliver()
+    with patch.object(duckdb_test_client, "merge_sales_by_sku_hour", side_effect=RuntimeError("boom")):
+        with pytest.raises(RuntimeError):
+            await event_consumer.flush()
+    assert duckdb_test_client._hour_digests[hour].count() == 1
+
+    # JetStream redelivers the nak'd batch
+    await deliver()
+    await event_consumer.flush()
+
+    assert duckdb_test_client._hour_digests[hour].count() == 5
+    stored = duckdb_test_client.conn.execute(
+        "SELECT total_orders, order_value_sketch FROM sales_by_hour WHERE hour = ?", [hour]
+    ).fetchone()
+    assert stored[0] == 5
+    assert TDigest.from_bytes(stored[1]).count() == 5
+
+
+@pytest.mark.asyncio
+async def test_idempotent_processing(event_consumer, duckdb_test_client):
+    """Test that redelivered events at or below the stream watermark are skipped"""
     # Create mock message
     mock_msg = AsyncMock()
     mock_msg.subject = "orders.order_created"
+    mock_msg.metadata = MagicMock()
+    mock_msg.metadata.sequence.stream = 42
     mock_msg.data = json.dumps({
         "event_id": "evt_duplicate",
-        "order_id": "ord_999",
-        "customer_id": "cust_001",
+        "order_id": "550e8400-e29b-41d4-a716-446655440999",
+        "customer_id": "550e8400-e29b-41d4-a716-446655440001",
         "total_amount": 100.00,
         "status": "placed",
         "timestamp": "2025-10-04T10:00:00",
@@ -141,13 +490,589 @@ async def test_idempotent_processing(event_consumer):
 
     # Process first time
     await event_consumer.handle_message(mock_msg)
-    assert "evt_duplicate" in event_consumer.processed_events
+    # Redelivered before the flush: acked with the batch, not applied twice
+    await event_consumer.handle_message(mock_msg)
+    await event_consumer.flush()
+    assert event_consumer.watermarks == {"order_events": 42}
+    assert duckdb_test_client.get_stream_watermarks() == {"order_events": 42}
 
-    # Process second time (should skip)
+    # Process again after the flush (should skip)
     await event_consumer.handle_message(mock_msg)
 
-    # Verify ack was called both times
-    assert mock_msg.ack.call_count == 2
+    # Verify ack was called every time but the event was stored once
+    assert mock_msg.ack.call_count == 3
+    assert duckdb_test_client.conn.execute("SELECT COUNT(*) FROM order_events").fetchone()[0] == 1
+
+    # A restarted consumer resumes from the watermark stored in DuckDB
+    restarted = OLAPEventConsumer()
+    restarted.watermarks = duckdb_test_client.get_stream_watermarks()
+    await restarted.handle_message(mock_msg)
+    assert mock_msg.ack.call_count == 4
+    assert len(restarted.buffer) == 0
+
+
+@pytest.mark.asyncio
+async def test_batched_flush_acks_after_commit(event_consumer, duckdb_test_client):
+    """Buffered events are written in one flush and only then acked"""
+    messages = []
+    for i in range(3):
+        msg = AsyncMock()
+        msg.subject = "orders.stock_reserved"
+        msg.metadata = MagicMock()
+        msg.metadata.sequence.stream = i + 1
+        msg.data = json.dumps({
+            "event_id": f"evt_batch_{i}",
+            "order_id": f"550e8400-e29b-41d4-a716-44665544000{i}",
+            "sku": "BATCH-001",
+            "qty_reserved": i + 1,
+            "timestamp": "2025-10-04T11:00:00",
+        }).encode()
+        await event_consumer.handle_message(msg)
+        messages.append(msg)
+
+    assert len(event_consumer.buffer) == 3
+    assert all(msg.ack.call_count == 0 for msg in messages)
+
+    await event_consumer.flush()
+
+    count = duckdb_test_client.conn.execute(
+        "SELECT COUNT(*), SUM(qty_reserved) FROM stock_events WHERE sku = ?", ["BATCH-001"]
+    ).fetchone()
+    assert count == (3, 6)
+    assert len(event_consumer.buffer) == 0
+    assert all(msg.ack.call_count == 1 for msg in messages)
+
+
+@pytest.mark.asyncio
+async def test_malformed_event_is_nakd_alone(event_consumer, duckdb_test_client):
+    """A bad event is rejected on its own; a failed drain naks the batch and resets"""
+    messages = []
+    for i, qty in enumerate([2, "3", "three"]):
+        msg = AsyncMock()
+        msg.subject = "orders.stock_reserved"
+        msg.metadata = MagicMock()
+        msg.metadata.sequence.stream = i + 1
+        msg.data = json.dumps({
+            "order_id": f"550e8400-e29b-41d4-a716-44665544001{i}", "sku": "BAD-001", "qty_reserved": qty,
+            "timestamp": "2025-10-04T11:00:00",
+        }).encode()
+        await event_consumer.handle_message(msg)
+        messages.append(msg)
+
+    # "3" is coerced, "three" can't be
+    assert len(event_consumer.buffer) == 2
+    assert [msg.nak.call_count for msg in messages] == [0, 0, 1]
+
+    await event_consumer.flush()
+    assert duckdb_test_client.conn.execute(
+        "SELECT SUM(qty_reserved) FROM stock_events WHERE sku = 'BAD-001'"
+    ).fetchone() == (5,)
+    assert [msg.ack.call_count for msg in messages] == [1, 1, 0]
+
+    # A conversion failure at drain naks what was pending and leaves an empty buffer
+    msg = AsyncMock()
+    event_consumer.pending.append((msg, 10))
+    for name, column in event_consumer.buffer._columns["stock_events"].items():
+        column.append("x" if name == "qty_reserved" else None)
+    event_consumer.buffer._size += 1
+    with pytest.raises(Exception):
+        await event_consumer.flush()
+    assert msg.nak.call_count == 1
+    assert len(event_consumer.buffer) == 0
+    assert event_consumer.buffer.drain() == {}
+
+
+def test_ingest_buffer_flush_triggers():
+    """Buffer flushes on size or on latency"""
+    from app.ingest import IngestBuffer
+
+    buffer = IngestBuffer(max_events=2, max_latency_seconds=60)
+    assert not buffer.should_flush()
+
+    buffer.append("stock_events", event_type="stock_reserved", sku="A", qty_reserved=1,
+                  event_timestamp=datetime(2025, 10, 4, 10, 0, 0))
+    assert not buffer.should_flush()
+
+    buffer.append("stock_events", event_type="stock_reserved", sku="B", qty_reserved=2,
+                  event_timestamp=datetime(2025, 10, 4, 10, 0, 0))
+    assert buffer.should_flush()
+
+    batches = buffer.drain()
+    assert list(batches) == ["stock_events"]
+    assert batches["stock_events"].num_rows == 2
+    assert len(buffer) == 0
+
+    latency_buffer = IngestBuffer(max_events=100, max_latency_seconds=0.01)
+    latency_buffer.append("order_events", order_id="x", event_type="order_created",
+                          event_timestamp=datetime(2025, 10, 4, 10, 0, 0))
+    assert not latency_buffer.should_flush()
+    time.sleep(0.02)
+    assert latency_buffer.should_flush()
+
+
+@pytest.mark.asyncio
+async def test_order_lines_explode_into_sku_facts(event_consumer, duckdb_test_client):
+    """order_created items become order_line_events rows and per-SKU hourly totals"""
+    for i, items in enumerate([
+        [{"sku": "WIDGET-001", "qty": 2, "price": 10.0}, {"sku": "GADGET-9", "qty": 1, "price": 250.0}],
+        [{"id": str(uuid.uuid4()), "sku": "WIDGET-001", "qty": 3, "price": 10.0}],
+        [],
+    ]):
+        await event_consumer.handle_order_created({
+            "order_id": str(uuid.uuid4()), "customer_id": str(uuid.uuid4()), "total_amount": 0,
+            "timestamp": f"2025-10-04T10:{10 * i:02d}:00", "items": items,
+        })
+        # Totals of later flushes add onto the same SKU hour
+        await event_consumer.flush()
+
+    conn = duckdb_test_client.conn
+    assert conn.execute(
+        "SELECT sku, qty, CAST(price AS DOUBLE) FROM order_line_events ORDER BY id"
+    ).fetchall() == [("WIDGET-001", 2, 10.0), ("GADGET-9", 1, 250.0), ("WIDGET-001", 3, 10.0)]
+    assert conn.execute("""
+        SELECT hour, sku, total_qty, CAST(total_revenue AS DOUBLE), order_lines
+        FROM sales_by_sku_hour ORDER BY sku
+    """).fetchall() == [
+        (datetime(2025, 10, 4, 10), "GADGET-9", 1, 250.0, 1),
+        (datetime(2025, 10, 4, 10), "WIDGET-001", 5, 50.0, 2),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_malformed_order_lines_are_dropped(event_consumer, duckdb_test_client):
+    """Line items are coerced per line; lines that can't be are dropped, not the order"""
+    await event_consumer.handle_order_created({
+        "order_id": str(uuid.uuid4()), "customer_id": str(uuid.uuid4()), "total_amount": "28.5",
+        "timestamp": "2025-10-04T10:00:00",
+        "items": [
+            {"sku": "WIDGET-001", "qty": "3", "price": "9.5"},
+            {"sku": "GADGET-9", "qty": "three", "price": 1.0},
+            "junk",
+            {"qty": 1, "price": 1.0},
+        ],
+    })
+    await event_consumer.flush()
+
+    conn = duckdb_test_client.conn
+    assert conn.execute(
+        "SELECT sku, qty, CAST(price AS DOUBLE) FROM order_line_events"
+    ).fetchall() == [("WIDGET-001", 3, 9.5)]
+    assert conn.execute(
+        "SELECT total_orders, CAST(total_revenue AS DOUBLE) FROM sales_by_hour"
+    ).fetchall() == [(1, 28.5)]
+
+
+@pytest.mark.asyncio
+async def test_writer_thread_and_reader_cursors():
+    """Writes run on the writer thread and queries on pooled reader cursors"""
+    client = DuckDBClient(db_path=":memory:", reader_threads=2)
+    client.connect()
+    client.start()
+    try:
+        await client.write(client.upsert_stock_snapshot, "THREAD-001", "Threaded Widget", 5, 0, 10)
+
+        writer_name = await client.write(lambda: threading.current_thread().name)
+        assert writer_name == "duckdb-writer"
+
+        columns, rows = await client.query(
+            "SELECT sku, needs_reorder FROM stock_snapshot WHERE sku = ?", ["THREAD-001"]
+        )
+        assert columns == ["sku", "needs_reorder"]
+        assert rows == [("THREAD-001", True)]
+
+        low_stock = await client.read(client.get_low_stock_items)
+        assert [row[0] for row in low_stock] == ["THREAD-001"]
+    finally:
+        client.close()
+
+
+def test_resource_profile_applied_and_heavy_queries_spill(tmp_path):
+    """The resource profile is applied at connect; aggregations past the memory limit spill"""
+    spill = tmp_path / "spill"
+    client = DuckDBClient(db_path=":memory:", settings={
+        "memory_limit": "64MB",
+        "threads": 2,
+        "temp_directory": str(spill),
+        "preserve_insertion_order": False,
+    })
+    client.connect()
+    try:
+        usage = client.get_resource_usage()
+        assert usage["settings"]["threads"] == 2
+        assert usage["settings"]["temp_directory"] == str(spill)
+        assert usage["settings"]["preserve_insertion_order"] is False
+        assert usage["settings"]["memory_limit"].endswith("MiB")
+
+        # The hash table outgrows 64MB and has to spill to the temp directory
+        groups = client.conn.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT range % 2000000 AS g, MAX(range::VARCHAR) AS s
+                FROM range(4000000) GROUP BY g
+            )
+        """).fetchone()[0]
+        assert groups == 2000000
+        assert spill.exists()
+    finally:
+        client.close()
+
+
+def test_query_cache_invalidated_by_watermark(duckdb_test_client):
+    """Cached entries go stale once a table they read commits new data"""
+    from app.cache import QueryResultCache
+
+    with patch("app.cache.duckdb_client", duckdb_test_client):
+        cache = QueryResultCache(max_entries=2)
+        key = cache.key("/query/inventory/low-stock", "SELECT *\n  FROM stock_snapshot", [])
+        assert key == cache.key("/query/inventory/low-stock", "SELECT * FROM stock_snapshot", [])
+
+        cache.put(key, b"[]", cache.watermarks(["stock_snapshot"]))
+        assert cache.get(key, ["stock_snapshot"]).body == b"[]"
+
+        # Writes to other tables don't invalidate
+        duckdb_test_client.upsert_sales_by_hour(datetime(2025, 10, 4, 10), 1, 10.0)
+        assert cache.get(key, ["stock_snapshot"]) is not None
+
+        duckdb_test_client.upsert_stock_snapshot("SKU-001", "Widget", 5, 0)
+        assert cache.get(key, ["stock_snapshot"]) is None
+
+
+@pytest.mark.asyncio
+async def test_columnar_export_streams_record_batches(duckdb_test_client):
+    """Arrow IPC and Parquet exports stream one chunk per record batch"""
+    import io
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from app.export import ARROW_STREAM_MEDIA_TYPE, PARQUET_MEDIA_TYPE, encode_record_batches
+
+    sql = "SELECT range AS n FROM range(25)"
+
+    stream = await duckdb_test_client.stream(sql, batch_size=10)
+    chunks = [chunk async for chunk in encode_record_batches(stream, ARROW_STREAM_MEDIA_TYPE)]
+    assert len(chunks) > 3
+    assert pa.ipc.open_stream(b"".join(chunks)).read_all().num_rows == 25
+
+    stream = await duckdb_test_client.stream(sql, batch_size=10)
+    data = b"".join([chunk async for chunk in encode_record_batches(stream, PARQUET_MEDIA_TYPE)])
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_rows == 25
+    assert parquet.num_row_groups == 3
+
+
+@pytest.mark.asyncio
+async def test_columnar_export_limit_is_uncapped(duckdb_test_client):
+    """Streamed extracts may exceed the JSON row cap, or drop the limit entirely"""
+    import pyarrow as pa
+    from app.export import ARROW_STREAM_MEDIA_TYPE, encode_record_batches
+    from app.queries import QUERY_REGISTRY
+
+    for i in range(1200):
+        duckdb_test_client.insert_stock_event(
+            "stock_reserved", f"SKU-{i:04d}", str(uuid.uuid4()), 1, datetime(2025, 3, 1, 12),
+        )
+
+    query = QUERY_REGISTRY["stock_movement"]
+    with pytest.raises(ValueError):
+        query.bind({"limit": 5000})
+    assert query.bind({"limit": 5000}, export=True) == {"limit": 5000}
+    assert query.bind({}, export=True) == {"limit": None}
+    with pytest.raises(ValueError):
+        query.bind({"limit": 0}, export=True)
+
+    for values, expected in (({"limit": 1100}, 1100), ({}, 1200)):
+        stream = await duckdb_test_client.stream(query.sql, query.bind(values, export=True))
+        chunks = [chunk async for chunk in encode_record_batches(stream, ARROW_STREAM_MEDIA_TYPE)]
+        assert pa.ipc.open_stream(b"".join(chunks)).read_all().num_rows == expected
+
+
+@pytest.mark.asyncio
+async def test_query_scheduler_priority_rejection_and_deadline():
+    """Scans leave a slot for aggregates, a full queue rejects and deadlines interrupt"""
+    import asyncio
+    from app.scheduler import SCAN_PRIORITY, QueryRejected, QueryScheduler, QueryTimeout
+
+    client = DuckDBClient(db_path=":memory:", reader_threads=2)
+    client.connect()
+    client.start()
+    try:
+        with patch("app.scheduler.duckdb_client", client):
+            scheduler = QueryScheduler(max_concurrent=2, max_queue=1, timeout_seconds=5)
+
+            # One scan holds a slot; a second scan queues although a slot is free
+            loop = asyncio.get_running_loop()
+            await scheduler.acquire(SCAN_PRIORITY, loop.time() + 5)
+            queued_scan = asyncio.ensure_future(
+                scheduler.query("SELECT COUNT(*) FROM order_events", None, ["order_events"])
+            )
+            await asyncio.sleep(0.05)
+            assert not queued_scan.done()
+            assert scheduler.queued == 1
+
+            # ...while aggregate queries still run, and the queue is full for anyone else
+            _, rows = await scheduler.query("SELECT COUNT(*) FROM sales_by_hour", None, ["sales_by_hour"])
+            assert rows == [(0,)]
+            with pytest.raises(QueryRejected):
+                await scheduler.query("SELECT 1", None, ["stock_events"])
+
+            scheduler.release(SCAN_PRIORITY)
+            assert (await queued_scan)[1] == [(0,)]
+
+            # A query past its deadline is interrupted and the cursor stays usable
+            started = time.monotonic()
+            with pytest.raises(QueryTimeout):
+                await scheduler.query(
+                    "SELECT COUNT(*) FROM range(10000000000) a WHERE a.range % 7 = 3", timeout=0.2
+                )
+            assert time.monotonic() - started < 3
+            assert (await scheduler.query("SELECT 42"))[1] == [(42,)]
+
+            stats = scheduler.stats()
+            assert stats["running"] == 0
+            assert stats["rejected"] == 1
+            assert stats["timed_out"] == 1
+    finally:
+        client.close()
+
+
+@pytest.mark.asyncio
+async def test_query_profile_and_slow_query_log(duckdb_test_client):
+    """Profiled runs return the operator tree; slow fingerprints get profiled on their next run"""
+    from app.profiling import SlowQueryLog, fingerprint
+    from app.scheduler import QueryScheduler
+
+    def operators(nodes):
+        return [node["operator"] for node in nodes] + [
+            op for node in nodes for op in operators(node["children"])
+        ]
+
+    log = SlowQueryLog(max_entries=5, window_seconds=60, threshold_ms=0.001)
+    with patch("app.scheduler.duckdb_client", duckdb_test_client), \
+            patch("app.scheduler.slow_query_log", log):
+        scheduler = QueryScheduler(max_concurrent=1, max_queue=1, timeout_seconds=5)
+        sql = "SELECT range % 3 AS g, COUNT(*) AS n FROM range(1000) GROUP BY g ORDER BY g"
+
+        columns, rows, profile = await scheduler.profile(sql)
+        assert columns == ["g", "n"]
+        assert rows == [(0, 334), (1, 333), (2, 333)]
+        assert profile["fingerprint"] == fingerprint(sql)
+        assert "HASH_GROUP_BY" in operators(profile["plan"])
+        assert profile["plan"][0]["cardinality"] == 3
+
+        # Unprofiled slow query: timed first, profiled on the next run
+        other = "SELECT SUM(range) FROM range(1000)"
+        await scheduler.query(other)
+        assert log.wants_profile(fingerprint(other))
+        await scheduler.query(other)
+        assert not log.wants_profile(fingerprint(other))
+
+        entries = {entry["fingerprint"]: entry for entry in log.entries()}
+        assert entries[fingerprint(other)]["count"] == 2
+        assert entries[fingerprint(other)]["profile"]["plan"]
+
+
+@pytest.mark.asyncio
+async def test_predefined_queries_bind_and_reuse_prepared_statements(duckdb_test_client):
+    """Every registered query binds its typed parameters and runs as a prepared statement"""
+    from app.queries import QUERY_REGISTRY
+    from app.scheduler import QueryScheduler
+
+    duckdb_test_client.upsert_sales_by_hour(datetime.utcnow().replace(minute=0, second=0, microsecond=0), 2, 50.0)
+    duckdb_test_client.insert_stock_event("stock_reserved", "SKU-001", str(uuid.uuid4()), 3, datetime.utcnow())
+
+    daily = QUERY_REGISTRY["daily_orders"]
+    assert daily.bind({"days": "7"}) == {"days": 7, "limit": 100}
+    for bad in ({"days": 0}, {"days": "a week"}, {"weeks": 1}):
+        with pytest.raises(ValueError):
+            daily.bind(bad)
+
+    with patch("app.scheduler.duckdb_client", duckdb_test_client):
+        scheduler = QueryScheduler(max_concurrent=1, max_queue=1, timeout_seconds=5)
+        for query in QUERY_REGISTRY.values():
+            await scheduler.run(query, query.bind({"limit": 5}))
+
+        prepared = duckdb_test_client.prepared_statements()
+        assert prepared == {query.statement for query in QUERY_REGISTRY.values()}
+
+        # Reruns reuse the prepared statement with new values
+        _, rows = await scheduler.run(daily, daily.bind({"days": 2, "limit": 1}))
+        assert len(rows) == 1 and rows[0][1] == 2
+        _, rows = await scheduler.run(
+            QUERY_REGISTRY["stock_movement"], QUERY_REGISTRY["stock_movement"].bind({})
+        )
+        assert rows[0][:3] == ("SKU-001", 1, 3)
+
+
+def test_aggregate_routes_to_smallest_source(duckdb_test_client, tmp_path):
+    """Aggregate requests compile to SQL over the smallest table that answers them"""
+    import pyarrow as pa
+    from app.archive import EventArchiver
+    from app.rollups import RollupEngine
+    from app.semantic import compile_aggregate
+
+    customers = [str(uuid.uuid4()) for _ in range(3)]
+    for day in range(1, 11):
+        for customer_id in customers:
+            ts = datetime(2025, 3, day, 9, 30)
+            duckdb_test_client.insert_order_event(
+                str(uuid.uuid4()), "order_created", customer_id, 10.0, "placed", ts,
+            )
+            duckdb_test_client.upsert_sales_delta("sales_by_hour", "hour", pa.table({
+                "hour": pa.array([ts.replace(minute=0)], pa.timestamp("us")),
+                "total_orders": pa.array([1], pa.int64()),
+                "total_revenue": pa.array([10.0], pa.float64()),
+            }))
+
+    duckdb_test_client.advance_event_time_state(
+        "sales_by_hour", datetime(2025, 3, 10, 9, 30), datetime(2025, 3, 10, 9),
+    )
+
+    with patch("app.archive.duckdb_client", duckdb_test_client), \
+            patch("app.rollups.duckdb_client", duckdb_test_client):
+        EventArchiver(archive_path=str(tmp_path), hot_days=3).archive(today=date(2025, 3, 10))
+        RollupEngine(grace_seconds=1).cascade(now=datetime(2025, 3, 8))
+
+    def run(**request):
+        request = {"dimensions": [], "filters": {}, "grain": "day", "limit": 100, **request}
+        compiled = compile_aggregate(**request)
+        return compiled.source.table, duckdb_test_client.conn.execute(compiled.sql, compiled.params).fetchall()
+
+    source, rows = run(measures=["revenue", "orders"], dimensions=["time"],
+                       start=datetime(2025, 3, 1), end=datetime(2025, 4, 1), grain="month")
+    assert source == "sales_rollup_month"
+    assert rows == [(datetime(2025, 3, 1), 300.0, 30)]
+
+    # Unaligned range: day buckets, widened to whole days
+    source, rows = run(measures=["orders"], dimensions=["time"],
+                       start=datetime(2025, 3, 2, 12), end=datetime(2025, 3, 4, 1))
+    assert source == "sales_rollup_day"
+    assert [row[1] for row in rows] == [3, 3, 3]
+
+    # Unaligned range without buckets falls through to the hourly rollup
+    source, rows = run(measures=["orders"], start=datetime(2025, 3, 2, 9), end=datetime(2025, 3, 9, 10))
+    assert (source, rows) == ("sales_by_hour", [(24,)])
+
+    # Customer dimension and distinct counts need raw events, archived days included
+    source, rows = run(measures=["orders", "customers"], dimensions=["customer"],
+                       filters={"customer": customers[:1], "status": ["placed"]},
+                       start=datetime(2025, 3, 1), end=datetime(2025, 3, 11))
+    assert source == "order_events_all"
+    assert rows == [(customers[0], 10, 1)]
+
+    with pytest.raises(ValueError):
+        run(measures=["revenue", "invoices"], start=datetime(2025, 3, 1), end=datetime(2025, 3, 2))
+
+
+def test_lttb_downsampling_keeps_extremes():
+    """LTTB returns at most the threshold, keeping the endpoints and a lone spike"""
+    from app.downsample import lttb
+    from app.routers.grafana import choose_grain
+
+    points = [(float(x), 10.0) for x in range(1000)]
+    points[437] = (437.0, 500.0)
+    sampled = lttb(points, 50)
+
+    assert len(sampled) == 50
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert (437.0, 500.0) in sampled
+    assert lttb(points[:10], 50) == points[:10]
+
+    start = datetime(2025, 1, 1)
+    assert choose_grain(start, start + timedelta(days=7), timedelta(hours=1)) == "hour"
+    assert choose_grain(start, start + timedelta(days=365), timedelta(days=2)) == "day"
+    assert choose_grain(start, start + timedelta(days=365), timedelta(seconds=10)) == "hour"
+
+
+@pytest.mark.asyncio
+async def test_live_updates_coalesce_per_subscriber(event_consumer, duckdb_test_client):
+    """Flushes publish changed hours and AR deltas; a slow subscriber gets them coalesced"""
+    from app.live import LiveAggregates
+
+    live = LiveAggregates(max_pending=10)
+    subscriber = live.subscribe(["sales_by_hour", "ar"])
+    order_id, customer_id = str(uuid.uuid4()), str(uuid.uuid4())
+
+    with patch("app.consumers.event_consumer.live_aggregates", live):
+        for amount in (100.0, 50.0):
+            await event_consumer.handle_order_created({
+                "order_id": order_id, "customer_id": customer_id, "total_amount": amount,
+                "timestamp": "2025-10-04T10:30:00",
+            })
+            await event_consumer.flush()
+        for amount in (100.0, 50.0):
+            await event_consumer.handle_invoice_created({
+                "invoice_id": str(uuid.uuid4()), "order_id": order_id, "amount": amount,
+                "due_date": "2025-11-04", "timestamp": "2025-10-04T10:35:00",
+            })
+            await event_consumer.flush()
+
+    lagged, updates = subscriber.drain()
+    assert not lagged
+    assert updates == [
+        ("sales_by_hour", {
+            "hour": "2025-10-04 10:00:00", "total_orders": 2, "total_revenue": 150.0,
+            "avg_order_value": 75.0, "unique_customers": 1,
+        }),
+        ("ar", {"customer_id": customer_id, "invoices": 2, "invoiced_amount": 150.0}),
+    ]
+    assert not subscriber.ready.is_set()
+
+    # More distinct keys than a subscriber may hold: it is told to refetch
+    for hour in range(11):
+        live.publish("sales_by_hour", str(hour), {"hour": hour})
+    assert subscriber.drain() == (True, [])
+
+
+def _copy_binary(rows):
+    """Encode rows of pre-packed field bytes (None for NULL) as a binary COPY stream"""
+    import struct
+
+    out = bytearray(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+    for row in rows:
+        out += struct.pack(">h", len(row))
+        for field in row:
+            out += struct.pack(">i", -1) if field is None else struct.pack(">i", len(field)) + field
+    return bytes(out + struct.pack(">h", -1))
+
+
+def test_snapshot_sync_decodes_copy_and_merges(duckdb_test_client):
+    """Binary COPY output is decoded to Arrow and upserted with the sync marks advanced"""
+    import struct
+    from app.snapshot_sync import OLTPSnapshotSync, SNAPSHOT_SCHEMAS, decode_copy_binary
+
+    def pg_timestamp(ts):
+        return struct.pack(">q", int((ts - datetime(2000, 1, 1)).total_seconds() * 1_000_000))
+
+    customer_id = str(uuid.uuid4())
+    synced_at = datetime(2025, 3, 1, 12, 30)
+    customers = decode_copy_binary(_copy_binary([
+        [customer_id.encode(), b"Acme Ltd", None, pg_timestamp(synced_at)],
+    ]), SNAPSHOT_SCHEMAS["customers"])
+    stock = decode_copy_binary(_copy_binary([
+        [b"WIDGET-001", b"Blue Widget", *(struct.pack(">i", n) for n in (5, 1, 4, 10)),
+         b"\x01", pg_timestamp(synced_at)],
+    ]), SNAPSHOT_SCHEMAS["stock_snapshot"])
+    assert customers.to_pylist() == [
+        {"id": customer_id, "name": "Acme Ltd", "email": None, "updated_at": synced_at},
+    ]
+
+    conn = duckdb_test_client.conn
+    duckdb_test_client.upsert_stock_snapshot("WIDGET-001", "Widget", 100, 0, 10)
+    conn.execute("INSERT INTO ar_aging (customer_id, customer_name) VALUES (?, 'unknown')", [customer_id])
+
+    with patch("app.snapshot_sync.duckdb_client", duckdb_test_client):
+        transitions = OLTPSnapshotSync().merge({
+            "customers": customers,
+            "products": SNAPSHOT_SCHEMAS["products"].empty_table(),
+            "stock_snapshot": stock,
+        })
+
+    assert conn.execute(
+        "SELECT product_name, qty_on_hand, available_qty, needs_reorder FROM stock_snapshot"
+    ).fetchall() == [("Blue Widget", 5, 4, True)]
+    assert transitions == [("WIDGET-001", "Blue Widget", 4, 10, True)]
+    assert conn.execute("SELECT customer_name FROM ar_aging").fetchone()[0] == "Acme Ltd"
+    assert duckdb_test_client.get_snapshot_sync_state() == {
+        "customers": synced_at, "stock_snapshot": synced_at,
+    }
 
 
 def test_duckdb_schema_initialization(duckdb_test_client):
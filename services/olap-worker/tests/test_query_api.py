@@ -92,6 +92,17 @@ def test_get_stock_movement(test_client):
     assert "items" in data
 
 
+def test_query_cache_etag(test_client):
+    """Unchanged results keep their ETag and revalidate with 304"""
+    first = test_client.get("/query/inventory/low-stock")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    second = test_client.get("/query/inventory/low-stock", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+
+
 def test_list_available_queries(test_client):
     """Test available queries endpoint"""
     response = test_client.get("/query/available")